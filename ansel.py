@@ -0,0 +1,52 @@
+#
+# ANSEL (ANSI Z39.47), the character set of older GEDCOM files
+#
+# ASCII, plus some extra letters and symbols in 0xA1-0xCF, and combining
+# diacritics in 0xE0-0xFE.  Unlike Unicode, a diacritic comes *before* the
+# letter it goes on, so decoding moves each one after its letter and then
+# composes them where Unicode has a single character (e followed by a
+# combining acute accent becomes the single character e-acute).
+#
+
+import unicodedata
+
+# Spacing characters, including the GEDCOM additions (0xBE, 0xBF, 0xC7, 0xC8, 0xCF)
+_CHARACTERS = {
+    0xA1: u'\u0141', 0xA2: u'\u00D8', 0xA3: u'\u0110', 0xA4: u'\u00DE', 0xA5: u'\u00C6',
+    0xA6: u'\u0152', 0xA7: u'\u02B9', 0xA8: u'\u00B7', 0xA9: u'\u266D', 0xAA: u'\u00AE',
+    0xAB: u'\u00B1', 0xAC: u'\u01A0', 0xAD: u'\u01AF', 0xAE: u'\u02BC', 0xB0: u'\u02BB',
+    0xB1: u'\u0142', 0xB2: u'\u00F8', 0xB3: u'\u0111', 0xB4: u'\u00FE', 0xB5: u'\u00E6',
+    0xB6: u'\u0153', 0xB7: u'\u02BA', 0xB8: u'\u0131', 0xB9: u'\u00A3', 0xBA: u'\u00F0',
+    0xBC: u'\u01A1', 0xBD: u'\u01B0', 0xBE: u'\u25A1', 0xBF: u'\u25A0', 0xC0: u'\u00B0',
+    0xC1: u'\u2113', 0xC2: u'\u2117', 0xC3: u'\u00A9', 0xC4: u'\u266F', 0xC5: u'\u00BF',
+    0xC6: u'\u00A1', 0xC7: u'\u00DF', 0xC8: u'\u20AC', 0xCF: u'\u00DF',
+}
+
+# Combining diacritics, written before the letter they belong to
+_COMBINING = {
+    0xE0: u'\u0309', 0xE1: u'\u0300', 0xE2: u'\u0301', 0xE3: u'\u0302', 0xE4: u'\u0303',
+    0xE5: u'\u0304', 0xE6: u'\u0306', 0xE7: u'\u0307', 0xE8: u'\u0308', 0xE9: u'\u030C',
+    0xEA: u'\u030A', 0xEB: u'\uFE20', 0xEC: u'\uFE21', 0xED: u'\u0315', 0xEE: u'\u030B',
+    0xEF: u'\u0310', 0xF0: u'\u0327', 0xF1: u'\u0328', 0xF2: u'\u0323', 0xF3: u'\u0324',
+    0xF4: u'\u0325', 0xF5: u'\u0333', 0xF6: u'\u0332', 0xF7: u'\u0326', 0xF8: u'\u031C',
+    0xF9: u'\u032E', 0xFA: u'\uFE22', 0xFB: u'\uFE23', 0xFE: u'\u0313',
+}
+
+
+def decode(data):
+    """ Decode a byte string of ANSEL to unicode; unknown bytes become U+FFFD """
+    decoded = []
+    pending = []
+    for byte in bytearray(data):
+        if byte in _COMBINING:
+            pending.append(_COMBINING[byte])
+            continue
+        if byte < 0x80:
+            decoded.append(unichr(byte))
+        else:
+            decoded.append(_CHARACTERS.get(byte, u'\uFFFD'))
+        decoded.extend(pending)
+        pending = []
+    # Diacritics with nothing after them to go on
+    decoded.extend(pending)
+    return unicodedata.normalize('NFC', u''.join(decoded))
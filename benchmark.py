@@ -0,0 +1,175 @@
+#
+# Benchmarks
+#
+# Times the expensive parts of making fingerprints against synthetic trees of
+# several sizes, and writes the results as JSON so runs on different commits
+# can be compared:
+#
+#   python benchmark.py --sizes 1000,10000 --output before.json
+#   ... change things ...
+#   python benchmark.py --sizes 1000,10000 --output after.json
+#
+# Each benchmark is run --repeat times and the fastest and median times are
+# reported, along with how much work was done (lines parsed, people matched...)
+# so that rates can be worked out.
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from StringIO import StringIO
+from timeit import default_timer
+
+import main
+import synthetic
+from gedcom import Gedcom
+from trees import Tree
+
+# How many fingerprints to build and render in the per-person benchmarks
+SAMPLE = 50
+
+# The name searched for.  The synthetic trees are full of Wises, Wyses and Wieses.
+CRITERIA = "surname=Wise"
+FUZZY_CRITERIA = "surnamephon=Wise"
+
+
+def run(sizes, repeat, seed, directory):
+    """ Run every benchmark on a synthetic tree of each size, returning a list of results """
+    results = []
+    for size in sizes:
+        filepath = os.path.join(directory, "synthetic-{}-{}.ged".format(size, seed))
+        with open(filepath, 'w') as out:
+            synthetic.generate(size, out, seed)
+        with open(filepath) as ged:
+            lines = sum(1 for line in ged)
+
+        def record(name, seconds, **counts):
+            result = {
+                'benchmark': name,
+                'individuals': size,
+                'best': min(seconds),
+                'median': sorted(seconds)[len(seconds) // 2],
+                'runs': seconds
+            }
+            result.update(counts)
+            results.append(result)
+            sys.stderr.write("{:>9} {:<24} {:10.4f}s\n".format(size, name, result['best']))
+
+        seconds, gedcom = _time(repeat, lambda: Gedcom(filepath))
+        record('parse', seconds, lines=lines, lines_per_second=lines / min(seconds))
+
+        seconds, tree = _time(repeat, lambda: Tree(filepath))
+        record('parse_and_index', seconds, lines=lines)
+
+        elements = gedcom.element_list()
+        seconds, matches = _time(repeat, lambda: [e for e in elements if e.criteria_match(CRITERIA)])
+        record('criteria_match_scan', seconds, elements=len(elements), matches=len(matches))
+
+        seconds, selected = _time(repeat, lambda: tree.select(CRITERIA))
+        record('select', seconds, matches=len(selected))
+
+        seconds, fuzzy = _time(repeat, lambda: tree.select(FUZZY_CRITERIA))
+        record('select_phonetic', seconds, matches=len(fuzzy))
+
+        sample = matches[:SAMPLE]
+        with main.app.test_request_context('/fingerprint?state=False&gedFile={}'.format(filepath)):
+            seconds, data = _time(repeat, lambda: [main.fingerprint_data(gedcom, e, 0) for e in sample])
+            record('fingerprint_data', seconds, people=len(sample))
+
+            seconds, html = _time(repeat, lambda: [main.table_fingerprint(d) for d in data])
+            record('table_fingerprint', seconds, people=len(sample))
+
+            seconds, text = _time(repeat, lambda: _printed(data))
+            record('print_fingerprint', seconds, people=len(sample), characters=len(text))
+
+        # The youngest people have the most ancestors
+        youngest = tree.individuals()[-SAMPLE:]
+        seconds, ancestors = _time(repeat, lambda: [gedcom.get_ancestors(e) for e in youngest])
+        record('get_ancestors', seconds, people=len(youngest), ancestors=sum(len(a) for a in ancestors))
+
+        seconds, households = _time(repeat, lambda: tree.households().match(1900, 40, 38, [12, 9, 4]))
+        record('household_match', seconds, families=len(households))
+
+        # The whole web request, with the tree already parsed and cached
+        main.tree_cache.get(filepath)
+        client = main.app.test_client()
+        url = "/fingerprint?first=&middle=&last=Wise&state=False&gedFile={}".format(filepath)
+        seconds, response = _time(repeat, lambda: client.get(url))
+        record('endpoint_fingerprint', seconds, status=response.status_code, bytes=len(response.data))
+
+    return results
+
+
+def _time(repeat, function):
+    """ Call function repeat times, returning the list of timings and the last result """
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        started = default_timer()
+        result = function()
+        seconds.append(default_timer() - started)
+    return (seconds, result)
+
+
+def _printed(fingerprints):
+    """ Return what print_fingerprint prints for each of the fingerprints """
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        for fingerprint in fingerprints:
+            main.print_fingerprint(fingerprint)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+def _commit():
+    """ Return the current git commit, if there is one """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=main.basedir,
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark fingerprinting on synthetic GEDcom files")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma separated numbers of individuals to test with, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="How many times to run each benchmark")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic trees")
+    parser.add_argument("--output", help="File to write the JSON results to, instead of standard output")
+    parser.add_argument("--keep", help="Directory to write the synthetic GED files to, and keep them")
+
+    args = parser.parse_args()
+
+    directory = args.keep or tempfile.mkdtemp(prefix="fingerprint-bench-")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        results = run([int(size) for size in args.sizes.split(',')], args.repeat, args.seed, directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
+
+    report = {
+        'commit': _commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print
@@ -0,0 +1,255 @@
+#
+# Census snapshots: everybody alive in a census year
+#
+# A fingerprint looks at one family across the years; a snapshot looks at the
+# whole tree in one year, which is how a census return itself is laid out.
+#
+# LifespanIndex keeps the birth and final year of everyone as two arrays of
+# integers, with the positions of the people sorted by birth year.  Finding
+# who was alive in a year is then a binary search for those born by then,
+# and a scan down one array for those not yet dead; nobody's dates are parsed
+# again.  The details of each person (their household and where they lived)
+# are only looked up for the rows actually written out.
+#
+# Not every census was every ten years.  A schedule is the years of one kind
+# of census: the federal census (every year ending in 0), the state census
+# (every year ending in 5), the censuses a particular state actually took, the
+# UK census, or any list of years.  Columns lays the years of several
+# schedules side by side for a chart.
+#
+
+import re
+import math
+import bisect
+from array import array
+from datetime import date
+import dates
+
+# A person with no death date is assumed to have lived this long
+DEFAULT_LIFESPAN = 100
+
+# Someone married with no date is taken to have left their parents' household by this age
+MARRIAGE_AGE = 21
+
+# Marks a missing year in the arrays
+UNKNOWN = -1
+
+# Schedules taken every ten years: name -> (title, offset of the year from a decade)
+REGULAR = {
+    'federal': ("Federal", 0),
+    'state': ("State", 5)
+}
+
+# Schedules of particular years: name -> (title, years)
+SCHEDULES = {
+    'uk': ("UK", range(1841, 1922, 10)),
+    'ny': ("New York", [1825, 1835, 1845, 1855, 1865, 1875, 1892, 1905, 1915, 1925]),
+    'nj': ("New Jersey", [1855, 1865, 1875, 1885, 1895, 1905, 1915]),
+    'ks': ("Kansas", [1865, 1875, 1885, 1895, 1905, 1915, 1925]),
+    'ia': ("Iowa", [1856, 1885, 1895, 1905, 1915, 1925]),
+    'mn': ("Minnesota", [1857, 1865, 1875, 1885, 1895, 1905])
+}
+
+_YEAR_LIST = re.compile(r'^\d{4}([ ,]+\d{4})*$')
+
+
+def census_year(year, offset=0):
+    """ Return the census year on or before year: offset 0 for the federal census
+    (1900, 1910, ...), 5 for the state census (1895, 1905, ...)
+    """
+    return year - (year - offset) % 10
+
+
+def final_year(birth, death):
+    """ The last year someone was alive: the year of their death if known, otherwise
+    this year, but no more than DEFAULT_LIFESPAN after their birth
+    """
+    if death >= 0:
+        return death
+    final = date.today().year
+    if final - birth > DEFAULT_LIFESPAN:
+        final = birth + DEFAULT_LIFESPAN
+    return final
+
+
+def schedule(spec, earliest, latest):
+    """ Return (title, years) of a schedule, for a chart of people born from earliest
+    to finally latest
+
+    spec is a schedule name (see REGULAR and SCHEDULES) or a list of years, such
+    as "1882, 1887".  The ten-yearly schedules cover the decades around the
+    people; the others only the years of the schedule that they span.
+    Raises ValueError for anything else.
+    """
+    spec = spec.strip()
+    if spec.lower() in REGULAR:
+        (title, offset) = REGULAR[spec.lower()]
+        # Snap the raw date range into the census grid
+        first = int(math.floor(earliest / 10) * 10) - offset
+        last = int(math.ceil(float(latest) / 10) * 10) - offset
+        return (title, range(first, last + 1, 10))
+    if spec.lower() in SCHEDULES:
+        (title, years) = SCHEDULES[spec.lower()]
+    elif _YEAR_LIST.match(spec):
+        title = "Census"
+        years = sorted(set([int(year) for year in re.split(r'[ ,]+', spec)]))
+    else:
+        raise ValueError("Unknown census schedule {}".format(spec))
+    return (title, [year for year in years if earliest <= year <= latest])
+
+
+class Columns:
+    """ The census years of a chart: one or more schedules, side by side
+
+    Each different year is only in years() once, however many schedules have
+    it, so a row works out its age in each year once and then each schedule
+    picks out its own from that (by the indexes in blocks()).
+    """
+
+    def __init__(self, schedules):
+        """ schedules is a list of (title, years), as from schedule() """
+        self.__years = sorted(set([year for (title, years) in schedules for year in years]))
+        index = dict((year, number) for (number, year) in enumerate(self.__years))
+        self.__blocks = [(title, years, [index[year] for year in years]) for (title, years) in schedules]
+
+    def years(self):
+        """ Return every year in any of the schedules, in order """
+        return self.__years
+
+    def blocks(self):
+        """ Return (title, years, indexes of the years in years()) for each schedule """
+        return self.__blocks
+
+    def count(self):
+        """ Return the number of columns, counting a year once for each schedule it's in """
+        return sum([len(years) for (title, years, indexes) in self.__blocks])
+
+
+class LifespanIndex:
+    """ Birth and final years of a list of individuals, for finding who was alive when
+
+    Lookups return the positions of the individuals in the list.
+    """
+
+    def __init__(self, individuals):
+        self.__births = array('i')
+        self.__finals = array('i')
+        for individual in individuals:
+            birth = individual.birth_year()
+            if birth < 0:
+                self.__births.append(UNKNOWN)
+                self.__finals.append(UNKNOWN)
+            else:
+                self.__births.append(birth)
+                self.__finals.append(final_year(birth, individual.death_year()))
+        # Positions of the people with a known birth year, and their birth years, by birth year
+        known = sorted([position for position in range(len(self.__births)) if self.__births[position] != UNKNOWN],
+                       key=self.__births.__getitem__)
+        self.__by_birth = array('i', known)
+        self.__sorted_births = array('i', [self.__births[position] for position in known])
+
+    def alive(self, year):
+        """ Return the positions of everyone alive in a year, by birth year """
+        finals = self.__finals
+        born = bisect.bisect_right(self.__sorted_births, year)
+        return [position for position in self.__by_birth[:born] if finals[position] >= year]
+
+    def birth(self, position):
+        """ Return the birth year of the person at a position, or None """
+        birth = self.__births[position]
+        return birth if birth != UNKNOWN else None
+
+    def final(self, position):
+        """ Return the final year of the person at a position, or None """
+        final = self.__finals[position]
+        return final if final != UNKNOWN else None
+
+
+def snapshot(tree, year):
+    """ Yield a row for everybody in a tree alive in a year, oldest first, each a dict with:
+        pointer     - of the person
+        name        - their full name
+        birth       - their birth year
+        age         - their age in the year
+        household   - pointer of the family they were living in, or None
+        role        - 'spouse' or 'child' in that family
+        residence   - the last place they were known to live, by that year, or None
+    """
+    gedcom = tree.gedcom()
+    individuals = tree.individuals()
+    lifespans = tree.lifespans()
+    for position in lifespans.alive(year):
+        person = individuals[position]
+        age = year - lifespans.birth(position)
+        (household, role) = _household(gedcom, person, year, age)
+        yield {
+            'pointer': person.pointer(),
+            'name': " ".join(person.name()),
+            'birth': lifespans.birth(position),
+            'age': age,
+            'household': household.pointer() if household is not None else None,
+            'role': role,
+            'residence': _residence(person, year)
+        }
+
+
+def table_lines(rows):
+    """ Yield a header line, then a line of text for each snapshot row """
+    yield "{:>4}  {:<10} {:<32} {:<10} {:<7} {}\n".format("AGE", "POINTER", "NAME", "HOUSEHOLD", "AS", "RESIDENCE")
+    for row in rows:
+        yield "{:>4}  {:<10} {:<32} {:<10} {:<7} {}\n".format(
+            row['age'], row['pointer'], row['name'], row['household'] or '', row['role'] or '', row['residence'] or '')
+
+
+def _household(gedcom, person, year, age):
+    """ Return (family, role) for the household someone was in during a year
+
+    That's the latest family they had married into by then, going by the
+    marriage date or the birth of the first child, or if there's no date,
+    once they were MARRIAGE_AGE.  Otherwise it's the family they were born into.
+    """
+    best = None
+    best_start = None
+    for family in gedcom.families(person, "FAMS"):
+        start = _family_start(gedcom, family)
+        if start is None:
+            if age < MARRIAGE_AGE:
+                continue
+            start = year
+        if start <= year and (best is None or start > best_start):
+            best = family
+            best_start = start
+    if best is not None:
+        return (best, 'spouse')
+    families = gedcom.families(person, "FAMC")
+    if families:
+        return (families[0], 'child')
+    return (None, None)
+
+
+def _family_start(gedcom, family):
+    """ The year a family began: the marriage, or if that isn't known, the first child's birth """
+    for event in family.children():
+        if event.tag() == "MARR":
+            for detail in event.children():
+                if detail.tag() == "DATE":
+                    year = dates.year(dates.parse(detail.value()))
+                    if year is not None:
+                        return year
+    births = [child.birth_year() for child in gedcom.get_family_members(family, "CHIL")]
+    births = [birth for birth in births if birth >= 0]
+    return min(births) if births else None
+
+
+def _residence(person, year):
+    """ The place of the latest residence or census entry of someone, on or before a year """
+    best = None
+    best_year = None
+    for (when, where, source) in person.residences() + person.census():
+        if not where:
+            continue
+        when = dates.year(dates.parse(when))
+        if when is not None and when <= year and (best is None or when >= best_year):
+            best = where
+            best_year = when
+    return best
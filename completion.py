@@ -0,0 +1,130 @@
+#
+# Name completion as you type
+#
+# CompletionIndex files every word of everyone's given names and surnames in
+# a prefix trie, one letter per node.  When the trie is built, each node is
+# given the best TOP_COMPLETIONS words below it (those the most people have),
+# worked out once from the bottom up, so completing a prefix is a walk down
+# one letter at a time and reading off the list at the node reached: a few
+# dictionary lookups, however many people share the prefix.
+#
+# Names are read in as UTF-8 but typed in as unicode, so both are folded the
+# same way (see fold()) before they go in the trie or look it up, one letter
+# (not one byte) per node.
+#
+
+import re
+import unicodedata
+
+# How many completions each node of the trie keeps
+TOP_COMPLETIONS = 10
+
+_NOT_ASCII = re.compile(u"[^\x00-\x7f]")
+
+
+def fold(word):
+    """ Return a word (UTF-8 or unicode) as it is filed in a trie: lower case, and unicode
+    unless it is plain ASCII
+    """
+    if not _NOT_ASCII.search(word):
+        # Most names, so kept quick; plain ASCII compares and hashes the same either way
+        return word.lower()
+    if not isinstance(word, unicode):
+        word = word.decode('utf-8', 'replace')
+    return unicodedata.normalize('NFC', word).lower()
+
+
+class TrieNode(object):
+    """ One letter of a name, with the best completions of the letters down to it """
+
+    __slots__ = ('children', 'word', 'top')
+
+    def __init__(self):
+        self.children = {}
+        # The whole word, if a word ends here
+        self.word = None
+        # The best words starting with the letters down to here, most people first
+        self.top = ()
+
+
+class NameTrie:
+    """ Prefix trie of one kind of name word """
+
+    def __init__(self):
+        self.__root = TrieNode()
+        # Word, folded -> [word as first written, positions of the people with it]
+        self.__words = {}
+
+    def add(self, word, position):
+        """ File a word of the name of the person at a position """
+        key = fold(word)
+        entry = self.__words.get(key)
+        if entry is None:
+            entry = [word, []]
+            self.__words[key] = entry
+            node = self.__root
+            for letter in key:
+                child = node.children.get(letter)
+                if child is None:
+                    child = TrieNode()
+                    node.children[letter] = child
+                node = child
+            node.word = key
+        entry[1].append(position)
+
+    def finish(self):
+        """ Work out the best completions at every node, once all the words are added """
+        words = self.__words
+        rank = lambda word: (-len(words[word][1]), word)
+        # Parents come before their children, so going backwards sees children first
+        nodes = [self.__root]
+        for node in nodes:
+            nodes.extend(node.children.values())
+        for node in reversed(nodes):
+            candidates = [word for child in node.children.values() for word in child.top]
+            if node.word is not None:
+                candidates.append(node.word)
+            node.top = tuple(sorted(candidates, key=rank)[:TOP_COMPLETIONS])
+
+    def complete(self, prefix, limit=TOP_COMPLETIONS):
+        """ Return up to limit (word, positions) of the words starting with prefix, most people first """
+        node = self.__root
+        for letter in fold(prefix):
+            node = node.children.get(letter)
+            if node is None:
+                return []
+        return [tuple(self.__words[word]) for word in node.top[:limit]]
+
+
+class CompletionIndex:
+    """ Tries of the given name and surname words of a list of individuals
+
+    Completions give the positions of the people in that list.
+    """
+
+    def __init__(self, individuals):
+        self.__given = NameTrie()
+        self.__surnames = NameTrie()
+        for position, individual in enumerate(individuals):
+            # Folded -> as written, so each person is filed once under a word
+            given = {}
+            surnames = {}
+            for (first, last) in individual.names():
+                for word in first.split():
+                    given.setdefault(fold(word), word)
+                for word in last.split():
+                    surnames.setdefault(fold(word), word)
+            for word in given.values():
+                self.__given.add(word, position)
+            for word in surnames.values():
+                self.__surnames.add(word, position)
+        self.__given.finish()
+        self.__surnames.finish()
+
+    def given(self, prefix, limit=TOP_COMPLETIONS):
+        """ Return up to limit (given name, positions) starting with prefix, most people first """
+        return self.__given.complete(prefix, limit)
+
+    def surname(self, prefix, limit=TOP_COMPLETIONS):
+        """ Return up to limit (surname, positions) starting with prefix, most people first """
+        return self.__surnames.complete(prefix, limit)
@@ -0,0 +1,216 @@
+#
+# GEDCOM date phrases
+#
+# Dates in a GED file are only loosely structured text: "3 July 1877", "ABT 1850",
+# "BEF 1910", "BET 1850 AND 1855", "FROM 1917 TO 1918", "1917-1918",
+# "12 FEB 1750/51", "JUL 1877" and so on.
+#
+# parse() turns a date phrase into a span: a tuple (earliest, latest) of day
+# numbers, where a day number is the proleptic Gregorian ordinal of
+# date.toordinal().  Sorting, ages and year comparisons can then all work on
+# plain integers.  Each distinct phrase is parsed only once; after that it is a
+# dictionary lookup, and equal spans share one tuple.
+#
+
+import re
+import calendar
+from datetime import date
+
+# Open ends of a span, as in "BEF 1900" or "AFT 1900"
+MIN_DAY = 0
+MAX_DAY = date.max.toordinal() + 1
+
+MONTHS = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12
+}
+
+# Words that make a date approximate.  The span is the same as the bare date.
+APPROXIMATE = set(['ABT', 'ABOUT', 'CAL', 'EST', 'CIRCA', 'C', 'CA', 'INT'])
+BEFORE = set(['BEF', 'BEFORE'])
+AFTER = set(['AFT', 'AFTER'])
+RANGE_START = set(['BET', 'BETWEEN', 'FROM'])
+RANGE_END = set(['AND', 'TO'])
+
+# Calendar escapes such as @#DJULIAN@, and the free text of "INT 1850 (about then)"
+_NOISE_RE = re.compile(r'@#D[^@]*@|\([^)]*\)')
+# 1877-07-03
+_ISO_RE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+# 1917-1918, 3 JUL 1877 - 1880
+_DASH_RE = re.compile(r'(\d)\s*-\s*(\d)')
+
+# Cache of parsed phrases, and of the spans themselves, so equal spans are shared
+_phrases = {}
+_spans = {}
+
+
+def parse(phrase):
+    """ Return the (earliest, latest) day span of a date phrase, or None if it has no date """
+    try:
+        return _phrases[phrase]
+    except KeyError:
+        pass
+    span = _parse(phrase)
+    if span is not None:
+        span = _spans.setdefault(span, span)
+    _phrases[phrase] = span
+    return span
+
+
+def clear_cache():
+    """ Forget all of the parsed phrases """
+    _phrases.clear()
+    _spans.clear()
+
+
+def year(span):
+    """ Return the single year that best describes a span, or None
+
+    That is the year of the earliest day, unless the span is open at the start
+    ("BEF 1900"), when it is the year of the latest day.
+    """
+    if span is None:
+        return None
+    if span[0] != MIN_DAY:
+        return day_year(span[0])
+    if span[1] != MAX_DAY:
+        return day_year(span[1])
+    return None
+
+
+def first_year(span):
+    """ Return the year of the earliest day of a span, or None if it is open """
+    if span is None or span[0] == MIN_DAY:
+        return None
+    return day_year(span[0])
+
+
+def last_year(span):
+    """ Return the year of the latest day of a span, or None if it is open """
+    if span is None or span[1] == MAX_DAY:
+        return None
+    return day_year(span[1])
+
+
+def day_year(day):
+    """ Return the year of a day number """
+    return date.fromordinal(day).year
+
+
+def year_start(year):
+    """ Return the day number of the first of January of a year """
+    return date(year, 1, 1).toordinal()
+
+
+def year_end(year):
+    """ Return the day number of the last of December of a year """
+    return date(year, 12, 31).toordinal()
+
+
+def sort_key(span):
+    """ Key for sorting spans chronologically; unknown dates sort first """
+    if span is None:
+        return (MIN_DAY - 1, MIN_DAY - 1)
+    return span
+
+
+def overlaps(span, first, last):
+    """ Check if a span shares any day with the years first to last, inclusive """
+    if span is None:
+        return False
+    return span[0] <= year_end(last) and span[1] >= year_start(first)
+
+
+# Private functions
+
+def _parse(phrase):
+    """ Parse a date phrase, without any caching """
+    text = _NOISE_RE.sub(' ', phrase.upper())
+    text = _ISO_RE.sub(lambda m: '{} {} {}'.format(m.group(3), _month_name(m.group(2)), m.group(1)), text)
+    text = _DASH_RE.sub(r'\1 TO \2', text)
+    words = [word.strip('.') for word in text.replace(',', ' ').split()]
+    words = [word for word in words if word and word not in APPROXIMATE]
+    if not words:
+        return None
+
+    head = words[0]
+    if head in BEFORE:
+        span = _simple(words[1:])
+        return span and (MIN_DAY, span[1])
+    if head in AFTER:
+        span = _simple(words[1:])
+        return span and (span[0], MAX_DAY)
+    if head in RANGE_START:
+        words = words[1:]
+    elif head in RANGE_END:
+        span = _simple(words[1:])
+        return span and (MIN_DAY, span[1])
+
+    for idx, word in enumerate(words):
+        if word in RANGE_END:
+            start = _simple(words[:idx])
+            end = _simple(words[idx+1:])
+            if start is None:
+                return end and (MIN_DAY, end[1])
+            if end is None:
+                return (start[0], MAX_DAY)
+            return (min(start[0], end[0]), max(start[1], end[1]))
+
+    span = _simple(words)
+    if span is not None and head == 'FROM':
+        # FROM with no TO: still going
+        return (span[0], MAX_DAY)
+    return span
+
+
+def _simple(words):
+    """ Parse a single date, made of an optional day and month and a year """
+    day = None
+    month = None
+    numbers = []
+    for word in words:
+        if word in ('BC', 'B.C', 'BCE'):
+            return None
+        if word[:3] in MONTHS and word.isalpha():
+            month = MONTHS[word[:3]]
+        elif word[0].isdigit():
+            numbers.append(word)
+    if not numbers:
+        return None
+
+    year = _year(numbers[-1])
+    if len(numbers) > 1 and numbers[0].isdigit() and int(numbers[0]) <= 31:
+        day = int(numbers[0])
+    if year is None or year < 1 or year > 9999:
+        return None
+
+    if month is None:
+        return (date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal())
+    days = calendar.monthrange(year, month)[1]
+    if day is None or day < 1:
+        return (date(year, month, 1).toordinal(), date(year, month, days).toordinal())
+    day = date(year, month, min(day, days)).toordinal()
+    return (day, day)
+
+
+def _year(word):
+    """ Return the year of a word such as 1877, or the later year of a dual year such as 1750/51 """
+    if '/' in word:
+        base, _, later = word.partition('/')
+        if not (base.isdigit() and later.isdigit()) or len(later) > len(base):
+            return None
+        year = int(base[:len(base)-len(later)] + later)
+        if year <= int(base):
+            year += 10 ** len(later)
+        return year
+    if word.isdigit():
+        return int(word)
+    return None
+
+
+def _month_name(month):
+    """ Return the GEDCOM month abbreviation for a month number string, or '' """
+    for name, number in MONTHS.items():
+        if number == int(month):
+            return name
+    return ''
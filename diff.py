@@ -0,0 +1,281 @@
+#
+# What changed between two versions of a GED file
+#
+# Every record (level 0 line with a pointer) is summed up in one pass over
+# each file: a hash of its whole subtree, with the lines under each line put
+# in order so that a program writing them in a different order doesn't count
+# as a change, and CHAN (last changed) lines left out.  A second hash leaves
+# out the pointers too, so it stays the same when a program renumbers the
+# records.
+#
+# The records of the two files are then paired up, each step only looking at
+# what the steps before it left over:
+#
+#   1. the same pointer and the same hash: unchanged
+#   2. the same hash without pointers (only one of those on each side): renumbered
+#   3. people with the same name and birth date (only one on each side)
+#   4. records pointing to the same records, going by the pairs so far (a
+#      renamed person in the same families, a family with the same people)
+#   5. the same pointer
+#
+# and whatever is left was added or removed.  Each step is a dictionary
+# lookup per record, so the whole thing takes time and memory in line with
+# the size of the files.  For the people and families that changed, the lines
+# of the two versions are compared field by field (BIRT.DATE, RESI.PLAC, ...),
+# with the pointers of the old file translated to the new, so that
+# renumbering alone doesn't show up as a change.
+#
+
+import hashlib
+from gedcom import Gedcom
+
+# Lines that say when a record was changed, not what it says
+IGNORED_TAGS = ("CHAN",)
+
+# The kinds of records reported on
+KINDS = {'INDI': 'individual', 'FAM': 'family'}
+
+
+def compare(old_path, new_path):
+    """ Compare two GED files, returning a dict with keys:
+        added       - (kind, pointer, description) of each record only in the new file
+        removed     - (kind, pointer, description) of each record only in the old file
+        modified    - (kind, old pointer, new pointer, description, changes) of each
+                      record that changed, where changes is a list of (field, old
+                      value, new value), with None for a value that isn't there
+        renumbered  - how many records are the same but under a different pointer
+        unchanged   - how many records are the same
+        other       - how many other records (sources, notes, ...) were added,
+                      removed or changed
+    kind is 'individual' or 'family'.
+    """
+    old = Gedcom(old_path)
+    new = Gedcom(new_path)
+    old_records = _summaries(old)
+    new_records = _summaries(new)
+
+    # Pointer in the old file -> pointer in the new, for the records paired up so far
+    pairs = {}
+
+    # 1. Nothing changed
+    for (pointer, summary) in old_records.items():
+        other = new_records.get(pointer)
+        if other is not None and other[1] == summary[1]:
+            pairs[pointer] = pointer
+
+    # 2. Only the pointers changed, and 3. the same person
+    for key in (2, 3):
+        pairs.update(_pair_unique(old_records, new_records, pairs, key))
+
+    # 4. Linked to the same records (twice, as people and families pair each other up)
+    for twice in range(2):
+        pairs.update(_pair_linked(old, new, old_records, new_records, pairs))
+
+    # 5. The same pointer, whatever changed
+    taken = set(pairs.values())
+    for pointer in old_records:
+        if pointer not in pairs and pointer in new_records and pointer not in taken \
+                and old_records[pointer][0] == new_records[pointer][0]:
+            pairs[pointer] = pointer
+            taken.add(pointer)
+
+    result = {'added': [], 'removed': [], 'modified': [], 'renumbered': 0, 'unchanged': 0, 'other': 0}
+    old_elements = old.element_dict()
+    new_elements = new.element_dict()
+    for (pointer, summary) in sorted(old_records.items()):
+        kind = KINDS.get(summary[0])
+        other = pairs.get(pointer)
+        if other is None:
+            if kind is None:
+                result['other'] += 1
+            else:
+                result['removed'].append((kind, pointer, _describe(old, old_elements[pointer])))
+            continue
+        if pointer == other and summary[1] == new_records[other][1]:
+            result['unchanged'] += 1
+            continue
+        changes = _changes(old_elements[pointer], new_elements[other], pairs)
+        if not changes:
+            result['unchanged' if pointer == other else 'renumbered'] += 1
+        elif kind is None:
+            result['other'] += 1
+        else:
+            result['modified'].append((kind, pointer, other, _describe(new, new_elements[other]), changes))
+    for (pointer, summary) in sorted(new_records.items()):
+        if pointer not in taken:
+            kind = KINDS.get(summary[0])
+            if kind is None:
+                result['other'] += 1
+            else:
+                result['added'].append((kind, pointer, _describe(new, new_elements[pointer])))
+    return result
+
+
+def _summaries(gedcom):
+    """ Return pointer -> (tag, hash, hash without pointers, identity or None) for every record """
+    summaries = {}
+    for element in gedcom.element_list():
+        if element.level() != 0 or not element.pointer():
+            continue
+        (full, content) = _canonical(element)
+        identity = None
+        if element.is_individual():
+            names = element.names()
+            identity = (names[0], element.birth()[0]) if names else None
+        summaries[element.pointer()] = (element.tag(), hashlib.sha1(full).digest(),
+                                        hashlib.sha1(content).digest(), identity)
+    return summaries
+
+
+def _canonical(element):
+    """ Return (text, text without pointers) standing for an element and everything under it,
+    whatever order the lines under each line are in
+    """
+    tag = element.tag()
+    value = element.value()
+    line = tag + " " + value.strip()
+    masked = tag + " @" if value[:1] == '@' and value[-1:] == '@' else line
+    children = element.children()
+    if not children:
+        # Most lines, so kept quick
+        return ("(" + line + ")", "(" + masked + ")")
+    full = []
+    content = []
+    for child in children:
+        if child.tag() in IGNORED_TAGS:
+            continue
+        (child_full, child_content) = _canonical(child)
+        full.append(child_full)
+        content.append(child_content)
+    full.sort()
+    content.sort()
+    return ("(" + line + "".join(full) + ")", "(" + masked + "".join(content) + ")")
+
+
+def _pair_unique(old_records, new_records, pairs, key):
+    """ Pair up the records not yet paired that have the same summary[key], where
+    only one record on each side has it, returning old pointer -> new pointer
+    """
+    taken = set(pairs.values())
+    old_found = {}
+    for (pointer, summary) in old_records.items():
+        if pointer not in pairs and summary[key] is not None:
+            old_found.setdefault((summary[0], summary[key]), []).append(pointer)
+    new_found = {}
+    for (pointer, summary) in new_records.items():
+        if pointer not in taken and summary[key] is not None:
+            new_found.setdefault((summary[0], summary[key]), []).append(pointer)
+    matched = {}
+    for (found, pointers) in old_found.items():
+        others = new_found.get(found)
+        if len(pointers) == 1 and others is not None and len(others) == 1:
+            matched[pointers[0]] = others[0]
+    return matched
+
+
+def _pair_linked(old, new, old_records, new_records, pairs):
+    """ Pair up the records not yet paired whose pointers to other records are the
+    same (and not empty), translating the old pointers by pairs, where only one
+    record on each side has them, returning old pointer -> new pointer
+    """
+    taken = set(pairs.values())
+    old_elements = old.element_dict()
+    old_found = {}
+    for pointer in old_records:
+        if pointer not in pairs:
+            links = _links(old_elements[pointer], pairs)
+            if links:
+                old_found.setdefault(links, []).append(pointer)
+    new_elements = new.element_dict()
+    new_found = {}
+    for pointer in new_records:
+        if pointer not in taken:
+            links = _links(new_elements[pointer], None)
+            if links:
+                new_found.setdefault(links, []).append(pointer)
+    matched = {}
+    for (links, pointers) in old_found.items():
+        others = new_found.get(links)
+        if len(pointers) == 1 and others is not None and len(others) == 1:
+            matched[pointers[0]] = others[0]
+    return matched
+
+
+def _links(record, pairs):
+    """ Return (tag, sorted (tag, pointer) of the lines of a record pointing to other records),
+    or None if it hasn't any, with the pointers translated by pairs if given
+    """
+    links = []
+    for child in record.children():
+        value = child.value()
+        if value[:1] == '@' and value[-1:] == '@':
+            links.append((child.tag(), pairs.get(value, value) if pairs is not None else value))
+    return (record.tag(), tuple(sorted(links))) if links else None
+
+
+def _fields(element, pairs):
+    """ Return a dict of (field, value) -> how many times, for the lines under a record,
+    where field is the tags from the record down, e.g. BIRT.DATE
+    """
+    fields = {}
+    pending = [(child, child.tag()) for child in element.children()]
+    while pending:
+        (child, field) = pending.pop()
+        if child.tag() in IGNORED_TAGS:
+            continue
+        value = child.value().strip()
+        value = pairs.get(value, value) if pairs is not None else value
+        fields[(field, value)] = fields.get((field, value), 0) + 1
+        pending.extend([(grandchild, field + "." + grandchild.tag()) for grandchild in child.children()])
+    return fields
+
+
+def _changes(old, new, pairs):
+    """ Return (field, old value, new value) for each difference between two versions of a
+    record, a value that was taken out or put in being None on the other side
+    """
+    # Old pointers are translated, so they compare equal to what they are paired with
+    before = _fields(old, pairs)
+    after = _fields(new, None)
+    removed = {}
+    added = {}
+    for (field, value) in before:
+        extra = before[(field, value)] - after.get((field, value), 0)
+        if extra > 0:
+            removed.setdefault(field, []).extend([value] * extra)
+    for (field, value) in after:
+        extra = after[(field, value)] - before.get((field, value), 0)
+        if extra > 0:
+            added.setdefault(field, []).extend([value] * extra)
+
+    changes = []
+    for field in sorted(set(removed) | set(added)):
+        old_values = sorted(removed.get(field, []))
+        new_values = sorted(added.get(field, []))
+        for n in range(max(len(old_values), len(new_values))):
+            changes.append((field,
+                            old_values[n] if n < len(old_values) else None,
+                            new_values[n] if n < len(new_values) else None))
+    return changes
+
+
+def _describe(gedcom, element):
+    """ A few words saying who a person, or whose a family, is """
+    if element.is_individual():
+        birth = element.birth_year()
+        return "{} ({})".format(" ".join(element.name()).strip(), birth if birth >= 0 else "?")
+    if element.is_family():
+        spouses = gedcom.get_family_members(element, "PARENTS")
+        return " & ".join([_describe(gedcom, spouse) for spouse in spouses]) or "no spouses"
+    return element.tag()
+
+
+def records(result):
+    """ Yield a dict for each record added, removed or modified in a compare() result, for export """
+    for change in ('added', 'removed'):
+        for (kind, pointer, description) in result[change]:
+            yield {'change': change, 'kind': kind, 'pointer': pointer, 'description': description}
+    for (kind, old_pointer, pointer, description, changes) in result['modified']:
+        yield {'change': 'modified', 'kind': kind, 'pointer': pointer, 'old_pointer': old_pointer,
+               'description': description,
+               'fields': [{'field': field, 'old': old, 'new': new} for (field, old, new) in changes]}
@@ -0,0 +1,203 @@
+#
+# Duplicate individuals
+#
+# Merging GED files leaves the same person in the tree more than once, under
+# different pointers and often with the name spelled differently.  Comparing
+# everybody with everybody is out of the question on a big tree, so people are
+# first put into blocks that a duplicate would almost certainly share:
+#
+#   - surname and given name sound (Soundex) and birth decade
+#   - surname and given name sound and the sounds of their parents' given names
+#   - given name sound and the sounds of their spouses' given names
+#
+# and pairs are only scored within a block.  Blocks are small, so the work
+# grows with the size of the tree rather than its square.  Blocks that are
+# too big to be any use (thousands of Smiths with no birth year) are skipped.
+#
+# Scoring a block only needs the profiles of the people in it, so blocks can
+# be spread over several processes.
+#
+
+import string
+from multiprocessing import Pool
+from phonetic import soundex_words
+
+# Blocks with more people than this aren't scored
+MAX_BLOCK = 200
+
+# Pairs scoring less than this aren't reported
+THRESHOLD = 0.7
+
+# How much each part of the profile counts towards the score
+WEIGHTS = {
+    'given': 0.25,
+    'surname': 0.20,
+    'birth': 0.20,
+    'death': 0.10,
+    'parents': 0.15,
+    'spouses': 0.10
+}
+
+# Profiles for the worker processes, which get them by forking
+_profiles = None
+
+
+def find(tree, threshold=THRESHOLD, processes=1, limit=None):
+    """ Return the pairs of people in a tree who may be the same person
+
+    processes is how many processes to score the blocks in.  Returns a list of
+    dicts, best first (up to limit of them), with keys:
+        first    - one of the people
+        second   - the other
+        score    - 0 to 1: how alike they are
+    """
+    global _profiles
+    individuals = tree.individuals()
+    _profiles = [_profile(tree.gedcom(), individual) for individual in individuals]
+
+    blocks = [block for block in _blocks(_profiles).values() if 1 < len(block) <= MAX_BLOCK]
+    if processes > 1 and len(blocks) > 1:
+        pool = Pool(processes)
+        try:
+            chunks = pool.map(_score_blocks, [(blocks[n::processes], threshold) for n in range(processes)])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        chunks = [_score_blocks((blocks, threshold))]
+
+    # A pair can share more than one block
+    scores = {}
+    for chunk in chunks:
+        scores.update(chunk)
+
+    results = [{'first': individuals[one], 'second': individuals[other], 'score': score}
+               for ((one, other), score) in scores.items()]
+    results.sort(key=lambda result: (-result['score'], result['first'].pointer(), result['second'].pointer()))
+    return results[:limit] if limit else results
+
+
+def _profile(gedcom, individual):
+    """ Return what's compared about a person: (given words, given codes, surname words,
+    surname codes, birth year, death year, gender, parents' given codes, spouses' given codes)
+    """
+    given = set()
+    surnames = set()
+    for (first, last) in individual.names():
+        given.update(string.lower(first).split())
+        surnames.update(string.lower(last).split())
+
+    parents = set()
+    for parent in gedcom.get_parents(individual):
+        parents.update(_given_codes(parent))
+
+    spouses = set()
+    for family in gedcom.families(individual):
+        for spouse in gedcom.get_family_members(family, "PARENTS"):
+            if spouse is not individual:
+                spouses.update(_given_codes(spouse))
+
+    birth = individual.birth_year()
+    death = individual.death_year()
+    return (given, soundex_words(" ".join(given)), surnames, soundex_words(" ".join(surnames)),
+            birth if birth >= 0 else None, death if death >= 0 else None,
+            individual.gender(), parents, spouses)
+
+
+def _given_codes(individual):
+    codes = set()
+    for (first, last) in individual.names():
+        codes.update(soundex_words(first))
+    return codes
+
+
+def _blocks(profiles):
+    """ Return blocking key -> positions of the people with that key """
+    blocks = {}
+    for (position, profile) in enumerate(profiles):
+        for key in _keys(profile):
+            blocks.setdefault(key, []).append(position)
+    return blocks
+
+
+def _keys(profile):
+    """ Yield the blocking keys of a person """
+    (given, given_codes, surnames, surname_codes, birth, death, gender, parents, spouses) = profile
+    for code in given_codes:
+        for surname in surname_codes:
+            if birth is not None:
+                # Two decades, offset by five years, so that births a few
+                # years apart always share at least one
+                yield ('born', code, surname, birth // 10)
+                yield ('born+5', code, surname, (birth + 5) // 10)
+            if parents:
+                yield ('parents', code, surname, tuple(sorted(parents)))
+        if spouses:
+            yield ('spouses', code, tuple(sorted(spouses)))
+
+
+def _score_blocks(work):
+    """ Score every pair in each of the blocks, returning (position, position) -> score above threshold """
+    (blocks, threshold) = work
+    scores = {}
+    # Pairs already scored, as they are often in several blocks together
+    seen = set()
+    for block in blocks:
+        for (n, one) in enumerate(block):
+            for other in block[n + 1:]:
+                pair = (one, other) if one < other else (other, one)
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                score = _score(_profiles[pair[0]], _profiles[pair[1]])
+                if score >= threshold:
+                    scores[pair] = score
+    return scores
+
+
+def _score(one, other):
+    """ Score 0 to 1 for how alike the profiles of two people are """
+    (given, given_codes, surnames, surname_codes, birth, death, gender, parents, spouses) = one
+    if gender and other[6] and gender != other[6]:
+        return 0.0
+    birth_fit = _year_fit(birth, other[4])
+    death_fit = _year_fit(death, other[5])
+    if birth_fit == 0.0 or death_fit == 0.0:
+        # Too far apart to be the same person
+        return 0.0
+    return (WEIGHTS['given'] * _name_fit(given, given_codes, other[0], other[1]) +
+            WEIGHTS['surname'] * _name_fit(surnames, surname_codes, other[2], other[3]) +
+            WEIGHTS['birth'] * birth_fit +
+            WEIGHTS['death'] * death_fit +
+            WEIGHTS['parents'] * _overlap(parents, other[7]) +
+            WEIGHTS['spouses'] * _overlap(spouses, other[8]))
+
+
+def _name_fit(words, codes, other_words, other_codes):
+    """ How many of the words of two names are the same (or at least sound alike), half if either isn't known """
+    if not words or not other_words:
+        return 0.5
+    same = float(len(words & other_words)) / len(words | other_words)
+    alike = 0.7 * len(codes & other_codes) / len(codes | other_codes) if codes and other_codes else 0.0
+    return max(same, alike)
+
+
+def _year_fit(year, other):
+    """ 1 for the same year, less the further apart, and 0 if they can't be the same """
+    if year is None or other is None:
+        return 0.5
+    miss = abs(year - other)
+    if miss == 0:
+        return 1.0
+    if miss <= 2:
+        return 0.8
+    if miss <= 5:
+        return 0.4
+    return 0.0
+
+
+def _overlap(codes, other):
+    """ How much two sets of name sounds have in common, half if either isn't known """
+    if not codes or not other:
+        return 0.5
+    return float(len(codes & other)) / len(codes | other)
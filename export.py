@@ -0,0 +1,185 @@
+#
+# Bulk export of fingerprints, for feeding other programs
+#
+# Fingerprints are written one at a time as they are produced, so memory stays
+# the same however many are exported.  Output is gathered into blocks of lines
+# before each write (which matters most when gzipping, as every write is
+# compressed separately).
+#
+# JSON lines: one object per fingerprint
+#   {"pointer": "@I1@", "name": "...", "census": [1870, 1950],
+#    "locations": [{"event": "Birth", "year": "1877", "place": "..."}, ...],
+#    "family": [{"role": "parent", "pointer": "@I3@", "name": "...",
+#                "birth": 1835, "death": 1880, "final": 1880,
+#                "ages": {"1840": 5, ...}}, ...]}
+#
+# CSV: one row per member of each fingerprint (the person themself has the
+# role "self"), with their age in each census year as "1880=3 1890=13".
+# With more generations, the roles also include "ancestor", "descendant" and
+# "in-law" (the spouse of a descendant).
+# Locations are only in the JSON.
+#
+
+import sys
+import csv
+import gzip
+import json
+
+# Lines gathered before each write
+BLOCK = 1000
+
+FORMATS = ('jsonl', 'csv')
+
+CSV_COLUMNS = ['target', 'target_name', 'role', 'pointer', 'name', 'birth', 'death', 'final', 'ages']
+
+# Fingerprint levels (see main.generate_entity_row) and what they are to the person
+ROLES = {0: 'parent', 1: 'spouse', 2: 'child'}
+
+
+def records(fingerprints):
+    """ Yield an export record for each fingerprint, as made by main.fingerprint_data() """
+    for fingerprint in fingerprints:
+        years = fingerprint['columns'].years()
+        family = []
+        for row in fingerprint['fingerprint']:
+            role = _role(row)
+            family.append({
+                'role': role,
+                'pointer': row['pointer'],
+                'name': row['name'],
+                'birth': _year(row['birth']),
+                'death': _year(row['death']),
+                'final': row['final'],
+                'ages': _ages(row, years)
+            })
+        yield {
+            'pointer': fingerprint['pointer'],
+            'name': fingerprint['name'],
+            'census': [fingerprint['earliest_date'], fingerprint['latest_date']],
+            'locations': [{'event': event, 'year': year, 'place': place}
+                          for (event, year, place) in fingerprint['locations']],
+            'family': family
+        }
+
+
+def jsonl_lines(records):
+    """ Yield each record as a line of JSON """
+    # Not sort_keys: it would make json use its pure Python encoder, several times slower
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    for record in records:
+        yield encode(record) + "\n"
+
+
+def csv_lines(records):
+    """ Yield a CSV header line, then a line for each member of each record """
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.take()
+    for record in records:
+        for member in record['family']:
+            ages = " ".join(["{}={}".format(year, age) for (year, age) in sorted(member['ages'].items())])
+            writer.writerow([record['pointer'], record['name'], member['role'], member['pointer'],
+                             member['name'], _blank(member['birth']), _blank(member['death']),
+                             member['final'], ages])
+            yield buffer.take()
+
+
+def write(fingerprints, out, format='jsonl'):
+    """ Write fingerprints to the open file out in the given format, returning how many were written """
+    counted = _Counted(fingerprints)
+    lines = jsonl_lines(records(counted)) if format == 'jsonl' else csv_lines(records(counted))
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= BLOCK:
+            out.write("".join(block))
+            block = []
+    if block:
+        out.write("".join(block))
+    return counted.count
+
+
+def open_output(filepath, compress=None):
+    """ Open a file to export to: '-' is standard output, and it is gzipped if compress
+    is True, or if compress is None and the name ends in .gz
+    """
+    if compress is None:
+        compress = filepath.endswith('.gz')
+    if filepath == '-':
+        out = sys.stdout
+        if compress:
+            return gzip.GzipFile(fileobj=out, mode='wb')
+        return out
+    if compress:
+        return gzip.open(filepath, 'wb')
+    return open(filepath, 'wb', 1 << 16)
+
+
+def format_for(filepath):
+    """ Guess the format from a file name, e.g. people.csv.gz is CSV """
+    name = filepath[:-3] if filepath.endswith('.gz') else filepath
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+class _Counted:
+    """ Pass the items of an iterable through, counting them """
+
+    def __init__(self, items):
+        self.__items = items
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.__items:
+            self.count += 1
+            yield item
+
+
+class _LineBuffer:
+    """ Somewhere for csv.writer to write to, one row at a time """
+
+    def __init__(self):
+        self.__parts = []
+
+    def write(self, text):
+        self.__parts.append(text)
+
+    def take(self):
+        text = "".join(self.__parts)
+        self.__parts = []
+        return text
+
+
+def _role(row):
+    """ What a member of a fingerprint is to the person """
+    if row.get('target'):
+        return 'self'
+    if row.get('in_law'):
+        return 'in-law'
+    generation = row.get('generation', row['level'] - 1)
+    if generation < -1:
+        return 'ancestor'
+    if generation > 1:
+        return 'descendant'
+    return ROLES[row['level']]
+
+
+def _ages(row, years):
+    """ Return census year (as a string, for JSON) -> age, for the years a person was alive """
+    birth = int(row['birth'])
+    ages = {}
+    if birth < 0:
+        return ages
+    for year in years:
+        if birth <= year <= row['final']:
+            ages[str(year)] = year - birth
+    return ages
+
+
+def _year(year):
+    """ A year, or None if it isn't known """
+    return year if year >= 0 else None
+
+
+def _blank(value):
+    return '' if value is None else value
@@ -0,0 +1,130 @@
+#
+# Searching every tree at once
+#
+# Researchers keep a GED file per family they work on, and the same person can
+# turn up in several of them.  search() runs one set of criteria against many
+# trees on a pool of threads, so waiting on a tree that is still being parsed
+# doesn't hold up the others.  Each tree answers from its own indexes
+# (Tree.select), so searching trees that are already parsed is quick; parsing
+# is pure Python, which only one thread runs at a time, so parsing several
+# files still takes about as long as parsing them one after the other.
+#
+# The matches are merged, best fitting names first, each tagged with the file
+# it came from.  With dedup, the same person (same name and birth year) found
+# in several files is listed once, with all of the files.
+#
+
+import os
+import string
+from multiprocessing.pool import ThreadPool
+from trees import TreeLoading
+
+# How many trees are searched at the same time
+SEARCH_THREADS = 4
+
+_pool = None
+_pool_pid = None
+
+
+def search(filepaths, criteria, get_tree, dedup=False):
+    """ Search the trees of the given files, returning (matches, problems)
+
+    get_tree(filepath) returns the Tree for a file, or raises.  matches is a
+    list of dicts, best first, with keys:
+        tree     - the Tree the person was found in
+        element  - the person
+        sources  - the files they were found in (more than one with dedup)
+        rank     - how many of the name words they match exactly
+    problems is a list of (filepath, reason) for the files that couldn't be
+    searched, such as those still being parsed.
+    """
+    def one(filepath):
+        try:
+            tree = get_tree(filepath)
+        except TreeLoading:
+            return (filepath, None, "still being indexed")
+        except Exception as e:
+            return (filepath, None, str(e))
+        return (filepath, tree, tree.select(criteria))
+
+    names = _name_words(criteria)
+    matches = []
+    problems = []
+    for (order, (filepath, tree, found)) in enumerate(_get_pool().map(one, filepaths)):
+        if tree is None:
+            problems.append((filepath, found))
+            continue
+        for (position, element) in enumerate(found):
+            matches.append({
+                'tree': tree,
+                'element': element,
+                'sources': [filepath],
+                'rank': _rank(element, names),
+                'order': (order, position)
+            })
+
+    matches.sort(key=lambda match: (-match['rank'], match['order']))
+    if dedup:
+        matches = _dedup(matches)
+    return (matches, problems)
+
+
+def source_names(match):
+    """ Return the names of the files a match was found in, e.g. ['crouch', 'wise'] """
+    return [os.path.splitext(os.path.basename(filepath))[0] for filepath in match['sources']]
+
+
+def _get_pool():
+    """ Return the search thread pool, starting it if necessary (again after a fork) """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPool(SEARCH_THREADS)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _name_words(criteria):
+    """ Return (given name words, surname words) asked for in criteria, lower case """
+    given = []
+    surname = []
+    for item in criteria.split(':'):
+        key, _, value = item.partition('=')
+        if key in ('name', 'namephon'):
+            given.extend(string.lower(value).split())
+        elif key in ('surname', 'surnamephon'):
+            surname.extend(string.lower(value).split())
+    return (given, surname)
+
+
+def _rank(element, names):
+    """ Count the words of the names asked for that one of a person's names has exactly """
+    (given, surname) = names
+    best = 0
+    for (first, last) in element.names():
+        first = string.lower(first).split()
+        last = string.lower(last).split()
+        rank = len([word for word in given if word in first]) + len([word for word in surname if word in last])
+        best = max(best, rank)
+    return best
+
+
+def _dedup(matches):
+    """ Merge matches of the same person (name and birth year) from different files """
+    merged = []
+    seen = {}
+    for match in matches:
+        element = match['element']
+        key = (string.lower(" ".join(element.name())), element.birth_year())
+        first = seen.get(key)
+        if not element.names():
+            # Nothing to say two people with no name are the same
+            merged.append(match)
+        elif first is None:
+            seen[key] = match
+            merged.append(match)
+        elif match['sources'][0] not in first['sources']:
+            first['sources'].append(match['sources'][0])
+        else:
+            # Two people with the same name and birth year in the one file
+            merged.append(match)
+    return merged
@@ -28,7 +28,65 @@ __all__ = ["Gedcom", "Element", "GedcomParseError"]
 
 # Global imports
 import re
+import sys
+import mmap
 import string
+import ansel
+import dates
+import phonetic
+import places
+
+# Tags whose values repeat a lot (the same few places, dates and sources over
+# and over), so that equal values are stored as one shared string
+SHARED_TAGS = ("PLAC", "DATE", "SOUR")
+
+# Lines continuing the value of their parent line: CONT starts a new line of
+# it, CONC carries straight on
+CONTINUATION_TAGS = ("CONC", "CONT")
+
+# The name of a person with no NAME line (a placeholder, say), as (first, last)
+NO_NAME = ("?", "")
+
+# Longest value written on one line; the rest goes on CONC lines
+MAX_VALUE = 200
+
+GED_LINE = re.compile(
+    # Level must start with nonnegative int, no leading zeros.
+    '(0|[1-9]+[0-9]*) ' +
+    # Pointer optional, if it exists it must be flanked by '@'
+    '(@[^@]+@ |)' +
+    # Tag must be alphanumeric string
+    '([A-Za-z0-9_]+)' +
+    # Value optional, consists of anything after a space to end of line
+    '( [^\n\r]*|)' +
+    # End of line defined by \r\n, \n or \r, or the end of the file
+    '(\r\n|\n|\r|\Z)'
+    )
+
+# The HEAD record's CHAR line, and the start of the record after HEAD
+HEAD_CHAR = re.compile('[\r\n]1 CHAR ([^\r\n]*)')
+NEXT_RECORD = re.compile('[\r\n]0 ')
+HIGH_BYTES = re.compile('[\x80-\xff]')
+
+# Character sets a GED file's HEAD.CHAR may name, and their Python codecs.
+# UTF-16 is recognized from the bytes themselves, so "UNICODE" that isn't
+# UTF-16 is taken to be UTF-8, as is ASCII.
+CHARSETS = {
+    'UTF-8': 'utf-8',
+    'UTF8': 'utf-8',
+    'ASCII': 'utf-8',
+    'UNICODE': 'utf-8',
+    'ANSEL': 'ansel',
+    'ANSI': 'cp1252',
+    'IBM WINDOWS': 'cp1252',
+    'WINDOWS-1252': 'cp1252',
+    'IBMPC': 'cp437',
+    'IBM DOS': 'cp850',
+    'MACINTOSH': 'mac_roman',
+    'LATIN1': 'latin-1',
+    'ISO-8859-1': 'latin-1',
+    'ISO8859-1': 'latin-1',
+}
 
 class Gedcom:
     """Parses and manipulates GEDCOM 5.5 format data
@@ -40,14 +98,35 @@ class Gedcom:
     Elements may be accessed via:
       - a list (all elements, default order is same as in file)
       - a dict (only elements with pointers, which are the keys)
+
+    Tags and pointers are interned, so each is stored once and compared by
+    identity, and equal values of the shared_tags are stored once too.
+
+    Values are UTF-8 byte strings whatever the file's character set (see
+    encoding()), and CONC and CONT lines are joined onto the value of the
+    line they continue rather than being elements of their own.
     """
 
-    def __init__(self, filepath):
-        """ Initialize a GEDCOM data object. You must supply a Gedcom file."""
+    def __init__(self, filepath, shared_tags=SHARED_TAGS):
+        """ Initialize a GEDCOM data object. You must supply a Gedcom file.
+
+        Pass shared_tags=() to store every value as a separate string.
+        """
         self.__element_list = []
         self.__element_dict = {}
         self.__element_top = Element(-1, "", "TOP", "")
+        self.__shared_tags = frozenset(shared_tags)
+        # While parsing: string -> the one copy of it being kept
+        self.__strings = {}
+        # kind -> [occurrences, distinct strings, bytes saved by sharing]
+        self.__string_stats = {'tags': [0, 0, 0], 'pointers': [0, 0, 0], 'values': [0, 0, 0]}
+        self.__encoding = 'utf-8'
+        self.__transcode = None
+        # The element whose value CONC and CONT lines are continuing, and the parts so far
+        self.__continued = None
+        self.__continuation = []
         self.__parse(filepath)
+        self.__strings = None
 
     def element_list(self):
         """ Return a list of all the elements in the Gedcom file.
@@ -64,47 +143,108 @@ class Gedcom:
         """
         return self.__element_dict
 
+    def encoding(self):
+        """ Return the Python codec of the character set the file was written in """
+        return self.__encoding
+
+    def string_stats(self):
+        """ Return how much sharing strings saved while parsing.
+
+        A dict of 'tags', 'pointers' (both record pointers and references to
+        them) and 'values' (of the shared tags), each a dict with:
+            occurrences - how many there were in the file
+            distinct    - how many different strings are actually stored
+            saved       - bytes not spent on duplicate strings
+        """
+        stats = {}
+        for (kind, (occurrences, distinct, saved)) in self.__string_stats.items():
+            stats[kind] = {'occurrences': occurrences, 'distinct': distinct, 'saved': saved}
+        return stats
+
     # Private methods
 
     def __parse(self, filepath):
-        """Open and parse file path as GEDCOM 5.5 formatted data."""
-        gedcom_file = open(filepath, 'rU')
+        """Open and parse file path as GEDCOM 5.5 formatted data.
+
+        The file is read as bytes, through mmap, and only values that aren't
+        plain ASCII are decoded, and then only if the file isn't UTF-8.
+        """
+        with open(filepath, 'rb') as gedcom_file:
+            try:
+                data = mmap.mmap(gedcom_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped
+                data = None
+            try:
+                if data is not None:
+                    self.__parse_data(data)
+            finally:
+                if data is not None:
+                    data.close()
+
+    def __parse_data(self, data):
+        """Parse a buffer of GEDCOM 5.5 formatted bytes."""
+        (self.__encoding, start) = detect_encoding(data)
+        if self.__encoding.startswith('utf-16'):
+            # Every character is two bytes, so transcode the lot up front
+            data = data[start:].decode(self.__encoding, 'replace').encode('utf-8')
+            start = 0
+        elif self.__encoding == 'ansel':
+            self.__transcode = lambda value: ansel.decode(value).encode('utf-8')
+        elif self.__encoding != 'utf-8':
+            codec = self.__encoding
+            self.__transcode = lambda value: value.decode(codec, 'replace').encode('utf-8')
+
         line_num = 1
         last_elem = self.__element_top
-        for line in gedcom_file:
-            last_elem = self.__parse_line(line_num, line, last_elem)
+        match = GED_LINE.match
+        pos = start
+        end = len(data)
+        while pos < end:
+            line = match(data, pos)
+            if line is None:
+                errmsg = ("Line %d of document violates GEDCOM format" % line_num +
+                          "\nSee: http://homepages.rootsweb.ancestry.com/" +
+                          "~pmcbride/gedcom/55gctoc.htm")
+                raise SyntaxError(errmsg)
+            last_elem = self.__parse_line(line_num, line.groups(), last_elem)
+            pos = line.end()
             line_num += 1
+        self.__end_continuation()
 
-    def __parse_line(self, line_num, line, last_elem):
+    def __parse_line(self, line_num, line_parts, last_elem):
         """Parse a line from a GEDCOM 5.5 formatted document.
 
         Each line should have the following (bracketed items optional):
         level + ' ' + [pointer + ' ' +] tag + [' ' + line_value]
         """
-        ged_line_re = (
-            # Level must start with nonnegative int, no leading zeros.
-            '^(0|[1-9]+[0-9]*) ' +
-            # Pointer optional, if it exists it must be flanked by '@'
-            '(@[^@]+@ |)' +
-            # Tag must be alphanumeric string
-            '([A-Za-z0-9_]+)' +
-            # Value optional, consists of anything after a space to end of line
-            '( [^\n\r]*|)' +
-            # End of line defined by \n or \r
-            '(\r|\n)'
-            )
-        if re.match(ged_line_re, line):
-            line_parts = re.match(ged_line_re, line).groups()
-        else:
-            errmsg = ("Line %d of document violates GEDCOM format" % line_num +
-                      "\nSee: http://homepages.rootsweb.ancestry.com/" +
-                      "~pmcbride/gedcom/55gctoc.htm")
-            raise SyntaxError(errmsg)
-
         level = int(line_parts[0])
         pointer = line_parts[1].rstrip(' ')
-        tag = line_parts[2]
+        tag = self.__share(line_parts[2], 'tags')
         value = line_parts[3].lstrip(' ')
+        if self.__transcode is not None and HIGH_BYTES.search(value):
+            value = self.__transcode(value)
+
+        if tag in CONTINUATION_TAGS and level <= last_elem.level() + 1:
+            # Only the single space after the tag separates it from the value:
+            # any more are part of the value
+            text = line_parts[3][1:]
+            if self.__transcode is not None and HIGH_BYTES.search(text):
+                text = self.__transcode(text)
+            parent_elem = last_elem
+            while parent_elem.level() > level - 1:
+                parent_elem = parent_elem.parent()
+            self.__continue(parent_elem, text, tag == "CONT")
+            return last_elem
+        self.__end_continuation()
+
+        if pointer:
+            pointer = self.__share(pointer, 'pointers')
+        if value[:1] == '@' and value[-1:] == '@':
+            # A reference to another record: the same string as its pointer
+            value = self.__share(value, 'pointers')
+        elif value and tag in self.__shared_tags:
+            value = self.__share(value, 'values')
 
         # Check level: should never be more than one higher than previous line.
         if level > last_elem.level() + 1:
@@ -129,6 +269,41 @@ class Gedcom:
         element.add_parent(parent_elem)
         return element
 
+    def __continue(self, element, text, new_line):
+        """ Add the text of a CONC (or, on a new line, CONT) line to an element's value """
+        if element is not self.__continued:
+            self.__end_continuation()
+            self.__continued = element
+            self.__continuation = [element.value()]
+        if new_line:
+            self.__continuation.append("\n")
+        self.__continuation.append(text)
+
+    def __end_continuation(self):
+        """ Store the joined value of the element CONC and CONT lines were continuing, if any """
+        if self.__continued is not None:
+            self.__continued.set_value("".join(self.__continuation))
+            self.__continued = None
+            self.__continuation = []
+
+    def __share(self, text, kind):
+        """ Return the one stored copy of a string, counting it under kind in the stats
+
+        Tags and pointers are interned, so comparing them against string
+        constants is usually a quick identity check.
+        """
+        stats = self.__string_stats[kind]
+        stats[0] += 1
+        shared = self.__strings.get(text)
+        if shared is None:
+            if kind != 'values':
+                text = intern(text)
+            self.__strings[text] = text
+            stats[1] += 1
+            return text
+        stats[2] += sys.getsizeof(text)
+        return shared
+
     # Methods for analyzing individuals and relationships between individuals
 
     def marriages(self, individual):
@@ -154,7 +329,7 @@ class Gedcom:
 
     def marriage_years(self, individual):
         """ Return list of marriage years (as int) for an individual. """
-        dates = []
+        years = []
         if not individual.is_individual():
             raise ValueError("Operation only valid for elements with INDI tag")
         # Get and analyze families where individual is spouse.
@@ -164,12 +339,10 @@ class Gedcom:
                 if famdata.tag() == "MARR":
                     for marrdata in famdata.children():
                         if marrdata.tag() == "DATE":
-                            date = marrdata.value().split()[-1]
-                            try:
-                                dates.append(int(date))
-                            except ValueError:
-                                pass
-        return dates
+                            year = dates.year(dates.parse(marrdata.value()))
+                            if year is not None:
+                                years.append(year)
+        return years
 
     def marriage_year_match(self, individual, year):
         """ Check if one of the marriage years of an individual matches
@@ -219,6 +392,38 @@ class Gedcom:
             ancestors = ancestors + self.get_ancestors(parent)
         return ancestors
 
+    def get_descendants(self, family, generations=1):
+        """ Return the descendants of a family, down to the given number of generations
+
+        Returns a list of (element, generation, in_law), where generation is 1
+        for the children of the family, and in_law is True for the spouses of
+        the descendants (for all but the last generation).  Each descendant is
+        followed by their spouses and then their own descendants.
+        """
+        if not family.is_family():
+            raise ValueError("Operation only valid for elements with FAM tag.")
+        found = []
+        # Rows to add and families still to go through, the next one last:
+        # (element, generation, in_law), or (family, generation of its children, None)
+        pending = [(family, 1, None)]
+        while pending:
+            (element, generation, in_law) = pending.pop()
+            if in_law is not None:
+                found.append((element, generation, in_law))
+                continue
+            following = []
+            for child in self.get_family_members(element, "CHIL"):
+                following.append((child, generation, False))
+                if generation >= generations:
+                    continue
+                for child_family in self.families(child):
+                    for spouse in self.get_family_members(child_family, "PARENTS"):
+                        if spouse is not child:
+                            following.append((spouse, generation, True))
+                    following.append((child_family, generation + 1, None))
+            pending.extend(reversed(following))
+        return found
+
     def get_parents(self, indi, parent_type="ALL"):
         """ Return elements corresponding to parents of an individual
         
@@ -295,9 +500,57 @@ class Gedcom:
     # Other methods
 
     def print_gedcom(self):
-        """Write GEDCOM data to stdout."""
+        """Write GEDCOM data to stdout, a block of lines at a time."""
+        lines = []
         for element in self.element_list():
-            print(element)
+            element.gedcom_lines(lines)
+            if len(lines) >= 1000:
+                sys.stdout.write("\n".join(lines) + "\n")
+                lines = []
+        if lines:
+            sys.stdout.write("\n".join(lines) + "\n")
+
+
+def value_lines(line, level, value, lines):
+    """ Add a line with its value to a list, putting each new line of the value on a
+    CONT line and anything too long for one line on CONC lines, at the given level
+    """
+    for (number, text) in enumerate(value.split("\n")):
+        if number > 0:
+            line = "{} CONT".format(level)
+        while len(text) > MAX_VALUE:
+            # Not splitting at a space, which some programs would lose
+            cut = MAX_VALUE
+            while cut > 1 and (text[cut - 1] == ' ' or text[cut] == ' '):
+                cut -= 1
+            lines.append(line + " " + text[:cut])
+            line = "{} CONC".format(level)
+            text = text[cut:]
+        lines.append(line + " " + text if text else line)
+
+
+def detect_encoding(data):
+    """ Return (Python codec, offset of the first line) for the bytes of a GED file
+
+    A byte order mark wins, then the bytes of UTF-16 text, then the CHAR
+    line of the HEAD record.  Without any of those, it's taken to be UTF-8.
+    """
+    if data[:3] == '\xef\xbb\xbf':
+        return ('utf-8', 3)
+    if data[:2] == '\xff\xfe':
+        return ('utf-16-le', 2)
+    if data[:2] == '\xfe\xff':
+        return ('utf-16-be', 2)
+    if data[:2] == '0\x00':
+        return ('utf-16-le', 0)
+    if data[:2] == '\x000':
+        return ('utf-16-be', 0)
+    head_end = NEXT_RECORD.search(data, 1, 65536)
+    head_end = head_end.start() if head_end else min(len(data), 65536)
+    char = HEAD_CHAR.search(data, 0, head_end)
+    if char:
+        return (CHARSETS.get(char.group(1).strip().upper(), 'utf-8'), 0)
+    return ('utf-8', 0)
 
 
 class GedcomParseError(Exception):
@@ -310,7 +563,7 @@ class GedcomParseError(Exception):
     def __str__(self):
         return repr(self.value)
 
-class Element:
+class Element(object):
     """ Gedcom element
 
     Each line in a Gedcom file is an element with the format
@@ -335,8 +588,13 @@ class Element:
     
     See a Gedcom file for examples of tags and their values.
 
+    There is one Element per line of a file, so they have slots rather
+    than an attribute dictionary each, which would take several times
+    as much memory as everything else in the element put together.
     """
 
+    __slots__ = ('__level', '__pointer', '__tag', '__value', '__children', '__parent')
+
     def __init__(self,level,pointer,tag,value):
         """ Initialize an element.  
         
@@ -384,6 +642,10 @@ class Element:
         """ Add a parent element to this element """
         self.__parent = element
 
+    def set_value(self,value):
+        """ Replace the value of this element """
+        self.__value = value
+
     def is_individual(self):
         """ Check if this element is an individual """
         return self.tag() == "INDI"
@@ -404,6 +666,14 @@ class Element:
              Match a person with [name] in any part of the surname.
         name=[name]
              Match a person with [name] in any part of the given name.
+        surnamephon=[name]
+             Match a person with a surname that sounds like [name] (Soundex).
+        namephon=[name]
+             Match a person with given names that sound like each word of [name].
+        place=[place]
+             Match a person with an event in [place], or anywhere within it,
+             e.g. "Taney, Missouri".  (Tree.select also counts the places of
+             their families' events, such as marriages.)
         birth=[year]
              Match a person whose birth year is a four-digit [year].
         birthrange=[year1-year2]
@@ -426,6 +696,12 @@ class Element:
                 match = False
             elif key == "name" and not self.given_match(value):
                 match = False
+            elif key == "surnamephon" and not self.surname_phonetic_match(value):
+                match = False
+            elif key == "namephon" and not self.given_phonetic_match(value):
+                match = False
+            elif key == "place" and not self.place_match(value):
+                match = False
             elif key == "birth":
                 try:
                     year = int(value)
@@ -475,6 +751,30 @@ class Element:
                 return True
         return False
 
+    def surname_phonetic_match(self,name):
+        """ Match a string with the surname of an individual by how it sounds """
+        codes = phonetic.soundex_words(name)
+        found = set()
+        for (first,last) in self.names():
+            found.update(phonetic.soundex_words(last))
+        return len(codes) > 0 and codes <= found
+
+    def place_match(self,place):
+        """ Match a place with the places of an individual's events """
+        for e in self.children():
+            for c in e.children():
+                if c.tag() == "PLAC" and places.within(c.value(), place):
+                    return True
+        return False
+
+    def given_phonetic_match(self,name):
+        """ Match a string with the given names of an individual by how they sound """
+        codes = phonetic.soundex_words(name)
+        found = set()
+        for (first,last) in self.names():
+            found.update(phonetic.soundex_words(first))
+        return len(codes) > 0 and codes <= found
+
     def birth_year_match(self,year):
         """ Match the birth year of an individual.  Year is an integer. """
         return self.birth_year() == year
@@ -501,6 +801,13 @@ class Element:
             return True
         return False
 
+    def name(self):
+        """ Return a person's first name as a tuple (first, last), or NO_NAME if they haven't one """
+        names = self.names()
+        if names:
+            return names[0]
+        return NO_NAME
+
     def names(self):
         """ Return an array of a person's names as a tuple: [(first,last), ...] """
         names = []
@@ -572,18 +879,16 @@ class Element:
         date = ""
         if not self.is_individual():
             return date
-        for e in self.children():
-            if e.tag() == "BIRT":
-                for c in e.children():
-                    if c.tag() == "DATE":
-                        datel = c.value().split()
-                        date = datel[len(datel)-1]
-        if date == "":
-            return -1
-        try:
-            return int(date)
-        except:
+        year = dates.year(self.birth_span())
+        if year is None:
             return -1
+        return year
+
+    def birth_span(self):
+        """ Return the birth date of a person as an (earliest, latest) day span, or None """
+        if not self.is_individual():
+            return None
+        return dates.parse(self.__event_date("BIRT"))
 
     def death(self):
         """ Return the death tuple of a person as (date,place) """
@@ -608,18 +913,16 @@ class Element:
         date = ""
         if not self.is_individual():
             return date
-        for e in self.children():
-            if e.tag() == "DEAT":
-                for c in e.children():
-                    if c.tag() == "DATE":
-                        datel = c.value().split()
-                        date = datel[len(datel)-1]
-        if date == "":
-            return -1
-        try:
-            return int(date)
-        except:
+        year = dates.year(self.death_span())
+        if year is None:
             return -1
+        return year
+
+    def death_span(self):
+        """ Return the death date of a person as an (earliest, latest) day span, or None """
+        if not self.is_individual():
+            return None
+        return dates.parse(self.__event_date("DEAT"))
 
     def burial(self):
         """ Return the burial tuple of a person as (date,place) """
@@ -648,7 +951,7 @@ class Element:
             if pdata.tag() == "CENS":
                 date = ''
                 place = ''
-                source = ''
+                source = ()
                 for indivdata in pdata.children():
                     if indivdata.tag() == "DATE":
                         date = indivdata.value()
@@ -712,15 +1015,42 @@ class Element:
                 return True
         return False
 
+    def __event_date(self, tag):
+        """ Return the date value of the last event with the given tag, or '' """
+        date = ""
+        for e in self.children():
+            if e.tag() == tag:
+                for c in e.children():
+                    if c.tag() == "DATE":
+                        date = c.value()
+        return date
+
     def get_individual(self):
         """ Return this element and all of its sub-elements """
-        result = str(self)
-        for e in self.children():
-            result += '\n' + e.get_individual()
-        return result
+        # Joined once at the end: adding to a string line by line takes time
+        # growing with the square of the size of the record
+        lines = []
+        pending = [self]
+        while pending:
+            e = pending.pop()
+            e.gedcom_lines(lines)
+            pending.extend(reversed(e.children()))
+        return '\n'.join(lines)
+
+    def gedcom_lines(self, lines):
+        """ Add this element to a list as the lines of a GED file: its value was joined from
+        any CONT and CONC lines when it was read, so it is split up again (see value_lines())
+        """
+        line = str(self.level())
+        if self.pointer() != "":
+            line += ' ' + self.pointer()
+        line += ' ' + self.tag()
+        value_lines(line, self.level() + 1, self.value(), lines)
 
     def __str__(self):
-        """ Format this element as its original string """
+        """ Format this element as its original string, with the whole of its value (new lines
+        and all; see gedcom_lines() for writing it to a file)
+        """
         result = str(self.level())
         if self.pointer() != "":
             result += ' ' + self.pointer()
@@ -0,0 +1,270 @@
+#
+# The relationships of a whole tree as integer arrays
+#
+# Gedcom answers questions one person at a time, following pointers through
+# the FAMS, FAMC, HUSB, WIFE and CHIL records.  Graph reads all of the
+# families once and keeps who is whose parent, child and spouse in
+# compressed sparse row (CSR) form: people are numbered by their position in
+# Tree.individuals(), and the relations of person n are
+# targets[offsets[n]:offsets[n + 1]].  Everything is in array.array, so a
+# million people take a few tens of megabytes, and the analytics below walk
+# the whole tree in a few passes over those arrays:
+#
+#   generations()        how many generations down from the earliest ancestors
+#   components()         which disconnected sub-tree each person is in
+#   ancestor_counts()    how many different ancestors everyone has
+#   descendant_counts()  and how many different descendants
+#
+# write() saves the arrays as JSON, for graph tools elsewhere.
+#
+
+import json
+import binascii
+from array import array
+
+# A person in a loop of parents (bad data) has no generation
+NO_GENERATION = -1
+
+# About how many bytes each member of a Python set of people takes; a bigger set
+# is kept as one bit per person instead (see Graph.ancestor_counts())
+SET_BYTES = 40
+
+
+class Relations:
+    """ One relation (parents, children or spouses) of every person, in CSR form """
+
+    def __init__(self, count, sources, targets):
+        """ Build from two equally long arrays: sources[i] is related to targets[i] """
+        offsets = array('i', [0]) * (count + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for n in range(count):
+            offsets[n + 1] += offsets[n]
+        ordered = array('i', [0]) * len(targets)
+        filled = array('i', offsets[:count])
+        for (i, source) in enumerate(sources):
+            ordered[filled[source]] = targets[i]
+            filled[source] += 1
+        self.__offsets = offsets
+        self.__targets = ordered
+
+    def of(self, n):
+        """ Return the people person n is related to """
+        return self.__targets[self.__offsets[n]:self.__offsets[n + 1]]
+
+    def count(self, n):
+        """ Return how many people person n is related to """
+        return self.__offsets[n + 1] - self.__offsets[n]
+
+    def offsets(self):
+        """ Return the array of where each person's relations start in targets() """
+        return self.__offsets
+
+    def targets(self):
+        """ Return the array of everyone's relations, one person's after another """
+        return self.__targets
+
+
+class Graph:
+    """ The parents, children and spouses of everyone in a tree, by position """
+
+    def __init__(self, tree):
+        individuals = tree.individuals()
+        gedcom = tree.gedcom()
+        self.__pointers = [individual.pointer() for individual in individuals]
+        self.__index = dict((pointer, n) for (n, pointer) in enumerate(self.__pointers))
+
+        children = (array('i'), array('i'))
+        spouses = (array('i'), array('i'))
+        for element in gedcom.element_list():
+            if not element.is_family():
+                continue
+            parents = []
+            kids = []
+            for member in element.children():
+                n = self.__index.get(member.value())
+                if n is None:
+                    continue
+                if member.tag() in ("HUSB", "WIFE"):
+                    parents.append(n)
+                elif member.tag() == "CHIL":
+                    kids.append(n)
+            for parent in parents:
+                for kid in kids:
+                    children[0].append(parent)
+                    children[1].append(kid)
+                for other in parents:
+                    if other != parent:
+                        spouses[0].append(parent)
+                        spouses[1].append(other)
+
+        count = len(self.__pointers)
+        self.__children = Relations(count, children[0], children[1])
+        self.__parents = Relations(count, children[1], children[0])
+        self.__spouses = Relations(count, spouses[0], spouses[1])
+        self.__order = None
+
+    def size(self):
+        """ Return the number of people """
+        return len(self.__pointers)
+
+    def pointer(self, n):
+        """ Return the pointer of person n, e.g. '@I12@' """
+        return self.__pointers[n]
+
+    def index(self, pointer):
+        """ Return the number of the person with a pointer, or None """
+        return self.__index.get(pointer)
+
+    def parents(self):
+        """ Return the Relations from each person to their parents """
+        return self.__parents
+
+    def children(self):
+        """ Return the Relations from each person to their children """
+        return self.__children
+
+    def spouses(self):
+        """ Return the Relations from each person to their spouses """
+        return self.__spouses
+
+    def order(self):
+        """ Return everyone in an order where parents come before their children
+
+        People in a loop of parents (which real trees shouldn't have, but bad
+        data can) are left out.
+        """
+        if self.__order is None:
+            parents = self.__parents
+            children = self.__children
+            waiting = array('i', [parents.count(n) for n in range(self.size())])
+            order = array('i', [n for n in range(self.size()) if waiting[n] == 0])
+            done = 0
+            while done < len(order):
+                for child in children.of(order[done]):
+                    waiting[child] -= 1
+                    if waiting[child] == 0:
+                        order.append(child)
+                done += 1
+            self.__order = order
+        return self.__order
+
+    def generations(self):
+        """ Return an array of the generation of each person: 0 for those with no parents
+        in the tree, otherwise one more than their latest parent
+        """
+        generations = array('i', [NO_GENERATION]) * self.size()
+        parents = self.__parents
+        for n in self.order():
+            generation = 0
+            for parent in parents.of(n):
+                generation = max(generation, generations[parent] + 1)
+            generations[n] = generation
+        return generations
+
+    def components(self):
+        """ Return an array of the component of each person, numbered from 0 biggest first
+
+        People are in the same component if there is any chain of parents,
+        children and spouses between them.
+        """
+        roots = array('i', range(self.size()))
+
+        def find(n):
+            while roots[n] != n:
+                roots[n] = roots[roots[n]]
+                n = roots[n]
+            return n
+
+        for relations in (self.__children, self.__spouses):
+            offsets = relations.offsets()
+            targets = relations.targets()
+            for n in range(self.size()):
+                for target in targets[offsets[n]:offsets[n + 1]]:
+                    (a, b) = (find(n), find(target))
+                    if a != b:
+                        roots[max(a, b)] = min(a, b)
+
+        sizes = {}
+        for n in range(self.size()):
+            root = find(n)
+            sizes[root] = sizes.get(root, 0) + 1
+        numbers = dict((root, number) for (number, root) in
+                       enumerate(sorted(sizes, key=lambda root: (-sizes[root], root))))
+        return array('i', [numbers[roots[n]] for n in range(self.size())])
+
+    def ancestor_counts(self):
+        """ Return a list of how many different ancestors each person has in the tree
+
+        Worked out in one pass down the generations, each person's ancestors
+        being their parents and their parents' ancestors, so an ancestor reached
+        by more than one line (cousins marrying) is only counted once.
+        """
+        return self.__count(self.order(), self.__parents, self.__children)
+
+    def descendant_counts(self):
+        """ Return a list of how many different descendants each person has in the tree,
+        worked out in one pass up the generations, as for ancestor_counts()
+        """
+        return self.__count(reversed(self.order()), self.__children, self.__parents)
+
+    def __count(self, order, relations, inverse):
+        """ Count everyone reachable through relations, going through people in order
+
+        The people reachable from someone are only kept until everyone they
+        are needed for (their inverse relations) has been through, so only
+        those of a generation or two are held at once.  They are kept as a set
+        while there are few of them, as in most trees, and as the bits of an
+        int (bit n for person n) once a set would take more memory than that:
+        where ancestors turn up on many lines, everyone can reach a good part
+        of the tree, and the ints are merged a machine word at a time.
+        """
+        size = self.size()
+        dense = max(size // (8 * SET_BYTES), 1)
+        counts = [0] * size
+        reached = {}
+        waiting = array('i', [inverse.count(n) for n in range(size)])
+        for n in order:
+            found = set()
+            bits = 0
+            for other in relations.of(n):
+                others = reached[other]
+                if isinstance(others, set):
+                    found.update(others)
+                else:
+                    bits |= others
+                found.add(other)
+                waiting[other] -= 1
+                if waiting[other] == 0:
+                    del reached[other]
+            if bits:
+                found = bits | _bits(found)
+                counts[n] = bin(found).count('1')
+            else:
+                counts[n] = len(found)
+                if len(found) > dense:
+                    found = _bits(found)
+            if waiting[n]:
+                reached[n] = found
+        return counts
+
+    def write(self, out):
+        """ Write the arrays to an open file as JSON: the pointers, and the offsets and
+        targets of the parents, children and spouses
+        """
+        arrays = {'pointers': self.__pointers}
+        for (name, relations) in (('parents', self.__parents), ('children', self.__children),
+                                  ('spouses', self.__spouses)):
+            arrays[name] = {'offsets': relations.offsets().tolist(), 'targets': relations.targets().tolist()}
+        json.dump(arrays, out, separators=(',', ':'))
+
+
+def _bits(people):
+    """ Return a set of people as an int with bit n set for person n """
+    if not people:
+        return 0
+    raw = bytearray(max(people) // 8 + 1)
+    for n in people:
+        raw[n >> 3] |= 1 << (n & 7)
+    raw.reverse()
+    return int(binascii.hexlify(raw), 16)
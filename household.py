@@ -0,0 +1,155 @@
+#
+# Reverse fingerprints: which families in the tree fit a census household?
+#
+# A census household gives the ages of the head, their spouse and their
+# children in one census year.  HouseholdIndex keeps, for every family in the
+# tree, the birth and final years of the husband, wife and children, bucketed by
+# birth year.  A query only looks at the families with someone born in the
+# right few years, and ranks them by how well everybody else fits.
+#
+
+
+class HouseholdIndex:
+    """ Birth years of the members of every family, for matching census households """
+
+    def __init__(self, gedcom):
+        # Per family: (family element, parents, children), where each member is
+        # a tuple (element, birth year, final year)
+        self.__families = []
+        # Birth year -> numbers of the families with a parent born that year
+        self.__parents = {}
+        # Birth year -> numbers of the families with a child born that year
+        self.__children = {}
+        for element in gedcom.element_list():
+            if not element.is_family():
+                continue
+            number = len(self.__families)
+            parents = [_member(e) for e in gedcom.get_family_members(element, "PARENTS")]
+            children = [_member(e) for e in gedcom.get_family_members(element, "CHIL")]
+            self.__families.append((element, parents, children))
+            for (person, birth, final) in parents:
+                if birth is not None:
+                    self.__parents.setdefault(birth, []).append(number)
+            for (person, birth, final) in children:
+                if birth is not None:
+                    self.__children.setdefault(birth, []).append(number)
+
+    def match(self, year, head=None, spouse=None, children=(), tolerance=2, limit=20):
+        """ Return the families that best fit a household in a census year
+
+        head and spouse are ages, or None if not known; children is a list of
+        ages.  An age fits a person born within tolerance years of it.  Returns
+        up to limit dicts, best first, with keys:
+            family   - the FAM element
+            score    - 0 to 1: how well the whole household fits
+            matched  - how many of the given people found a fit
+            members  - list of (role, age, element or None) for the given people
+        """
+        children = [age for age in children if age is not None]
+        if head is None and spouse is None and not children:
+            return []
+
+        # Only families with someone born in the right years for the first
+        # known person can fit at all
+        if head is not None:
+            candidates = self.__near(self.__parents, year - head, tolerance)
+        elif spouse is not None:
+            candidates = self.__near(self.__parents, year - spouse, tolerance)
+        else:
+            candidates = self.__near(self.__children, year - children[0], tolerance)
+
+        wanted = (head is not None) + (spouse is not None) + len(children)
+        results = []
+        for number in candidates:
+            family, parents, kids = self.__families[number]
+            score, members = _fit_parents(year, head, spouse, parents, tolerance)
+            child_score, child_members = _fit_children(year, children, kids, tolerance)
+            score += child_score
+            members.extend(child_members)
+            matched = len([m for m in members if m[2] is not None])
+            results.append({
+                'family': family,
+                'score': score / wanted,
+                'matched': matched,
+                'members': members
+            })
+
+        results.sort(key=lambda result: (-result['score'], -result['matched']))
+        return results[:limit]
+
+    def __near(self, buckets, birth, tolerance):
+        """ Return the set of family numbers in the buckets within tolerance of a birth year """
+        found = set()
+        for year in range(birth - tolerance, birth + tolerance + 1):
+            found.update(buckets.get(year, ()))
+        return found
+
+
+def _member(element):
+    """ Return (element, birth year, final year) for a family member; years may be None """
+    birth = element.birth_year()
+    death = element.death_year()
+    return (element,
+            birth if birth >= 0 else None,
+            death if death >= 0 else None)
+
+
+def _fit(year, age, member, tolerance):
+    """ Score 0 to 1 for how well a person fits an age in a census year """
+    (element, birth, final) = member
+    if birth is None:
+        return 0.0
+    if final is not None and final < year:
+        # Already dead
+        return 0.0
+    miss = abs((year - birth) - age)
+    if miss > tolerance:
+        return 0.0
+    return 1.0 - float(miss) / (tolerance + 1)
+
+
+def _fit_parents(year, head, spouse, parents, tolerance):
+    """ Fit the head and spouse to the parents of a family, whichever way round fits best """
+    best = (0.0, [])
+    orders = [parents, list(reversed(parents))] if len(parents) == 2 else [parents]
+    for order in orders:
+        score = 0.0
+        members = []
+        for (role, age, member) in zip(('head', 'spouse'), (head, spouse), order + [None, None]):
+            if age is None:
+                continue
+            fit = _fit(year, age, member, tolerance) if member is not None else 0.0
+            score += fit
+            members.append((role, age, member[0] if fit > 0 else None))
+        if score > best[0] or not best[1]:
+            best = (score, members)
+    return best
+
+
+def _fit_children(year, ages, kids, tolerance):
+    """ Fit each child's age to a different child of the family, closest first """
+    score = 0.0
+    members = []
+    unused = list(kids)
+    for age in ages:
+        best = None
+        best_fit = 0.0
+        for kid in unused:
+            fit = _fit(year, age, kid, tolerance)
+            if fit > best_fit:
+                best = kid
+                best_fit = fit
+        if best is not None:
+            unused.remove(best)
+        score += best_fit
+        members.append(('child', age, best[0] if best is not None else None))
+    return (score, members)
+
+
+def parse_ages(text):
+    """ Parse a comma separated list of ages, where a blank age is unknown (None) """
+    ages = []
+    for age in text.split(','):
+        age = age.strip()
+        ages.append(int(age) if age else None)
+    return ages
@@ -0,0 +1,212 @@
+#
+# How closely related are two people?
+#
+# The kinship coefficient of two people is the chance that a gene picked at
+# random from each is the same one, inherited from a common ancestor: 1/4 for
+# a parent and child or full siblings, 1/16 for first cousins, and so on.
+# Twice that is the coefficient of relationship (1/2 for siblings).  It comes
+# from the usual recursion: with the people numbered so that parents come
+# before their children (Graph.order()), the kinship of a and b, where b is
+# not a descendant of a, is the average of the kinship of b with each of a's
+# parents.  Every value worked out is remembered, so a batch of pairs from
+# the same family shares most of the work.
+#
+# The nearest common ancestors are those the fewest generations up from
+# the two people together; how many generations up from each names the
+# relationship (1 and 1 are siblings, 2 and 3 are first cousins once removed).
+#
+# A batch can be spread over several processes, each with its own memory of
+# the values it has worked out.
+#
+
+from multiprocessing import Pool
+from graph import Graph
+
+_ORDINALS = {1: "1st", 2: "2nd", 3: "3rd"}
+_TIMES = {1: "once", 2: "twice"}
+
+# The Kinship of the tree, for the worker processes, which get it by forking
+_kinship = None
+
+
+class Kinship:
+    """ Kinship coefficients and common ancestors of the people in a Graph """
+
+    def __init__(self, graph):
+        self.__graph = graph
+        # Position in the order parents come before children
+        self.__rank = {}
+        for (rank, n) in enumerate(graph.order()):
+            self.__rank[n] = rank
+        # (earlier, later) -> kinship coefficient
+        self.__coefficients = {}
+        # Person -> {ancestor: generations up}
+        self.__ancestors = {}
+
+    def graph(self):
+        """ Return the Graph the people are numbered in """
+        return self.__graph
+
+    def coefficient(self, a, b):
+        """ Return the kinship coefficient of two people, by number (0 if they aren't related) """
+        if a not in self.__rank or b not in self.__rank:
+            # In a loop of parents
+            return 0.0
+        # Work from the later of the two, whose parents can't include the other's descendants
+        if self.__rank[a] < self.__rank[b]:
+            (a, b) = (b, a)
+        key = (a, b)
+        found = self.__coefficients.get(key)
+        if found is not None:
+            return found
+
+        parents = self.__graph.parents().of(a)[:2]
+        if a == b:
+            coefficient = 0.5
+            if len(parents) == 2:
+                coefficient += 0.5 * self.coefficient(parents[0], parents[1])
+        else:
+            coefficient = sum([0.5 * self.coefficient(parent, b) for parent in parents])
+        self.__coefficients[key] = coefficient
+        return coefficient
+
+    def common_ancestors(self, a, b):
+        """ Return the nearest common ancestors of two people, by number, as a list of
+        (ancestor, generations up from a, generations up from b).  Someone who is
+        the other's ancestor counts, 0 generations up from themself.
+        """
+        up_a = self.__ancestors_of(a)
+        up_b = self.__ancestors_of(b)
+        common = [(ancestor, up_a[ancestor], up_b[ancestor]) for ancestor in up_a if ancestor in up_b]
+        if not common:
+            return []
+        nearest = min([ups + downs for (ancestor, ups, downs) in common])
+        return sorted([found for found in common if found[1] + found[2] == nearest], key=lambda found: found[1])
+
+    def __ancestors_of(self, n):
+        """ Return {ancestor: fewest generations up} for a person, including themself at 0 """
+        found = self.__ancestors.get(n)
+        if found is not None:
+            return found
+        found = {n: 0}
+        generation = [n]
+        parents = self.__graph.parents()
+        up = 0
+        while generation:
+            up += 1
+            above = []
+            for person in generation:
+                for parent in parents.of(person):
+                    if parent not in found:
+                        found[parent] = up
+                        above.append(parent)
+            generation = above
+        self.__ancestors[n] = found
+        return found
+
+
+def relate(tree, pairs, processes=1):
+    """ Work out how each pair of people in a tree are related
+
+    pairs is a list of (pointer, pointer).  Returns a list of dicts, in the
+    same order, with keys:
+        first, second  - the pointers
+        kinship        - kinship coefficient, 0 to 1 (None if a pointer isn't a person)
+        relatedness    - coefficient of relationship, twice the kinship
+        common         - nearest common ancestors, as (pointer, generations up from
+                         first, generations up from second)
+        relationship   - what the second is to the first, e.g. "1st cousin once removed"
+    """
+    global _kinship
+    _kinship = Kinship(Graph(tree))
+    if processes > 1 and len(pairs) > 1:
+        pool = Pool(processes)
+        try:
+            chunks = pool.map(_relate_pairs, [pairs[n::processes] for n in range(processes)])
+        finally:
+            pool.close()
+            pool.join()
+        # Put the chunks' results back in the order of the pairs
+        results = [None] * len(pairs)
+        for (n, chunk) in enumerate(chunks):
+            results[n::processes] = chunk
+        return results
+    return _relate_pairs(pairs)
+
+
+def read_pairs(lines):
+    """ Read pairs of pointers, two to a line (separated by spaces, tabs or commas), skipping blank lines and # comments """
+    pairs = []
+    for line in lines:
+        line = line.split('#')[0].replace(',', ' ').split()
+        if len(line) >= 2:
+            pairs.append((_pointer(line[0]), _pointer(line[1])))
+    return pairs
+
+
+def describe(up_first, up_second):
+    """ Name the relationship of someone up_second generations below a common ancestor
+    to someone up_first generations below it, e.g. (2, 3) is "1st cousin once removed"
+    """
+    if up_first == 0 and up_second == 0:
+        return "self"
+    if up_second == 0:
+        return _greats(up_first, "parent", "grandparent")
+    if up_first == 0:
+        return _greats(up_second, "child", "grandchild")
+    if up_first == 1 and up_second == 1:
+        return "sibling"
+    if up_first == 1:
+        return _greats(up_second - 1, "niece or nephew", "grandniece or grandnephew")
+    if up_second == 1:
+        return _greats(up_first - 1, "aunt or uncle", "great-aunt or great-uncle")
+    degree = min(up_first, up_second) - 1
+    removed = abs(up_first - up_second)
+    name = "{} cousin".format(_ORDINALS.get(degree, "{}th".format(degree)))
+    if removed:
+        name += " {} removed".format(_TIMES.get(removed, "{} times".format(removed)))
+    return name
+
+
+def _greats(generations, one, two):
+    """ one for 1 generation, two for 2, then great-two, great-great-two, ... """
+    if generations == 1:
+        return one
+    return "great-" * (generations - 2) + two
+
+
+def _pointer(text):
+    """ A pointer as written in the file, e.g. I12 or @I12@ -> @I12@ """
+    return text if text.startswith('@') else "@{}@".format(text)
+
+
+def _relate_pairs(pairs):
+    """ Relate a list of pairs of pointers using _kinship """
+    graph = _kinship.graph()
+    results = []
+    for (first, second) in pairs:
+        a = graph.index(first)
+        b = graph.index(second)
+        result = {'first': first, 'second': second, 'kinship': None, 'relatedness': None,
+                  'common': [], 'relationship': None}
+        if a is not None and b is not None:
+            coefficient = _kinship.coefficient(a, b)
+            common = _kinship.common_ancestors(a, b)
+            result['kinship'] = coefficient
+            result['relatedness'] = 2 * coefficient
+            result['common'] = [(graph.pointer(ancestor), up_a, up_b) for (ancestor, up_a, up_b) in common]
+            if common:
+                result['relationship'] = describe(common[0][1], common[0][2])
+                if result['relationship'] == "sibling" and _half_siblings(graph, a, b):
+                    result['relationship'] = "half sibling"
+        results.append(result)
+    return results
+
+
+def _half_siblings(graph, a, b):
+    """ Whether two siblings share only one parent, each having another parent the other
+    hasn't; a parent that isn't recorded isn't a different parent
+    """
+    parents_a = set(graph.parents().of(a))
+    parents_b = set(graph.parents().of(b))
+    return len(parents_a & parents_b) == 1 and bool(parents_a - parents_b) and bool(parents_b - parents_a)
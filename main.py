@@ -1,18 +1,45 @@
 import os
 import sys
-import glob
+import json
 import string
 import math
-from datetime import date
+from datetime import date, MINYEAR, MAXYEAR
 import argparse
-import re
 import cgi
-from gedcom import Gedcom
-from flask import Flask, request, jsonify, redirect, url_for
+import urllib
+import cProfile
+import dates
+import metrics
+import memory
+from trees import Tree, TreeCache, TreeLoading, TreeTooLarge, ged_files
+from watcher import UploadWatcher, READY, FAILED
+from household import parse_ages
+import serve
+import export
+import federated
+import duplicates
+import census
+import graph
+import kinship
+import completion
+import mapping
+import subset
+import diff
+from timeit import default_timer
+from flask import Flask, Response, request, jsonify, redirect, url_for, has_request_context, g
 
 # How wide do we print our dates?  4 characters for the year + 2 spaces = 6
 DATE_WIDTH = 6
 
+# The most generations up or down a fingerprint on the web can go
+MAX_GENERATIONS = 10
+
+# Between the columns of census schedules side by side
+SCHEDULE_SEPARATOR = "| "
+
+# The most pointers given with each name completion
+COMPLETION_POINTERS = 20
+
 
 app = Flask(__name__)
 
@@ -21,11 +48,38 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 app.config.update(
     DEBUG=True,
     ALLOWED_EXTENSIONS=set(['ged']),
-    PROPAGATE_EXCEPTIONS=True
+    PROPAGATE_EXCEPTIONS=True,
+    # Seconds a page waits for a GED file to be parsed before saying it's still indexing
+    PARSE_TIMEOUT=10,
+    # Watch the upload folder from a background thread, parsing files as they arrive
+    WATCH_UPLOADS=True
 )
 
 UPLOAD_PATH = "upload"
 
+# The GED file selection that searches every uploaded file at once
+ALL_FILES = "*"
+
+# Parsed GED files, shared by all requests and only reparsed when the file changes
+tree_cache = TreeCache()
+
+# The GED files in the upload folder, parsed as soon as they turn up
+upload_watcher = UploadWatcher(os.path.join(basedir, UPLOAD_PATH), tree_cache)
+
+@app.before_request
+def start_timer():
+    g.started = default_timer()
+
+@app.before_first_request
+def start_watcher():
+    if app.config['WATCH_UPLOADS']:
+        upload_watcher.start()
+
+@app.after_request
+def stop_timer(response):
+    metrics.observe('request_seconds', default_timer() - g.started)
+    return response
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1] in app.config['ALLOWED_EXTENSIONS']
@@ -34,15 +88,23 @@ def allowed_file(filename):
 @app.route("/")
 def root():
 
-    filepaths = glob.glob(os.path.join(basedir, "upload") + "/*.ged")
-
     ged_selector = ""
-    for filepath in filepaths:
-        filename = os.path.split(filepath)[1]
-        listname = os.path.splitext(filename)[0]
-        ged_selector += "<option value='{}'>{}</option>\n".format(filepath, listname)
+    for entry in upload_watcher.manifest():
+        if entry['status'] == READY:
+            listname = "{} ({:,} people)".format(entry['name'], entry['individuals'])
+        elif entry['status'] == FAILED:
+            ged_selector += "<option disabled>{} (can't be read)</option>\n".format(cgi.escape(entry['name']))
+            continue
+        else:
+            listname = "{} (still indexing)".format(entry['name'])
+        ged_selector += "<option value='{}'>{}</option>\n".format(cgi.escape(entry['filepath'], True), cgi.escape(listname))
 
-    parameters = {'gedfiles': ged_selector}
+    states = ""
+    for (name, (title, years)) in sorted(census.SCHEDULES.items(), key=lambda item: item[1][0]):
+        if name != 'uk':
+            states += "<option value='{}'>{} ({})</option>\n".format(name, title, ", ".join([str(year) for year in years]))
+
+    parameters = {'gedfiles': ged_selector, 'states': states}
 
     html = '''
 <!DOCTYPE html>
@@ -83,20 +145,142 @@ def root():
 <tr>
     <td>3:</td> <td>GED File:</td>
     <td><select name="gedFile">
+        <option value='*'>All files</option>
         {gedfiles}
     <select></td>
 </tr><tr>
-    <td>4:</td> <td>First Name</td> <td><input type="text" name="firstName" /></td>
+    <td/> <td>All files</td> <td><input type="checkbox" name="dedup" value="true" />Show someone found in several files once</td>
+</tr><tr>
+    <td>4:</td> <td>First Name</td> <td><input type="text" name="firstName" list="given-names" autocomplete="off" /></td>
+</tr><tr>
+    <td/> <td>Middle Name</td> <td><input type="text" name="middleName" list="given-names" autocomplete="off" /></td>
 </tr><tr>
-    <td/> <td>Middle Name</td> <td><input type="text" name="middleName" /></td>
+    <td/> <td>Last Name</td> <td><input type="text" name="lastName" list="surnames" autocomplete="off" /></td>
 </tr><tr>
-    <td/> <td>Last Name</td> <td><input type="text" name="lastName" /></td>
+    <td/> <td>Names</td> <td><input type="checkbox" name="fuzzy" value="true" />Sounds like (Soundex)</td>
+</tr><tr>
+    <td/> <td>Place</td> <td><input type="text" name="place" /> e.g. Taney, Missouri</td>
 </tr><tr>
     <td/> <td>5-year dates</td> <td><input type="checkbox" name="state" />State Census</td>
+</tr><tr>
+    <td/> <td>Censuses</td> <td><input type="checkbox" name="schedule" value="federal" />Federal
+                                 <input type="checkbox" name="schedule" value="state" />State
+                                 <input type="checkbox" name="schedule" value="uk" />UK<br/>
+                                 <select name="schedule">
+                                     <option value="">No state's own</option>
+                                     {states}
+                                 </select>
+                                 <input type="text" name="years" /> more years, e.g. 1882, 1887</td>
+</tr><tr>
+    <td/> <td>Generations</td> <td><input type="text" name="ancestors" value="1" size="2" /> up,
+                                   <input type="text" name="descendants" value="1" size="2" /> down</td>
 </tr><tr>
     <td>5:</td> <td></td> <td><input type="submit"/></td>
 </tr>
 </table>
+<datalist id="given-names"></datalist>
+<datalist id="surnames"></datalist>
+</form>
+</div>
+
+<script type="text/javascript">
+// Offer the names in the chosen file as they are typed
+function completeName(input, field, list) {{
+    input.addEventListener('input', function () {{
+        var words = input.value.split(' ');
+        var prefix = words.pop();
+        var request = new XMLHttpRequest();
+        request.open('GET', '/autocomplete?field=' + field + '&prefix=' + encodeURIComponent(prefix) +
+                     '&gedFile=' + encodeURIComponent(input.form.gedFile.value));
+        request.onload = function () {{
+            if (request.status != 200 || input.value.split(' ').pop() != prefix) {{
+                return;
+            }}
+            var options = document.getElementById(list);
+            options.innerHTML = '';
+            JSON.parse(request.responseText).completions.forEach(function (found) {{
+                var option = document.createElement('option');
+                option.value = words.concat([found.name]).join(' ');
+                option.label = found.count + (found.count == 1 ? ' person' : ' people');
+                options.appendChild(option);
+            }});
+        }};
+        request.send();
+    }});
+}}
+var form = document.forms[1];
+completeName(form.firstName, 'given', 'given-names');
+completeName(form.middleName, 'given', 'given-names');
+completeName(form.lastName, 'surname', 'surnames');
+</script>
+
+<br/>
+
+<div class="box">
+<h3>Or see everybody alive in a census year:</h3>
+<form action="/snapshot" method="get">
+<table border="0">
+<tr>
+    <td>GED File:</td>
+    <td><select name="gedFile">
+        {gedfiles}
+    <select></td>
+</tr><tr>
+    <td>Year</td> <td><input type="text" name="year" /> <input type="checkbox" name="state" value="true" />State Census</td>
+</tr><tr>
+    <td></td> <td><input type="submit"/></td>
+</tr>
+</table>
+</form>
+</div>
+
+<br/>
+
+<div class="box">
+<h3>Or see who was somewhere during some years:</h3>
+<form action="/events" method="get">
+<table border="0">
+<tr>
+    <td>GED File:</td>
+    <td><select name="gedFile">
+        {gedfiles}
+    <select></td>
+</tr><tr>
+    <td>Place</td> <td><input type="text" name="place" /> e.g. Cedar Creek, Taney</td>
+</tr><tr>
+    <td>Years</td> <td><input type="text" name="years" /> e.g. 1890-1910</td>
+</tr><tr>
+    <td></td> <td><input type="submit"/></td>
+</tr>
+</table>
+</form>
+</div>
+
+<br/>
+
+<div class="box">
+<h3>Or find the families that fit a census household:</h3>
+<form action="/household" method="get">
+<table border="0">
+<tr>
+    <td>GED File:</td>
+    <td><select name="gedFile">
+        {gedfiles}
+    <select></td>
+</tr><tr>
+    <td>Census year</td> <td><input type="text" name="year" /></td>
+</tr><tr>
+    <td>Age of head</td> <td><input type="text" name="head" /></td>
+</tr><tr>
+    <td>Age of spouse</td> <td><input type="text" name="spouse" /></td>
+</tr><tr>
+    <td>Ages of children</td> <td><input type="text" name="children" /> e.g. 12, 9, 4</td>
+</tr><tr>
+    <td>Give or take</td> <td><input type="text" name="tolerance" value="2" /> years</td>
+</tr><tr>
+    <td></td> <td><input type="submit"/></td>
+</tr>
+</table>
 </form>
 </div>
 
@@ -117,12 +301,47 @@ def upload():
         filepath = os.path.join(updir, filename)
         f.save(filepath)
 
+        # Start parsing it now, so it's ready by the time someone asks for it
+        upload_watcher.scan()
+
         return redirect('/')
 
     else:
         app.logger.info('ext name error')
         return jsonify(error='Error uploading file... back up and try again.')
 
+@app.errorhandler(TreeLoading)
+def still_loading(e):
+    html = '''
+<!DOCTYPE html>
+
+<meta charset="utf-8">
+<html>
+<head>
+<title>Fingerprint</title>
+<meta http-equiv="refresh" content="5">
+<link rel="stylesheet" href="/static/fingerprint.css">
+</head>
+
+<body>
+
+<h1>GEDcom Fingerprint : <a href="/">Home</a></h1>
+
+<div class="box">
+<h3>Still indexing {}</h3>
+<p>This is a big file, and it's still being read.  This page will try again in a few seconds.</p>
+</div>
+
+</body>
+</html>
+'''.format(cgi.escape(os.path.basename(e.filepath)))
+
+    return html, 503, {'Retry-After': '5'}
+
+@app.errorhandler(TreeTooLarge)
+def too_large(e):
+    return '{} is too big for this server... ask whoever runs it for a bigger memory budget.'.format(cgi.escape(os.path.basename(e.filepath))), 503
+
 @app.route("/fingerprint", methods=["POST"])
 def post_fingerprint():
     form = request.form
@@ -132,12 +351,22 @@ def post_fingerprint():
         "lastName": u"",
         "middleName": u"",
         "state": False,
+        "fuzzy": False,
+        "place": u"",
+        "dedup": False,
+        "ancestors": u"1",
+        "descendants": u"1",
         "gedFile": u""
     }
     for key,value in form.iteritems():
         args[key] = value
     # args.update(form)
-    target = "/fingerprint?first={firstName}&middle={middleName}&last={lastName}&state={state}&gedFile={gedFile}".format(**args)
+    target = "/fingerprint?first={firstName}&middle={middleName}&last={lastName}&state={state}&fuzzy={fuzzy}&place={place}&dedup={dedup}&ancestors={ancestors}&descendants={descendants}&gedFile={gedFile}".format(**args)
+    # Census schedules can be picked more than once, and custom years added to them
+    schedules = [spec for spec in form.getlist("schedule") if spec.strip()]
+    if form.get("years", u"").strip():
+        schedules.append(form.get("years"))
+    target += _schedule_query(schedules)
     return redirect(target)
 
 @app.route("/fingerprint", methods=["GET"])
@@ -145,10 +374,12 @@ def get_fingerprint():
 
     args = request.args
 
-    (gedcom, criteria, offset) = _get_data(args)
+    (matches, problems, offset) = _get_data(args)
+    (ancestors, descendants) = _generations(args)
+    schedules = _schedules(args)
 
     # **args keeps filling in array of string size 1, and not the string itself.  FAIL!
-    target = "/map?first={}&middle={}&last={}&state={}&gedFile={}".format(cgi.escape(args['first'], True), cgi.escape(args['middle'], True), cgi.escape(args['last'], True), args.get('state', False), args['gedFile'])
+    target = "/map?first={}&middle={}&last={}&state={}&fuzzy={}&place={}&dedup={}&ancestors={}&descendants={}&gedFile={}{}".format(cgi.escape(_utf8(args['first']), True), cgi.escape(_utf8(args['middle']), True), cgi.escape(_utf8(args['last']), True), args.get('state', False), args.get('fuzzy', False), cgi.escape(_utf8(args.get('place', '')), True), args.get('dedup', False), ancestors, descendants, cgi.escape(_utf8(args['gedFile']), True), cgi.escape(_schedule_query(schedules), True))
     html = '''
 <!DOCTYPE html>
 
@@ -166,11 +397,19 @@ def get_fingerprint():
 
 '''.format(target)
 
-    # Look at EVERYONE
-    for element in gedcom.element_list():
-        # Do they match?
-        if element.criteria_match(criteria):
-            data = fingerprint_data(gedcom, element, offset)
+    if problems:
+        html += '<div class="box">Not searched: {}</div>\n'.format(
+            ", ".join(["{} ({})".format(cgi.escape(os.path.basename(filepath)), cgi.escape(reason)) for (filepath, reason) in problems]))
+
+    # Everyone who matches
+    for match in matches:
+        with metrics.timed('fingerprint_data_seconds'):
+            data = fingerprint_data(match['tree'].gedcom(), match['element'], offset, ancestors, descendants, schedules)
+        if args.get('gedFile') == ALL_FILES:
+            data['sources'] = federated.source_names(match)
+        data['extract'] = "/extract?gedFile={}&pointer={}&ancestors={}&descendants={}".format(
+            urllib.quote_plus(match['tree'].filepath()), urllib.quote_plus(data['pointer']), ancestors, descendants)
+        with metrics.timed('render_seconds'):
             html += table_fingerprint(data)
 
     html += '''
@@ -185,35 +424,25 @@ def map_fingerprint():
 
     args = request.args
 
-    (gedcom, criteria, offset) = _get_data(args)
+    (matches, problems, offset) = _get_data(args)
+    (ancestors, descendants) = _generations(args)
+    schedules = _schedules(args)
 
-    target = "/fingerprint?first={}&middle={}&last={}&state={}&gedFile={}".format(cgi.escape(args['first'], True), cgi.escape(args['middle'], True), cgi.escape(args['last'], True), args.get('state', False), args['gedFile'])
+    target = "/fingerprint?first={}&middle={}&last={}&state={}&fuzzy={}&place={}&dedup={}&ancestors={}&descendants={}&gedFile={}{}".format(cgi.escape(_utf8(args['first']), True), cgi.escape(_utf8(args['middle']), True), cgi.escape(_utf8(args['last']), True), args.get('state', False), args.get('fuzzy', False), cgi.escape(_utf8(args.get('place', '')), True), args.get('dedup', False), ancestors, descendants, cgi.escape(_utf8(args['gedFile']), True), cgi.escape(_schedule_query(schedules), True))
 
-    address = []
-    event = []
-    date = []
-    try:
-        for element in gedcom.element_list():
-            # Do they match?
-            if element.criteria_match(criteria):
-                # A match, fingerprint them
-                data = fingerprint_data(gedcom, element, offset)
-                locations = data.get('locations')
-                for location in locations:
-                    where = location[2]
-                    if where:
-                        what = location[0]
-                        when = location[1]
-                        address.append(where)
-                        event.append(what)
-                        date.append(when)
-    except Exception as e:
-        print e
-        pass
-
-    address_field = 'addresses = ["' + string.join(address, '","') + '"]\n'
-    event_field = 'events = ["' + string.join(event, '","') + '"]\n'
-    date_field = 'dates = ["' + string.join(date, '","') + '"]\n'
+    # Only the places of each match are needed, not their whole fingerprint
+    people = []
+    for match in matches:
+        try:
+            people.append(fingerprint_locations(match['tree'].gedcom(), match['element']))
+        except Exception:
+            # One person's bad data shouldn't lose everybody else's places
+            app.logger.exception("Can't map %s in %s", match['element'].pointer(), match['tree'].filepath())
+    (markers, moves) = mapping.aggregate(people)
+
+    # json.dumps escapes the quotes; no closing tag may be spelled out inside the script either
+    markers_field = 'markers = ' + json.dumps(markers).replace('</', '<\\/') + '\n'
+    moves_field = 'moves = ' + json.dumps(moves) + '\n'
 
     html = '''
 <!DOCTYPE html>
@@ -237,10 +466,9 @@ def map_fingerprint():
 var geocoder;
 var map;
 var bounds;
-var coords;
-var path;
+var positions;
 
-'''.format(target) + address_field + event_field + date_field + '''
+'''.format(target) + markers_field + moves_field + '''
 
 
 function initMap() {
@@ -252,54 +480,55 @@ function initMap() {
         zoom: 10
     });
 
-
-    coords = [];
-    for (var i=0; i<addresses.length; ++i) {
-        coords.push(new google.maps.LatLng(0,0));
-    }
-    path = new google.maps.Polyline({
-        path: coords,
-        geodesic: false,
-        strokeColor: '#FF0000',
-        strokeOpacity: 1.0,
-        strokeWeight: 2
-    });
-    path.setMap(map);
-
-    for (var i=0; i<addresses.length; ++i) {
-
-        setTimeout(codeAddress, 100*i, i, addresses[i], events[i], dates[i]);
+    positions = [];
+    for (var i=0; i<markers.length; ++i) {
+        positions.push(null);
+        setTimeout(codeAddress, 100*i, i, markers[i]);
     }
 }
 
-function codeAddress(idx, address, event, date) {
+function codeAddress(idx, marker) {
 
-    geocoder.geocode( { 'address': address}, function(results, status) {
+    geocoder.geocode( { 'address': marker.place}, function(results, status) {
 
       if (status == google.maps.GeocoderStatus.OK) {
 
-        // map.setCenter(results[0].geometry.location);
-
-        var wobble = 0.001;
-        var angle = (3.1415926 * 2.0 * idx) / 7.0;
-
         var pos = results[0].geometry.location;
         bounds.extend(pos);
         map.setCenter(bounds.getCenter());
         map.fitBounds(bounds);
-
-        coords[idx] = pos;
-        path.setPath(coords);
-
-        var newLat = pos.lat() + (Math.cos(angle) *  wobble);
-        var newLng = pos.lng() + (Math.sin(angle) *  wobble);
-
-        var marker = new google.maps.Marker({
+        positions[idx] = pos;
+
+        var events = [];
+        for (var event in marker.events) {
+            events.push(event + (marker.events[event] > 1 ? ' x' + marker.events[event] : ''));
+        }
+        var years = '';
+        if (marker.first != null) {
+            years = ', ' + marker.first + (marker.last != marker.first ? '-' + marker.last : '');
+        }
+
+        var placed = new google.maps.Marker({
             map: map,
-            position: new google.maps.LatLng(newLat, newLng),
-            label: event,
-            title: event + ', ' + date + ' @ ' + address
+            position: pos,
+            label: marker.count > 1 ? String(marker.count) : events[0],
+            title: events.join(', ') + years + ' @ ' + marker.place
         });
+
+        // Draw the moves to and from here whose other end is already on the map
+        for (var m=0; m<moves.length; ++m) {
+            var move = moves[m];
+            if ((move[0] == idx || move[1] == idx) && positions[move[0]] && positions[move[1]]) {
+                var path = new google.maps.Polyline({
+                    map: map,
+                    path: [positions[move[0]], positions[move[1]]],
+                    geodesic: false,
+                    strokeColor: '#FF0000',
+                    strokeOpacity: 1.0,
+                    strokeWeight: Math.min(1 + move[2], 8)
+                });
+            }
+        }
       } else {
         alert("Geocode was not successful for the following reason: " + status);
       }
@@ -319,25 +548,359 @@ function codeAddress(idx, address, event, date) {
     return html
 
 
-def _get_data(args):
+@app.route("/autocomplete", methods=["GET"])
+def get_autocomplete():
+    # Called on every keystroke, so a file that isn't parsed yet is left out rather than waited for
+    args = request.args
+    field = args.get('field', 'given')
+    prefix = args.get('prefix', '').strip()
+    try:
+        limit = _optional_int(args.get('limit')) or completion.TOP_COMPLETIONS
+    except ValueError:
+        limit = completion.TOP_COMPLETIONS
+    limit = max(1, min(limit, completion.TOP_COMPLETIONS))
+    if args.get('gedFile') == ALL_FILES:
+        filepaths = [entry['filepath'] for entry in upload_watcher.manifest() if entry['status'] == READY]
+    else:
+        filepaths = [args.get('gedFile')]
+
+    # Name, folded -> {'name', 'count', 'pointers': {file name: pointers}}
+    found = {}
+    loading = []
+    for filepath in filepaths:
+        try:
+            tree = tree_cache.get(filepath, 0)
+        except TreeLoading:
+            loading.append(filepath)
+            continue
+        except TreeTooLarge:
+            continue
+        completions = tree.completions()
+        lookup = completions.surname if field == 'surname' else completions.given
+        individuals = tree.individuals()
+        source = os.path.splitext(os.path.basename(filepath))[0]
+        for (name, positions) in lookup(prefix, limit) if prefix else []:
+            entry = found.setdefault(completion.fold(name), {'name': name, 'count': 0, 'pointers': {}})
+            entry['count'] += len(positions)
+            entry['pointers'][source] = [individuals[position].pointer() for position in positions[:COMPLETION_POINTERS]]
+
+    completions = sorted(found.values(), key=lambda entry: (-entry['count'], completion.fold(entry['name'])))[:limit]
+    body = json.dumps({'field': field, 'prefix': prefix, 'completions': completions,
+                       'loading': [os.path.basename(filepath) for filepath in loading]})
+    return Response(body, mimetype='application/json')
+
+
+@app.route("/extract", methods=["GET"])
+def get_extract():
+    # A GED file of one person's family, to download
+    args = request.args
+    (ancestors, descendants) = _generations(args)
+    tree = tree_cache.get(args.get('gedFile'), app.config['PARSE_TIMEOUT'])
+    gedcom = tree.gedcom()
+    target = gedcom.element_dict().get(args.get('pointer'))
+    if target is None or not target.is_individual():
+        return 'There is nobody with that pointer in the file... back up and try again.', 404
+    records = subset.extract(gedcom, [target], ancestors, descendants)
+    filename = "{}.ged".format(target.pointer().strip('@'))
+    return Response(subset.blocks(gedcom, records), mimetype='text/plain',
+                    headers={'Content-Disposition': 'attachment; filename={}'.format(filename)})
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    # Prometheus text format.  Under --workers this is whichever worker took the request.
+    return metrics.registry.prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+@app.route("/admin/memory", methods=["GET"])
+def get_memory():
+    # Walking every object is slow on big trees; ?sample=50 looks at one element in 50 instead
+    sample = _optional_int(request.args.get('sample')) or 1
+    report = ["Process RSS: {}".format(memory.megabytes(memory.rss())),
+              "Memory budget: {}".format(memory.megabytes(tree_cache.budget()) if tree_cache.budget() else "none"),
+              ""]
+    for tree in sorted(tree_cache.trees(), key=lambda tree: tree.filepath()):
+        report.extend(memory.report(tree, memory.account(tree, sample)))
+        report.append("")
+    return "\n".join(report), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+@app.route("/snapshot", methods=["GET"])
+def get_snapshot():
+
+    args = request.args
+    tree = tree_cache.get(args.get('gedFile'), app.config['PARSE_TIMEOUT'])
+    offset = 5 if string.lower(args.get('state', "False")) == 'true' else 0
+    try:
+        year = census.census_year(int(args.get('year')), offset)
+    except (TypeError, ValueError):
+        return 'The census year must be a number... back up and try again.', 400
+    rows = census.snapshot(tree, year)
+
+    # Streamed, so the first rows go out before the last are worked out
+    if args.get('format') == 'json':
+        return Response(export.jsonl_lines(rows), mimetype='application/x-ndjson')
+
+    def html():
+        yield '''
+<!DOCTYPE html>
+
+<meta charset="utf-8">
+<html>
+<head>
+<title>Census {}</title>
+<link rel="stylesheet" href="/static/fingerprint.css">
+</head>
+
+<body>
+
+<h1>GEDcom Fingerprint : <a href="/">Home</a></h1>
+
+<div class="box">
+<table>
+<tr><th colspan=5>Alive in {}</th></tr>
+<tr><th>Age</th><th>Name</th><th>Household</th><th>As</th><th>Residence</th></tr>
+'''.format(year, year)
+        for row in rows:
+            yield "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>\n".format(
+                row['age'], cgi.escape(row['name']), row['household'] or '', row['role'] or '', cgi.escape(row['residence'] or ''))
+        yield '''
+</table>
+</div>
+</body>
+</html>
+'''
+
+    return Response(html(), mimetype='text/html')
+
+@app.route("/events", methods=["GET"])
+def get_events():
+
+    args = request.args
+    tree = tree_cache.get(args.get('gedFile'), app.config['PARSE_TIMEOUT'])
+    # UTF-8, as the tree's values are
+    place = _utf8(args.get('place', '')).strip()
+    if not place:
+        return 'Which place?  Back up and fill it in.', 400
+    try:
+        (first, last) = _year_range(_utf8(args.get('years', '')))
+    except ValueError as e:
+        return '{}... back up and try again.'.format(cgi.escape(str(e))), 400
+    # Worked out before anything is sent, so a problem is an error page, not a page cut off
+    rows = list(event_rows(tree, place, first, last))
+
+    if args.get('format') == 'json':
+        return Response(export.jsonl_lines(rows), mimetype='application/x-ndjson')
+
+    header = '''
+<!DOCTYPE html>
+
+<meta charset="utf-8">
+<html>
+<head>
+<title>Events</title>
+<link rel="stylesheet" href="/static/fingerprint.css">
+</head>
+
+<body>
+
+<h1>GEDcom Fingerprint : <a href="/">Home</a></h1>
+
+<div class="box">
+<table>
+<tr><th colspan=4>{} from {} to {}</th></tr>
+<tr><th>Person</th><th>Event</th><th>Years</th><th>Place</th></tr>
+'''.format(cgi.escape(place), first, last)
+
+    def html():
+        yield header
+        for row in rows:
+            for (number, event) in enumerate(row['events']):
+                person = "{} ({})".format(cgi.escape(row['name']), row['birth'] or "?") if number == 0 else ""
+                yield "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>\n".format(
+                    person, event['event'], event['years'], cgi.escape(event['place']))
+        yield '''
+</table>
+</div>
+</body>
+</html>
+'''
+
+    return Response(html(), mimetype='text/html')
+
+@app.route("/household", methods=["GET"])
+def get_household():
+
+    args = request.args
+
+    tree = tree_cache.get(args.get('gedFile'), app.config['PARSE_TIMEOUT'])
+    try:
+        year = int(args.get('year'))
+        head = _optional_int(args.get('head'))
+        spouse = _optional_int(args.get('spouse'))
+        children = parse_ages(args.get('children', ''))
+        tolerance = _optional_int(args.get('tolerance')) or 0
+    except (TypeError, ValueError):
+        return 'The census year and ages must be numbers... back up and try again.', 400
+
+    results = tree.households().match(year, head, spouse, children, tolerance)
+
+    rows = []
+    for result in results:
+        members = []
+        for (role, age, element) in result['members']:
+            if element is None:
+                members.append("{} {}: <i>no match</i>".format(role, age))
+            else:
+                members.append("{} {}: {}".format(role, age, _fingerprint_link(element, args.get('gedFile'))))
+        rows.append("<tr><td>{:.2f}</td><td>{}</td><td>{}</td></tr>".format(result['score'], result['family'].pointer(), "<br/>".join(members)))
+
+    html = '''
+<!DOCTYPE html>
+
+<meta charset="utf-8">
+<html>
+<head>
+<title>Fingerprint</title>
+<link rel="stylesheet" href="/static/fingerprint.css">
+</head>
+
+<body>
+
+<h1>GEDcom Fingerprint : <a href="/">Home</a></h1>
+
+<div class="box">
+<table>
+<tr><th colspan=3>Families fitting the {} household</th></tr>
+<tr><th>Score</th><th>Family</th><th>Members</th></tr>
+{}
+</table>
+</div>
+
+</body>
+</html>
+'''.format(year, "\n".join(rows))
+
+    return html
+
+def _generations(args):
+    '''The generations of ancestors and descendants asked for, from 1 (parents and children) up to MAX_GENERATIONS'''
+    generations = []
+    for key in ('ancestors', 'descendants'):
+        try:
+            count = _optional_int(args.get(key))
+        except ValueError:
+            count = None
+        generations.append(min(max(count or 1, 1), MAX_GENERATIONS))
+    return tuple(generations)
+
+def _schedules(args):
+    '''The census schedules asked for (see census.schedule()), leaving out any that aren't known'''
+    schedules = []
+    for spec in args.getlist('schedule'):
+        try:
+            census.schedule(spec, 0, 0)
+        except ValueError:
+            continue
+        schedules.append(spec)
+    return schedules
+
+def _schedule_arg(spec):
+    '''Check a --schedule on the command line (see census.schedule())'''
+    try:
+        census.schedule(spec, 0, 0)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+def _schedule_query(schedules):
+    '''The census schedules as URL query parameters'''
+    return "".join(["&schedule={}".format(urllib.quote_plus(spec.encode('utf-8'))) for spec in schedules])
+
+def _year_range(text):
+    '''Read years such as "1890-1910", or a single year, as (first, last); raises ValueError'''
+    (first, _, last) = text.replace(' ', '').partition('-')
+    if not first.isdigit() or not (last.isdigit() or not last):
+        raise ValueError("The years {} should be a year or two years such as 1890-1910".format(text))
+    first = int(first)
+    last = int(last) if last else first
+    if last < first:
+        raise ValueError("The years {} are the wrong way round".format(text))
+    if first < MINYEAR or last > MAXYEAR:
+        raise ValueError("The years {} must be from {} to {}".format(text, MINYEAR, MAXYEAR))
+    return (first, last)
+
+def _event_years(span):
+    '''The years of an event's date, e.g. "1917-1918", or "1900"'''
+    (first, last) = (dates.first_year(span), dates.last_year(span))
+    if first is None or last is None:
+        return str(dates.year(span) or '')
+    return str(first) if first == last else "{}-{}".format(first, last)
+
+def event_rows(tree, place, first, last):
+    '''Yield a dict for each person with an event in a place during some years, with:
+        pointer, name, birth   - of the person
+        events                 - a list of {'event', 'years', 'place'}, in date order
+    '''
+    for (individual, events) in tree.events(place, first, last):
+        yield {
+            'pointer': individual.pointer(),
+            'name': all_names(individual),
+            'birth': individual.birth_year() if individual.birth_year() >= 0 else None,
+            'events': [{'event': tag, 'years': _event_years(span), 'place': written} for (tag, span, written) in events]
+        }
+
+def _utf8(text):
+    '''Return text from a form (unicode) as UTF-8, as the values of a tree are; None stays None'''
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+def _optional_int(text):
+    '''Convert a form field to an integer, or None if it was left blank'''
+    if text is None or not text.strip():
+        return None
+    return int(text)
+
+def _fingerprint_link(element, gedfile):
+    '''An HTML link to the fingerprint of a person'''
+    name = element.name()
+    firstmiddle = string.split(name[0], maxsplit=1) + ['', '']
+    link = "/fingerprint?first={}&middle={}&last={}&gedFile={}".format(firstmiddle[0], firstmiddle[1], name[1], gedfile)
+    return "<a href='{}'>{}</a> ({})".format(cgi.escape(link, True), cgi.escape(string.join(name, ' ')), element.birth_year())
+
+def build_criteria(first, middle, last, fuzzy=False, place=None):
+    '''Build the matching criteria, as defined in gedcom.py criteria_match(), for a name
+
+    :param fuzzy: match names that sound the same (Soundex) rather than containing the given text
+    :param place: only match people with an event in this place, e.g. "Taney, Missouri"
+    '''
     match_criteria = []
+    # The tree's values are UTF-8, and the form's may be unicode
+    (first, middle, last, place) = [_utf8(text) for text in (first, middle, last, place)]
 
     given_names = []
-    name = args.get('first')
-    if name:
-        given_names.append(name)
-    name = args.get('middle')
-    if name:
-        given_names.append(name)
+    if first:
+        given_names.append(first)
+    if middle:
+        given_names.append(middle)
     if given_names:
-        match_criteria.append("name={}".format(" ".join(given_names)))
+        key = "namephon" if fuzzy else "name"
+        match_criteria.append("{}={}".format(key, " ".join(given_names)))
 
-    name = args.get('last')
-    if name:
-        match_criteria.append("surname={}".format(name))
+    if last:
+        key = "surnamephon" if fuzzy else "surname"
+        match_criteria.append("{}={}".format(key, last))
 
-    # The matching criteria as defined in gedcom.py criteria_match() function
-    criteria = ":".join(match_criteria)
+    if place:
+        # Colons and equals signs would break up the criteria, and never matter in a place name
+        match_criteria.append("place={}".format(place.replace(':', ' ').replace('=', ' ')))
+
+    return ":".join(match_criteria)
+
+def _get_data(args):
+    fuzzy = string.lower(args.get('fuzzy', "False")) == 'true'
+    criteria = build_criteria(args.get('first'), args.get('middle'), args.get('last'), fuzzy, args.get('place'))
 
     if string.lower(args.get('state', "False")) == 'true':
         # State census dates fall on the fifth year of each decade, e.g. 1915, 1925, etc
@@ -346,91 +909,130 @@ def _get_data(args):
         # Federal census dates fall on the zero year of each decade, e.g. 1910, 1920, etc
         offset = 0
 
-    # Parse the Gedcom file, using the lovely parser we snatched out of Github
-    gedcom = Gedcom(args.get('gedFile'))
+    if args.get('gedFile') == ALL_FILES:
+        # Every uploaded file at once; those still being parsed are left out (as "still being indexed"), not waited for
+        dedup = string.lower(args.get('dedup', "False")) == 'true'
+        filepaths = [entry['filepath'] for entry in upload_watcher.manifest() if entry['status'] != FAILED]
+        (matches, problems) = federated.search(filepaths, criteria, lambda filepath: tree_cache.get(filepath, 0), dedup)
+        return (matches, problems, offset)
+
+    # The parsed Gedcom file, using the lovely parser we snatched out of Github
+    tree = tree_cache.get(args.get('gedFile'), app.config['PARSE_TIMEOUT'])
+    matches = [{'tree': tree, 'element': element, 'sources': [tree.filepath()]} for element in tree.select(criteria)]
 
-    return (gedcom, criteria, offset)
+    return (matches, [], offset)
 
 
-def generate_entity_row(entity, level):
+def generate_entity_row(entity, level, generation=None, indent=0, in_law=False):
     '''Generate the information needed for a single row in the fingerprint.
 
     :param entity: the entity (person) to generate
     :param level: Where in the fingerprint this entity lies:
-                    0, the parents
+                    0, the parents (and their ancestors)
                     1, the target and spouses
-                    2, the children
+                    2, the children (and their descendants)
+    :param generation: generations from the target: -1 for parents, -2 for grandparents,
+                       1 for children, and so on (by default, from the level)
+    :param indent: how many generations of ancestors are above the parents
+    :param in_law: whether this is the spouse of a descendant
 
     :return: A dictionary of values that define an entity for the fingerprint
     '''
 
+    if generation is None:
+        generation = level - 1
+
     # The row ID is the full name of the person
-    name = entity.names()[0]
+    name = entity.name()
     firstmiddle = string.split(name[0], maxsplit=1)
     if len(firstmiddle) < 2:
         firstmiddle = (firstmiddle[0], '')
-    link = "/fingerprint?first={}&middle={}&last={}&state={}&gedFile={}".format(firstmiddle[0], firstmiddle[1], name[1],request.args.get("state"), request.args.get("gedFile"))
+    if has_request_context():
+        link = "/fingerprint?first={}&middle={}&last={}&state={}&ancestors={}&descendants={}&gedFile={}".format(firstmiddle[0], firstmiddle[1], name[1],request.args.get("state"), request.args.get("ancestors", 1), request.args.get("descendants", 1), request.args.get("gedFile"))
+    else:
+        # Printing from the command line: there's no page to link to
+        link = ""
+
     id = string.join(name, ' ')
 
-    # Indentation is baked into the ID for simplicity
+    # Indentation is baked into the ID for simplicity: a tab for each generation
+    # down from the earliest ancestors, and dots for each generation of descendants
+    tabs = indent + 1 + min(generation, 0)
+    dots = "... " * max(generation, 0) + ("& " if in_law else "")
     if level == 0:
-        link = "<a href='{}'>{}</a>".format(link, id)
+        link = "{}<a href='{}'>{}</a>".format("&nbsp;" * 4 * tabs, link, id)
+        id = "{}{}".format("    " * tabs, id)
     elif level == 1:
-        link = "<b><a href='{}'>{}</a></b>".format(link, id)
-        id = "    {}".format(id)
+        link = "{}<b><a href='{}'>{}</a></b>".format("&nbsp;" * 4 * (tabs - 1), link, id)
+        id = "{}{}".format("    " * tabs, id)
     elif level == 2:
-        link = "... <a href='{}'>{}</a>".format(link, id)
-        id = "    ... {}".format(id)
+        link = "{}{}<a href='{}'>{}</a>".format("&nbsp;" * 4 * (tabs - 1), dots, link, id)
+        id = "{}{}{}".format("    " * tabs, dots, id)
 
     # The final year is the year of their death, if known, otherwise, today's year
     birth_year = entity.birth_year()
     death_year = entity.death_year()
-    if death_year < 0:
-        final_year = date.today().year
-        if final_year - birth_year > 100:
-            final_year = birth_year + 100   # 100 years default age if none other given
-    else:
-        final_year = death_year
+    final_year = census.final_year(birth_year, death_year)
 
     return {
         'id': id,
+        'name': string.join(name, ' '),
+        'pointer': entity.pointer(),
+        'level': level,
+        'generation': generation,
+        'in_law': in_law,
         'link': link,
         'birth': birth_year,
         'death': death_year,
         'final': final_year
     }
 
-def generate_fingerprint(row, id_length, earliest_census, latest_census, web):
+def generate_fingerprint(row, id_length, columns, web):
     '''Generate a line in the fingerprint, either the title line or details on a person
 
     :param row: details as returned by generate_entity_row()
     :param id_length: the number of characters to reserve for the identifier string
-    :param earliest_census: the first date to fingerprint on
-    :param latest_census: the last date to fingerprint on
+    :param columns: the census.Columns to fingerprint on
 
     :return: A string suitable for printing in the fingerprint chart
     '''
 
     if row is None:
-        return _generate_fingerprint_header(id_length, earliest_census, latest_census, web)
+        return _generate_fingerprint_header(id_length, columns, web)
     else:
-        return _generate_fingerprint_entry(row, id_length, earliest_census, latest_census, web)
+        return _generate_fingerprint_entry(row, id_length, columns, web)
+
+def generate_schedule_titles(id_length, columns):
+    '''The titles of the census schedules, over their columns, when there's more than one'''
+
+    blocks = columns.blocks()
+    if len(blocks) < 2:
+        return []
+    title = [string.ljust('', id_length, ' '), string.ljust('', DATE_WIDTH, ' ')]
+    for (number, (name, years, indexes)) in enumerate(blocks):
+        if number > 0:
+            title.append(SCHEDULE_SEPARATOR)
+        title.append(string.ljust(name[:DATE_WIDTH * len(years)], DATE_WIDTH * len(years), ' '))
+    return title
 
-def _generate_fingerprint_header(id_length, earliest_census, latest_census, web):
+def _generate_fingerprint_header(id_length, columns, web):
     '''Worker function to generate the string of dates for the fingerprint'''
 
     # Leading spaces to justify the census dates
     title = [string.ljust('', id_length, ' '), string.ljust('', DATE_WIDTH, ' ')]
 
-    # Once census date every ten years
-    for date in range(earliest_census, latest_census+1, 10):
-        title.append(string.ljust(str(date), DATE_WIDTH, ' '))
+    # One census date for each year of each schedule
+    for (number, (name, years, indexes)) in enumerate(columns.blocks()):
+        if number > 0 and not web:
+            title.append(SCHEDULE_SEPARATOR)
+        for date in years:
+            title.append(string.ljust(str(date), DATE_WIDTH, ' '))
 
     # e.g:
     #                                       1810  1820  1830  1840  1850  1860  1870  1880  1890  1900  1910  1920
     return title
 
-def _generate_fingerprint_entry(row, id_length, earliest_census, latest_census, web):
+def _generate_fingerprint_entry(row, id_length, columns, web):
     '''Worker function to generate an entry in the fingerprint'''
 
     is_target = row.get('target', False)
@@ -461,34 +1063,41 @@ def _generate_fingerprint_entry(row, id_length, earliest_census, latest_census,
         # The second column is the birth year, again padded with spaces to fill the slot
         entry.append(string.ljust(str(row['birth']), DATE_WIDTH, separator))
 
-        # For each ten year census date...
-        for date in range(earliest_census, latest_census+1, 10):
+        # For each census date of any schedule...
+        cells = []
+        for date in columns.years():
             # ... determine their age at this year
-            age = date - int(row['birth'])
+            age = date - birth
             if age < 0:
                 # ... if they weren't born yet, pad with spaces
-                entry.append(string.ljust('', DATE_WIDTH, separator))
+                cells.append(string.ljust('', DATE_WIDTH, separator))
             elif date <= final:
                 # ... and if they weren't dead yet, generate a year entry
-                entry.append(string.ljust(str(age), DATE_WIDTH, separator))
+                cells.append(string.ljust(str(age), DATE_WIDTH, separator))
             else:
                 # ... but if they ARE dead, more spaces for the slot
-                entry.append(string.ljust('', DATE_WIDTH, separator))
+                cells.append(string.ljust('', DATE_WIDTH, separator))
+
+        # ... then lay out each schedule's years from those
+        for (number, (name, years, indexes)) in enumerate(columns.blocks()):
+            if number > 0 and not web:
+                entry.append(SCHEDULE_SEPARATOR)
+            entry.extend([cells[index] for index in indexes])
 
     # e.g.:
     #     Jabez W Crouch              1813        7     17    27    37    47    57
     return entry
 
 def year_only(date):
-    p = re.compile('(\d{4})')
-    match = p.search(date)
-    if match is not None:
-        return match.group(0)
+    year = dates.year(dates.parse(date))
+    if year is not None:
+        return str(year)
     return ''
 
-def all_names(names):
+def all_names(element):
 
-    ret = string.join(names[0], ' ')
+    names = element.names()
+    ret = string.join(element.name(), ' ')
 
     if len(names) > 1:
         ret += " aka "
@@ -498,26 +1107,30 @@ def all_names(names):
     ret += string.join(more_names, ', ')
     return ret
 
-def fingerprint_data(gedcom, target, offset):
+def fingerprint_data(gedcom, target, offset, ancestors=1, descendants=1, schedules=None):
     ''' Print an entire fingerprint record for a given target person
 
     :param gedcom: the parsed Gedcom data
     :param target: the specific entity that is the person we are fingerprinting
     :param offset: year offset; 0 for federal census, 5 for state census dates
+    :param ancestors: generations of ancestors to include; 1 for just the parents
+    :param descendants: generations of descendants to include; 1 for just the children
+    :param schedules: census schedules to show side by side (see census.schedule()),
+                      instead of the one chosen by offset
     :return: Prints a fingerprint chart for the target person and their family
     '''
 
     # The rows array collects dictionaries that define entities in the fingerprint
     # These get converted to strings by the generate_fingerprint() method, later
     rows = []
+    indent = max(ancestors - 1, 0)
 
-    # The first part of the fingerprint are the target's parents
-    parents = gedcom.get_parents(target)
-    for parent in parents:
-        rows.append(generate_entity_row(parent, 0))
+    # The first part of the fingerprint are the target's parents, each after their own ancestors
+    for (parent, generation) in ancestor_rows(gedcom, target, ancestors):
+        rows.append(generate_entity_row(parent, 0, generation, indent))
 
     # The next part are the target person themself...
-    target_row = generate_entity_row(target, 1)
+    target_row = generate_entity_row(target, 1, 0, indent)
     target_row['target'] = True
     rows.append(target_row)
 
@@ -528,12 +1141,12 @@ def fingerprint_data(gedcom, target, offset):
         peers = gedcom.get_family_members(family, "PARENTS")
         for peer in peers:
             if (peer != target):
-                rows.append(generate_entity_row(peer, 1))
+                rows.append(generate_entity_row(peer, 1, 0, indent))
 
-        # ... children are tagged simply as children
-        children = gedcom.get_family_members(family, "CHIL")
-        for child in children:
-            rows.append(generate_entity_row(child, 2))
+        # ... children are tagged simply as children, followed by their own families
+        if descendants > 0:
+            for (element, generation, in_law) in gedcom.get_descendants(family, descendants):
+                rows.append(generate_entity_row(element, 2, generation, indent, in_law))
 
     # In order to make a tidy chart, we need to know a few statistics about this fingerprint:
     #   The width of the widest identifier string
@@ -552,25 +1165,40 @@ def fingerprint_data(gedcom, target, offset):
     # Modulo the longest identifier by 4, to give a decent 4-space tab effect
     longest_id = int(math.ceil((longest_id+1) / 4.0) * 4)
 
-    # Snap the raw date range into the census grid
-    modulo = 10
-    earliest_census = int(math.floor(earliest_date / modulo) * modulo) - offset
-    latest_census = int(math.ceil(float(latest_date) / modulo) * modulo) - offset
+    # The census years to chart, from the schedules snapped around the raw date range
+    if not schedules:
+        schedules = ['state' if offset == 5 else 'federal']
+    columns = census.Columns([census.schedule(spec, earliest_date, latest_date) for spec in schedules])
+    years = columns.years() or [earliest_date]
+
+    return {
+        'pointer': target.pointer(),
+        'name': all_names(target),
+        'locations': fingerprint_locations(gedcom, target),
+        'fingerprint': rows,
+        'longest_id': longest_id,
+        'columns': columns,
+        'earliest_date': years[0],
+        'latest_date': years[-1]
+    }
+
+def fingerprint_locations(gedcom, target):
+    '''Return the places a person lived, married, was born and died, in order, as (event, year, place)'''
 
     # Residences!
 
     locations = []
     residences = target.residences()
     for residence in residences:
-        locations.append(('Residence', year_only(residence[0]), residence[1]))
+        locations.append(('Residence', residence[0], residence[1]))
 
     marriages = gedcom.marriages(target)
     for marriage in marriages:
-        locations.append(('Marriage', year_only(marriage[0]), marriage[1]))
+        locations.append(('Marriage', marriage[0], marriage[1]))
 
-    # TODO: Process the dates to do comparisons across different date formats
-
-    locations.sort(key=lambda location:location[1])
+    # Sort on the parsed dates, so differently written dates still fall in order
+    locations.sort(key=lambda location:dates.sort_key(dates.parse(location[1])))
+    locations = [(event, year_only(when), where) for (event, when, where) in locations]
 
     birth = target.birth()
     locations.insert(0, ('Birth', year_only(birth[0]), birth[1]))
@@ -578,18 +1206,29 @@ def fingerprint_data(gedcom, target, offset):
     death = target.death()
     locations.append(('Death', year_only(death[0]), death[1]))
 
-    return {
-        'name': all_names(target.names()),
-        'locations': locations,
-        'fingerprint': rows,
-        'longest_id': longest_id,
-        'earliest_date': earliest_census,
-        'latest_date': latest_census
-    }
+    return locations
+
+def ancestor_rows(gedcom, target, generations):
+    '''The ancestors of a person, back the given number of generations, as (element, generation)
+    where generation is -1 for parents.  Each parent comes after their own ancestors.'''
+    found = []
+    # A stack of (person, generation, whether their ancestors have been added yet)
+    pending = [(parent, -1, False) for parent in reversed(gedcom.get_parents(target))]
+    while pending:
+        (person, generation, expanded) = pending.pop()
+        if expanded or -generation >= generations:
+            found.append((person, generation))
+            continue
+        pending.append((person, generation, True))
+        pending.extend([(parent, generation - 1, False) for parent in reversed(gedcom.get_parents(person))])
+    return found
 
 def print_fingerprint(fingerprint):
     # Print the fingerprint chart itself
-    print string.upper("FINGERPRINT FOR {}".format(fingerprint.get('name')))
+    title = "FINGERPRINT FOR {}".format(fingerprint.get('name'))
+    if fingerprint.get('sources'):
+        title += " IN {}".format(", ".join(fingerprint.get('sources')))
+    print string.upper(title)
     print
 
     def generate_residence_string(entry):
@@ -602,26 +1241,32 @@ def print_fingerprint(fingerprint):
     print
 
     longest_id = fingerprint.get('longest_id')
-    earliest_date = fingerprint.get('earliest_date')
-    latest_date = fingerprint.get('latest_date')
-    print ''.join(generate_fingerprint(None, longest_id, earliest_date, latest_date, False))
+    columns = fingerprint.get('columns')
+    titles = generate_schedule_titles(longest_id, columns)
+    if titles:
+        print ''.join(titles)
+    print ''.join(generate_fingerprint(None, longest_id, columns, False))
     for row in fingerprint.get('fingerprint'):
-        print ''.join(generate_fingerprint(row, longest_id, earliest_date, latest_date, False))
+        print ''.join(generate_fingerprint(row, longest_id, columns, False))
 
     print
 
 
 def table_fingerprint(fingerprint):
 
-    earliest_date = fingerprint.get('earliest_date')
-    latest_date = fingerprint.get('latest_date')
-    num_cols = 2 + (latest_date - (earliest_date+1)) / 10 + 2
+    columns = fingerprint.get('columns')
+    num_cols = 2 + columns.count()
 
     def generate_residence_string(entry):
         return "<tr><td>{}</td><td>{}</td><td colspan={}>{}</td></tr>".format(entry[0], entry[1], num_cols-2, entry[2])
 
     rows = []
-    rows.append("<tr><th colspan={}>Fingerprint for {}</th></tr>".format(num_cols, fingerprint.get('name')))
+    title = "Fingerprint for {}".format(fingerprint.get('name'))
+    if fingerprint.get('sources'):
+        title += " in {}".format(cgi.escape(", ".join(fingerprint.get('sources'))))
+    if fingerprint.get('extract'):
+        title += " (<a href='{}'>GED file</a>)".format(cgi.escape(fingerprint.get('extract'), True))
+    rows.append("<tr><th colspan={}>{}</th></tr>".format(num_cols, title))
     rows.append("<tr><th>Event</th><th>Year</th><th>Location</th><td colspan={}/></tr>".format(num_cols-3))
 
     for location in fingerprint.get('locations'):
@@ -630,9 +1275,12 @@ def table_fingerprint(fingerprint):
 
 
 
-    rows.append("<tr><th>{}</th></tr>".format("</th><th>".join(generate_fingerprint(None, 0, earliest_date, latest_date, True))))
+    if len(columns.blocks()) > 1:
+        rows.append("<tr><th colspan=2></th>{}</tr>".format("".join(
+            ["<th colspan={}>{}</th>".format(len(years), cgi.escape(name)) for (name, years, indexes) in columns.blocks()])))
+    rows.append("<tr><th>{}</th></tr>".format("</th><th>".join(generate_fingerprint(None, 0, columns, True))))
     for row in fingerprint.get('fingerprint'):
-        rows.append("<tr><td>{}</td></tr>".format("</td><td>".join(generate_fingerprint(row, 0, earliest_date, latest_date, True))))
+        rows.append("<tr><td>{}</td></tr>".format("</td><td>".join(generate_fingerprint(row, 0, columns, True))))
 
     html = '''
 <div class="box">
@@ -647,33 +1295,238 @@ def table_fingerprint(fingerprint):
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("gedfilename", nargs='?', help="File and path to the GEDcom file")
+    parser.add_argument("gedfilename", nargs='?', help="File and path to the GEDcom file, or a folder to search every GED file in it")
     parser.add_argument("-w", "--web", action="store_true", help="Launch as web server (then ignores all other options)")
+    parser.add_argument("--workers", type=int, default=0, help="With --web, serve from this many pre-forked worker processes instead of the development server")
+    parser.add_argument("--host", default="127.0.0.1", help="With --web, the address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="With --web, the port to listen on")
     parser.add_argument("-s", "--state", action="store_true", help="Report on the five-year mark and not on the decade")
     parser.add_argument("-f", "--firstname", help="First name of the person to fingerprint")
     parser.add_argument("-m", "--middlename", help="Middle name of the person to fingerprint")
     parser.add_argument("-l", "--lastname", help="Last name of the person to fingerprint")
+    parser.add_argument("--fuzzy", action="store_true", help="Match names that sound alike (Soundex), not just the same letters")
+    parser.add_argument("--ancestors", type=int, default=1, help="Generations of ancestors to fingerprint: 1 for parents, 2 for grandparents too, and so on")
+    parser.add_argument("--descendants", type=int, default=1, help="Generations of descendants to fingerprint: 1 for children, 2 for grandchildren too, and so on")
+    parser.add_argument("--schedule", action="append", type=_schedule_arg, metavar="SCHEDULE", help="Census years to fingerprint on, instead of -s: federal, state, uk, a state (ny, nj, ks, ia, mn) or a list of years such as 1882,1887.  Give it more than once to see schedules side by side")
+    parser.add_argument("--dedup", action="store_true", help="When searching a folder, show someone found in several files once")
+    parser.add_argument("-p", "--place", help="Only fingerprint people with an event in this place, e.g. \"Taney, Missouri\"")
+    parser.add_argument("--household", metavar="YEAR:AGES", help="Find the families fitting a census household instead, e.g. 1900:33,31,5,3 for head, spouse and children's ages (leave an age blank if unknown)")
+    parser.add_argument("--tolerance", type=int, default=2, help="With --household, how many years an age may be out")
+    parser.add_argument("--duplicates", action="store_true", help="Instead of fingerprinting, list the people who may be in the file more than once")
+    parser.add_argument("--threshold", type=float, default=duplicates.THRESHOLD, help="With --duplicates, the lowest score (0 to 1) worth listing")
+    parser.add_argument("--processes", type=int, default=1, help="With --duplicates or --kinship, work in this many processes")
+    parser.add_argument("--snapshot", type=int, metavar="YEAR", help="Instead of fingerprinting, list everybody alive in the census year YEAR (or the one before it), with their age, household and residence")
+    parser.add_argument("--events", metavar="PLACE", help="Instead of fingerprinting, list the people with an event (birth, residence, census, marriage, death, ...) in PLACE during --years, e.g. \"Cedar Creek, Taney\"")
+    parser.add_argument("--years", metavar="YEARS", help="With --events, the years, e.g. 1890-1910 or 1900")
+    parser.add_argument("--graph", action="store_true", help="Instead of fingerprinting, report on the shape of the whole tree: generations, disconnected sub-trees, and who has the most descendants")
+    parser.add_argument("--graph-export", metavar="FILE", help="Write the parent, child and spouse relations of everyone to FILE as JSON arrays (compressed sparse rows), for graph tools")
+    parser.add_argument("--kinship", metavar="PAIRS", help="Instead of fingerprinting, say how closely related each pair of people in the file PAIRS is (two pointers to a line, such as I12 I40), or - for standard input")
+    parser.add_argument("--extract", metavar="FILE", help="Write everyone matching, with their spouses, --ancestors generations of ancestors, --descendants generations of descendants, their families and the sources and notes they refer to, to FILE as a GED file of its own, or - for standard output")
+    parser.add_argument("--diff", metavar="NEWFILE", help="Instead of fingerprinting, list the people and families added, removed or changed (field by field) in NEWFILE, a later version of the GED file")
+    parser.add_argument("--export", metavar="FILE", help="Write the fingerprints of everyone matching (everyone, if no names or place are given) to FILE, or - for standard output")
+    parser.add_argument("--format", choices=export.FORMATS, help="With --export, write JSON lines or CSV (by default, from the file name); with --snapshot, --diff or --events, jsonl writes JSON lines instead of a table")
+    parser.add_argument("--gzip", action="store_true", help="With --export, gzip the output (the default when FILE ends in .gz)")
+    parser.add_argument("--memory", action="store_true", help="Instead of fingerprinting, report how much memory the parsed file takes")
+    parser.add_argument("--memory-budget", type=float, metavar="MB", help="With --web, keep the parsed trees within this many megabytes, dropping the least recently used and refusing files that are too big")
+    parser.add_argument("--profile", action="store_true", help="Afterwards, print how long each phase took (parsing, matching, fingerprinting, printing)")
+    parser.add_argument("--cprofile", metavar="FILE", help="Run under cProfile and write the stats to FILE, for pstats or snakeviz")
 
     args = parser.parse_args()
 
+    if args.cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     if args.web:
-            app.run(port=5000)
+        if args.memory_budget:
+            tree_cache.set_budget(int(args.memory_budget * 1024 * 1024))
+        if args.workers > 0:
+            # The main process keeps the manifest up to date, and forks new workers when it changes
+            app.config.update(DEBUG=False, WATCH_UPLOADS=False)
+            serve.serve(app, tree_cache, os.path.join(basedir, UPLOAD_PATH), args.host, args.port, args.workers, upload_watcher)
+        else:
+            app.run(host=args.host, port=args.port)
+    elif args.export:
+        criteria = build_criteria(args.firstname, args.middlename, args.lastname, args.fuzzy, args.place)
+        offset = 5 if args.state else 0
+        tree = Tree(args.gedfilename)
+        gedcom = tree.gedcom()
+        selected = tree.select(criteria) if criteria else tree.individuals()
+
+        fingerprints = (fingerprint_data(gedcom, element, offset, args.ancestors, args.descendants, args.schedule) for element in selected)
+        out = export.open_output(args.export, True if args.gzip else None)
+        try:
+            written = export.write(fingerprints, out, args.format or export.format_for(args.export))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        sys.stderr.write("Exported {} fingerprints\n".format(written))
+    elif args.extract:
+        criteria = build_criteria(args.firstname, args.middlename, args.lastname, args.fuzzy, args.place)
+        if not criteria:
+            sys.exit("--extract needs a name or place to pick people by")
+        tree = Tree(args.gedfilename)
+        gedcom = tree.gedcom()
+        records = subset.extract(gedcom, tree.select(criteria), args.ancestors, args.descendants)
+        out = sys.stdout if args.extract == '-' else open(args.extract, 'w')
+        try:
+            subset.write(gedcom, records, out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        sys.stderr.write("Extracted {} records\n".format(len(records)))
+    elif args.diff:
+        result = diff.compare(args.gedfilename, args.diff)
+        if args.format == 'jsonl':
+            for line in export.jsonl_lines(diff.records(result)):
+                sys.stdout.write(line)
+        else:
+            print "CHANGES FROM {} TO {}".format(args.gedfilename, args.diff)
+            print
+            print "   {:,} unchanged, {:,} only renumbered, {:,} other records (sources, notes, ...) changed".format(
+                result['unchanged'], result['renumbered'], result['other'])
+            print
+            for (kind, pointer, description) in result['added']:
+                print "   ADDED    {} {} {}".format(kind, pointer, description)
+            for (kind, pointer, description) in result['removed']:
+                print "   REMOVED  {} {} {}".format(kind, pointer, description)
+            for (kind, old_pointer, pointer, description, changes) in result['modified']:
+                renumbered = " (was {})".format(old_pointer) if old_pointer != pointer else ""
+                print "   CHANGED  {} {}{} {}".format(kind, pointer, renumbered, description)
+                for (field, old, new) in changes:
+                    print "      {}: {} -> {}".format(field, old if old is not None else "(none)", new if new is not None else "(none)")
+            print
+    elif args.memory:
+        (tree, allocated, grown) = memory.measure(lambda: Tree(args.gedfilename))
+        for line in memory.report(tree):
+            print line
+        print
+        print "   Process RSS grew by {} while parsing".format(memory.megabytes(grown))
+        if allocated is not None:
+            print "   Parsing allocated {}".format(memory.megabytes(allocated))
+        print
+    elif args.household:
+        year, _, ages = args.household.partition(':')
+        year = int(year)
+        ages = parse_ages(ages)
+        described = ", ".join([str(age) if age is not None else "?" for age in ages])
+        ages = ages + [None, None]
+        tree = Tree(args.gedfilename)
+        results = tree.households().match(year, ages[0], ages[1], ages[2:], args.tolerance)
+
+        print "FAMILIES FITTING THE {} HOUSEHOLD: {}".format(year, described)
+        print
+        for result in results:
+            print "{:.2f}  {}".format(result['score'], result['family'].pointer())
+            for (role, age, element) in result['members']:
+                if element is None:
+                    print "      {} {}: no match".format(role, age)
+                else:
+                    print "      {} {}: {} ({})".format(role, age, string.join(element.name(), ' '), element.birth_year())
+        print
+    elif args.snapshot:
+        tree = Tree(args.gedfilename)
+        year = census.census_year(args.snapshot, 5 if args.state else 0)
+        rows = census.snapshot(tree, year)
+        lines = export.jsonl_lines(rows) if args.format == 'jsonl' else census.table_lines(rows)
+        for line in lines:
+            sys.stdout.write(line)
+    elif args.events:
+        if not args.years:
+            sys.exit("--events needs --years, e.g. --years 1890-1910")
+        try:
+            (first, last) = _year_range(args.years)
+        except ValueError as e:
+            sys.exit("--years {}: {}".format(args.years, e))
+        tree = Tree(args.gedfilename)
+        rows = event_rows(tree, args.events, first, last)
+        if args.format == 'jsonl':
+            for line in export.jsonl_lines(rows):
+                sys.stdout.write(line)
+        else:
+            print "EVENTS IN {} FROM {} TO {}".format(string.upper(args.events), first, last)
+            print
+            for row in rows:
+                print "   {} {} ({})".format(row['pointer'], row['name'], row['birth'] or "?")
+                for event in row['events']:
+                    print "      {:<5} {:<10} {}".format(event['event'], event['years'], event['place'])
+            print
+    elif args.graph or args.graph_export:
+        tree = Tree(args.gedfilename)
+        relations = graph.Graph(tree)
+        if args.graph_export:
+            with open(args.graph_export, 'wb') as out:
+                relations.write(out)
+            sys.stderr.write("Wrote the relations of {} people\n".format(relations.size()))
+        if args.graph:
+            generations = relations.generations()
+            components = relations.components()
+            descendants = relations.descendant_counts()
+            individuals = tree.individuals()
+
+            print "SHAPE OF {} ({:,} people)".format(args.gedfilename, relations.size())
+            print
+            print "   Parent links        {:,}".format(len(relations.parents().targets()))
+            print "   Spouse links        {:,}".format(len(relations.spouses().targets()) / 2)
+            print "   Generations         {}".format(max(generations) + 1 if len(generations) else 0)
+            print "   Disconnected trees  {:,}".format(max(components) + 1 if len(components) else 0)
+            print
+            print "   generation     people"
+            for generation in range(max(generations) + 1 if len(generations) else 0):
+                print "   {:>10}  {:>9,}".format(generation, generations.count(generation))
+            looped = generations.count(graph.NO_GENERATION)
+            if looped:
+                print "   {:>10}  {:>9,}".format("in a loop", looped)
+            print
+            print "   tree      people"
+            sizes = {}
+            for component in components:
+                sizes[component] = sizes.get(component, 0) + 1
+            for component in range(min(len(sizes), 5)):
+                print "   {:>4}  {:>10,}".format(component + 1, sizes[component])
+            print
+            print "   Most descendants"
+            for n in sorted(range(relations.size()), key=lambda n: -descendants[n])[:5]:
+                print "   {:>8,}  {} {}".format(descendants[n], relations.pointer(n), string.join(individuals[n].name(), ' '))
+            print
+    elif args.kinship:
+        if args.kinship == '-':
+            pairs = kinship.read_pairs(sys.stdin)
+        else:
+            with open(args.kinship) as lines:
+                pairs = kinship.read_pairs(lines)
+        tree = Tree(args.gedfilename)
+        results = kinship.relate(tree, pairs, args.processes)
+
+        print "KINSHIP OF {} PAIRS".format(len(results))
+        print
+        for result in results:
+            if result['kinship'] is None:
+                print "   {} {}: not both in the file".format(result['first'], result['second'])
+                continue
+            common = ", ".join(["{} ({} up, {} up)".format(pointer, up_first, up_second)
+                                for (pointer, up_first, up_second) in result['common']])
+            print "   {} {}: kinship {:.5f}, relatedness {:.5f}, {}".format(
+                result['first'], result['second'], result['kinship'], result['relatedness'],
+                result['relationship'] or "not related")
+            if common:
+                print "      nearest common ancestors: {}".format(common)
+        print
+    elif args.duplicates:
+        tree = Tree(args.gedfilename)
+        results = duplicates.find(tree, args.threshold, args.processes)
+
+        print "POSSIBLE DUPLICATES: {}".format(len(results))
+        print
+        for result in results:
+            people = []
+            for element in (result['first'], result['second']):
+                people.append("{} {} ({})".format(element.pointer(), string.join(element.name(), ' '), element.birth_year()))
+            print "{:.2f}  {}  =  {}".format(result['score'], people[0], people[1])
+        print
     else:
-        match_criteria = []
-
-        given_names = []
-        if args.firstname:
-            given_names.append(args.firstname)
-        if args.middlename:
-            given_names.append(args.middlename)
-        if given_names:
-            match_criteria.append("name={}".format(" ".join(given_names)))
-
-        if args.lastname is not None:
-            match_criteria.append("surname={}".format(args.lastname))
-
         # The matching criteria as defined in gedcom.py criteria_match() function
-        criteria = ":".join(match_criteria)
+        criteria = build_criteria(args.firstname, args.middlename, args.lastname, args.fuzzy, args.place)
 
         if args.state:
             # State census dates fall on the fifth year of each decade, e.g. 1915, 1925, etc
@@ -682,13 +1535,38 @@ if __name__ == "__main__":
             # Federal census dates fall on the zero year of each decade, e.g. 1910, 1920, etc
             offset = 0
 
-        # Parse the Gedcom file, using the lovely parser we snatched out of Github
-        gedcom = Gedcom(args.gedfilename)
+        if os.path.isdir(args.gedfilename):
+            # Every GED file in the folder, parsed and searched side by side
+            (matches, problems) = federated.search(ged_files(args.gedfilename), criteria, Tree, args.dedup)
+            for (filepath, reason) in problems:
+                sys.stderr.write("Not searched: {} ({})\n".format(filepath, reason))
+            for match in matches:
+                with metrics.timed('fingerprint_data_seconds'):
+                    data = fingerprint_data(match['tree'].gedcom(), match['element'], offset, args.ancestors, args.descendants, args.schedule)
+                data['sources'] = federated.source_names(match)
+                with metrics.timed('render_seconds'):
+                    print_fingerprint(data)
+        else:
+            # Parse the Gedcom file, using the lovely parser we snatched out of Github
+            tree = Tree(args.gedfilename)
+            gedcom = tree.gedcom()
 
-        # Look at EVERYONE
-        for element in gedcom.element_list():
-            # Do they match?
-            if element.criteria_match(criteria):
+            # Everyone who matches
+            for element in tree.select(criteria):
                 # A match, fingerprint them
-                data = fingerprint_data(gedcom, element, offset)
-                print_fingerprint(data)
+                with metrics.timed('fingerprint_data_seconds'):
+                    data = fingerprint_data(gedcom, element, offset, args.ancestors, args.descendants, args.schedule)
+                with metrics.timed('render_seconds'):
+                    print_fingerprint(data)
+
+    if args.cprofile:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+
+    if args.profile:
+        derived = []
+        parse = metrics.registry.histogram('parse_seconds')
+        if parse.sum:
+            lines = metrics.registry.counter('parse_lines_total').value
+            derived.append(('parse_lines_per_second', lines / parse.sum))
+        sys.stderr.write("\n".join(metrics.registry.report(derived)) + "\n")
@@ -0,0 +1,112 @@
+#
+# What goes on the map
+#
+# A broad search can match hundreds of people with thousands of events
+# between them, far more markers than a browser can geocode and draw.  The
+# events are gathered up here instead, before the page is written:
+#
+#   - every event in the same place (however it was written) is one marker,
+#     with a count of each kind of event and the years they span
+#   - if that is still more than MAX_MARKERS places, places are merged into
+#     the one they are in (town into county, county into state, ...) a level
+#     of the hierarchy at a time, until it isn't
+#   - each person's moves, from one marker to the next, are drawn once
+#     however many people made them, more heavily the more there were, and
+#     only the MAX_MOVES most common
+#
+# so the page gets a payload that grows with the number of places, not the
+# number of events.
+#
+
+import places
+
+# The most markers on a map
+MAX_MARKERS = 100
+
+# The most moves between markers on a map; the ones the most people made are kept
+MAX_MOVES = 200
+
+
+def aggregate(people, max_markers=MAX_MARKERS, max_moves=MAX_MOVES):
+    """ Gather up the events of a list of people for a map
+
+    people is a list with the locations of each person, as (event, year,
+    place) in the order they happened.  Returns (markers, moves): markers is a
+    list of dicts, most events first, with keys
+        place   - the place as first written (only down to the level merged to)
+        count   - how many events there were there
+        events  - event -> how many of them
+        first   - the earliest year, or None
+        last    - the latest year, or None
+    and moves is a list of up to max_moves (from marker, to marker, how many
+    people), by position in markers.
+    """
+    located = []
+    for locations in people:
+        events = [(event, year, _parts(place)) for (event, year, place) in locations if place]
+        located.append([(event, year, parts) for (event, year, parts) in events if parts[0]])
+
+    # How many parts of a place, from the country down, are kept: fewer until there are few enough markers
+    depth = max([len(split) for events in located for (event, year, (split, written)) in events] or [1])
+    while depth > 1:
+        keys = set([_down(split, depth) for events in located for (event, year, (split, written)) in events])
+        if len(keys) <= max_markers:
+            break
+        depth -= 1
+
+    # Place key -> marker, and the marker of each event of each person
+    found = {}
+    routes = []
+    for events in located:
+        route = []
+        for (event, year, (split, written)) in events:
+            key = _down(split, depth)
+            marker = found.get(key)
+            if marker is None:
+                marker = {'place': ", ".join(_down(written, depth)), 'count': 0, 'events': {},
+                          'first': None, 'last': None}
+                found[key] = marker
+            marker['count'] += 1
+            marker['events'][event] = marker['events'].get(event, 0) + 1
+            if year:
+                year = int(year)
+                marker['first'] = year if marker['first'] is None else min(marker['first'], year)
+                marker['last'] = year if marker['last'] is None else max(marker['last'], year)
+            route.append(key)
+        routes.append(route)
+
+    keys = sorted(found, key=lambda key: (-found[key]['count'], found[key]['place']))
+    numbers = dict((key, number) for (number, key) in enumerate(keys))
+    markers = [found[key] for key in keys]
+
+    # Each move between two different markers, counted once per person
+    counts = {}
+    for route in routes:
+        steps = set()
+        for (here, there) in zip(route, route[1:]):
+            if here != there:
+                steps.add((numbers[here], numbers[there]))
+        for step in steps:
+            counts[step] = counts.get(step, 0) + 1
+    moves = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:max_moves]
+    moves = [(here, there, count) for ((here, there), count) in sorted(moves)]
+    return (markers, moves)
+
+
+def _down(parts, depth):
+    """ Return the parts of a place from the least specific down depth parts """
+    return tuple(parts[-depth:])
+
+
+def _parts(place):
+    """ Return (normalized parts, parts as written) of a place, most specific first """
+    split = []
+    written = []
+    for part in place.split(','):
+        normalized = places.normalize(part)
+        if normalized:
+            split.append(normalized)
+            written.append(part.strip())
+    if split:
+        split[-1] = places.COUNTRIES.get(split[-1], split[-1])
+    return (split, written)
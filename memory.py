@@ -0,0 +1,181 @@
+#
+# How much memory does a parsed tree cost?
+#
+# A parsed GED file is one Element object per line, each with a dictionary of
+# attributes, a list of children and a few strings, plus the pointer dictionary
+# and the indexes built on top.  account() walks all of that and adds up
+# sys.getsizeof() by kind of object, counting every object once however many
+# things refer to it, so the sizes of a tree's parts add up to its total.
+#
+# That is what the objects themselves take.  The allocator's overhead and free
+# space come on top, which is why the process's RSS is also reported, and, when
+# the tracemalloc module is available (Python 3.4+), exactly what parsing
+# allocated.
+#
+
+import sys
+import gc
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# The parts of a tree, in the order they are reported
+KINDS = [
+    ('elements', "Element objects"),
+    ('attributes', "Attribute dicts of the elements, if they have them"),
+    ('children', "Lists of child elements"),
+    ('strings', "Tags, pointers and values"),
+    ('numbers', "Levels"),
+    ('element_list', "List of all elements"),
+    ('pointer_dict', "Dict of elements by pointer"),
+    ('indexes', "Individuals list, name, household, place, lifespan and completion indexes"),
+]
+
+
+def account(tree, sample=1):
+    """ Return a dict of kind -> (objects, bytes) for the objects making up a Tree
+
+    With a sample greater than 1 only every sample'th element is looked at, and
+    the element sizes scaled up to match: a quick estimate, for large trees.
+    """
+    sizes = dict((kind, [0, 0]) for (kind, description) in KINDS)
+    seen = set()
+
+    def add(kind, obj, weight=1):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        size = sizes[kind]
+        size[0] += weight
+        size[1] += sys.getsizeof(obj) * weight
+
+    gedcom = tree.gedcom()
+    elements = gedcom.element_list()
+    add('element_list', elements)
+    add('pointer_dict', gedcom.element_dict())
+    for element in elements[::sample]:
+        add('elements', element, sample)
+        if hasattr(element, '__dict__'):
+            add('attributes', vars(element), sample)
+            attributes = vars(element).items()
+        else:
+            attributes = [(name, getattr(element, name)) for name in _slots(element)]
+        for (name, value) in attributes:
+            if isinstance(value, basestring):
+                add('strings', value, sample)
+            elif isinstance(value, (int, long)):
+                add('numbers', value, sample)
+            elif isinstance(value, list) and name.endswith('__children'):
+                add('children', value, sample)
+
+    # Everything reachable from the indexes that the elements haven't accounted for
+    for element in elements:
+        seen.add(id(element))
+    pending = [tree.individuals(), tree.phonetic(), tree.households(), tree.places(), tree.lifespans(), tree.completions()]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        add('indexes', obj)
+        if hasattr(obj, '__dict__'):
+            pending.append(vars(obj))
+        elif hasattr(obj, '__slots__'):
+            pending.extend([getattr(obj, name) for name in _slots(obj) if hasattr(obj, name)])
+        elif isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+
+    return dict((kind, tuple(size)) for (kind, size) in sizes.items())
+
+
+def rss():
+    """ Return the resident set size of this process in bytes, or None if it can't be found """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    try:
+        import resource
+        # Peak, not current, and in kilobytes on Linux but bytes on Mac OS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+def measure(load):
+    """ Call load() and return (its result, bytes it allocated or None, change in RSS or None)
+
+    Allocations are only known when tracemalloc is available.
+    """
+    gc.collect()
+    before = rss()
+    traced = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            result = load()
+            traced = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+    else:
+        result = load()
+    gc.collect()
+    after = rss()
+    grown = after - before if before is not None and after is not None else None
+    return (result, traced, grown)
+
+
+def report(tree, sizes=None):
+    """ Return the lines of a human readable memory report for a tree """
+    if sizes is None:
+        sizes = account(tree)
+    lines = len(tree.gedcom().element_list())
+    everything = total(sizes)
+    report = ["MEMORY FOR {} ({:,} lines)".format(tree.filepath(), lines), ""]
+    report.append("   {:<14} {:>12} {:>14} {:>10}   {}".format("", "objects", "bytes", "per line", ""))
+    for (kind, description) in KINDS:
+        (count, size) = sizes[kind]
+        report.append("   {:<14} {:>12,} {:>14,} {:>10.1f}   {}".format(kind, count, size, _per(size, lines), description))
+    report.append("   {:<14} {:>12} {:>14,} {:>10.1f}".format("total", "", everything, _per(everything, lines)))
+    report.append("")
+    report.append("   {:<14} {:>12} {:>14} {:>10}".format("shared", "occurrences", "distinct", "saved"))
+    stats = tree.gedcom().string_stats()
+    for kind in ('tags', 'pointers', 'values'):
+        report.append("   {:<14} {:>12,} {:>14,} {:>10}".format(
+            kind, stats[kind]['occurrences'], stats[kind]['distinct'], megabytes(stats[kind]['saved'])))
+    return report
+
+
+def total(sizes):
+    """ Return the total bytes of an account() """
+    return sum([size for (count, size) in sizes.values()])
+
+
+def megabytes(size):
+    """ Format a number of bytes, or None, as megabytes """
+    if size is None:
+        return "unknown"
+    return "{:,.1f} MB".format(size / (1024.0 * 1024.0))
+
+
+def _slots(obj):
+    """ Return the (mangled) names of the slots of an object """
+    names = []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if name.startswith('__') and not name.endswith('__'):
+                name = "_{}{}".format(cls.__name__.lstrip('_'), name)
+            names.append(name)
+    return names
+
+
+def _per(size, lines):
+    return float(size) / lines if lines else 0.0
@@ -0,0 +1,197 @@
+#
+# Timing and counting the phases of making a fingerprint
+#
+# When a page is slow, these say where the time went: parsing the GED file,
+# selecting the matching people, building their fingerprint data, or turning it
+# into HTML.  Counters only ever go up; histograms count observations (usually
+# seconds) into buckets, Prometheus style, and keep their total.
+#
+# Everything is recorded in the process that did the work.  Under the
+# pre-forking server each worker keeps its own numbers, so every sample carries
+# a pid label to tell them apart.
+#
+#   with metrics.timed('render_seconds'):
+#       html = table_fingerprint(data)
+#   metrics.count('matches_total', len(selected))
+#
+
+import os
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+
+# Prefix of every metric name in the /metrics output
+PREFIX = "fingerprint_"
+
+# Upper bounds, in seconds, of the histogram buckets
+SECONDS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """ A total that only goes up """
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def add(self, amount):
+        self.value += amount
+
+    def samples(self):
+        """ Return (suffix, labels, value) tuples for the Prometheus text format """
+        return [("", (), self.value)]
+
+    def summary(self):
+        """ Return a one line description for the --profile report """
+        return "{:>14}".format(_number(self.value))
+
+
+class Histogram:
+    """ Observations counted into buckets by upper bound, with their count and sum """
+
+    def __init__(self, name, help, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(buckets)
+        self.buckets = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def samples(self):
+        """ Return (suffix, labels, value) tuples for the Prometheus text format
+
+        Prometheus buckets are cumulative: each counts everything up to its bound.
+        """
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            cumulative += count
+            samples.append(("_bucket", (("le", _number(bound)),), cumulative))
+        samples.append(("_bucket", (("le", "+Inf"),), self.count))
+        samples.append(("_sum", (), self.sum))
+        samples.append(("_count", (), self.count))
+        return samples
+
+    def summary(self):
+        """ Return a one line description for the --profile report """
+        if not self.count:
+            return "{:>14}".format(0)
+        return "{:>14} total {:>10.4f}  mean {:>10.4f}  max {:>10.4f}".format(
+            _number(self.count), self.sum, self.sum / self.count, self.max)
+
+
+class Registry:
+    """ A named collection of counters and histograms, safe to update from many threads """
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__order = []
+        self.__lock = threading.Lock()
+
+    def counter(self, name, help=""):
+        """ Return the counter with the given name, creating it if necessary """
+        return self.__get(name, lambda: Counter(name, help))
+
+    def histogram(self, name, help="", buckets=SECONDS_BUCKETS):
+        """ Return the histogram with the given name, creating it if necessary """
+        return self.__get(name, lambda: Histogram(name, help, buckets))
+
+    def count(self, name, amount=1):
+        """ Add amount to a counter """
+        metric = self.counter(name)
+        with self.__lock:
+            metric.add(amount)
+
+    def observe(self, name, value):
+        """ Record a value in a histogram """
+        metric = self.histogram(name)
+        with self.__lock:
+            metric.add(value)
+
+    @contextmanager
+    def timed(self, name):
+        """ Record the seconds spent in a with block in a histogram """
+        started = default_timer()
+        try:
+            yield
+        finally:
+            self.observe(name, default_timer() - started)
+
+    def prometheus(self):
+        """ Return everything in the Prometheus text exposition format """
+        pid = ("pid", str(os.getpid()))
+        lines = []
+        with self.__lock:
+            for name in self.__order:
+                metric = self.__metrics[name]
+                full_name = PREFIX + name
+                kind = "histogram" if isinstance(metric, Histogram) else "counter"
+                if metric.help:
+                    lines.append("# HELP {} {}".format(full_name, metric.help))
+                lines.append("# TYPE {} {}".format(full_name, kind))
+                for (suffix, labels, value) in metric.samples():
+                    labels = ",".join(['{}="{}"'.format(key, text) for (key, text) in (pid,) + labels])
+                    lines.append("{}{}{{{}}} {}".format(full_name, suffix, labels, _number(value)))
+        return "\n".join(lines) + "\n"
+
+    def report(self, derived=()):
+        """ Return the lines of a human readable breakdown, as printed by --profile
+
+        derived is a list of extra (name, number) pairs worked out from the
+        metrics, such as rates, to list after them.
+        """
+        with self.__lock:
+            rows = [(name, self.__metrics[name].summary()) for name in self.__order]
+        rows.extend([(name, "{:>14,.0f}".format(value)) for (name, value) in derived])
+        width = max([len(name) for (name, summary) in rows] + [0])
+        return ["{}  {}".format(name.ljust(width), summary) for (name, summary) in rows]
+
+    def __get(self, name, create):
+        metric = self.__metrics.get(name)
+        if metric is None:
+            with self.__lock:
+                metric = self.__metrics.get(name)
+                if metric is None:
+                    metric = create()
+                    self.__metrics[name] = metric
+                    self.__order.append(name)
+        return metric
+
+
+def _number(value):
+    """ Format a number the way Prometheus expects: integers without a decimal point """
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+# The registry everything in this process records to
+registry = Registry()
+
+# The phases of a fingerprint, declared up front so that /metrics always lists
+# them, in this order, even before they have happened
+registry.histogram('parse_seconds', "Time to parse and index a GED file")
+registry.counter('parse_lines_total', "GED lines parsed")
+registry.counter('tree_cache_hits_total', "Trees found already parsed and up to date")
+registry.counter('tree_cache_misses_total', "Trees that had to be parsed, or waited for")
+registry.histogram('select_seconds', "Time to find the people matching a search")
+registry.counter('elements_scanned_total', "People checked against search criteria")
+registry.counter('matches_total', "People matching a search")
+registry.histogram('fingerprint_data_seconds', "Time to gather one person's fingerprint")
+registry.histogram('render_seconds', "Time to turn one fingerprint into HTML or text")
+registry.histogram('request_seconds', "Time to answer a web request")
+
+count = registry.count
+observe = registry.observe
+timed = registry.timed
@@ -0,0 +1,88 @@
+#
+# Phonetic name matching
+#
+# Census enumerators wrote down what they heard, so "Wise" turns up as "Wyse",
+# "Weis" and "Wiese".  Soundex, the code the census bureau itself used to index
+# the returns, gives all of those the same key (W200).
+#
+# PhoneticIndex computes the keys for every name in a tree once, so a
+# "sounds like" search is a dictionary lookup instead of a loop over everyone.
+#
+
+# Soundex digit of each consonant; vowels and H, W, Y have none
+_CODES = {}
+for _letters, _digit in (('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'),
+                         ('L', '4'), ('MN', '5'), ('R', '6')):
+    for _letter in _letters:
+        _CODES[_letter] = _digit
+
+
+def soundex(name):
+    """ Return the American Soundex code of a name, e.g. 'W200', or '' if it has no letters """
+    letters = [c for c in name.upper() if 'A' <= c <= 'Z']
+    if not letters:
+        return ''
+    code = letters[0]
+    last = _CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = _CODES.get(letter, '')
+        if digit and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W don't separate two letters with the same code
+        if letter not in 'HW':
+            last = digit
+    return (code + '000')[:4]
+
+
+def soundex_words(text):
+    """ Return the set of Soundex codes of each word in text """
+    codes = set()
+    for word in text.split():
+        code = soundex(word)
+        if code:
+            codes.add(code)
+    return codes
+
+
+class PhoneticIndex:
+    """ Soundex codes of the given names and surnames of a list of individuals
+
+    Lookups return the positions of the matching individuals in that list.
+    """
+
+    def __init__(self, individuals):
+        self.__surnames = {}
+        self.__given = {}
+        for position, individual in enumerate(individuals):
+            surnames = set()
+            given = set()
+            for (first, last) in individual.names():
+                given.update(soundex_words(first))
+                surnames.update(soundex_words(last))
+            for code in surnames:
+                self.__surnames.setdefault(code, []).append(position)
+            for code in given:
+                self.__given.setdefault(code, []).append(position)
+
+    def surname(self, name):
+        """ Return the set of positions of people with a surname sounding like every word of name """
+        return self.__lookup(self.__surnames, name)
+
+    def given(self, name):
+        """ Return the set of positions of people with given names sounding like every word of name """
+        return self.__lookup(self.__given, name)
+
+    def __lookup(self, index, name):
+        codes = soundex_words(name)
+        if not codes:
+            return set()
+        found = None
+        for code in codes:
+            positions = index.get(code, ())
+            if found is None:
+                found = set(positions)
+            else:
+                found.intersection_update(positions)
+        return found
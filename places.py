@@ -0,0 +1,244 @@
+#
+# Place hierarchy index
+#
+# A PLAC value is a comma separated list from the most to the least specific
+# part: "Cedar Creek, Taney, Missouri, USA".  PlaceIndex splits every place in
+# a tree, tidies up each part, and files it in a trie from the country down
+# (usa -> missouri -> taney -> cedar creek), with postings at each node saying
+# who had what event there, and when.
+#
+# People leave off the country, or the town, so a query doesn't have to start
+# at the top: "Taney, Missouri" finds every node named missouri with a child
+# named taney, wherever it is in the trie, and everything filed under it.
+#
+# The postings at each node are kept in order of the earliest day of their
+# date, so "what happened in Cedar Creek between 1890 and 1910" is a binary
+# search at each node found, and only the events that start close enough to
+# the years to overlap them are looked at.  Events with an open date ("BEF
+# 1900") or one spanning more than WIDE_YEARS are kept apart, as they could
+# overlap almost anything.
+#
+# Parts are compared as UTF-8, which is how the values of a tree are read in,
+# but tidied up as unicode, so that an accented place typed into a form (in
+# any case) is the same as in the file.
+#
+
+import re
+import unicodedata
+import bisect
+from array import array
+import dates
+
+# Different ways of writing the same country, and what they're filed as
+COUNTRIES = {
+    'united states': 'usa',
+    'united states of america': 'usa',
+    'us': 'usa',
+    'u s a': 'usa',
+    'united kingdom': 'uk',
+    'great britain': 'uk',
+}
+
+# Events with dates spanning more years than this are looked at for every search of their place
+WIDE_YEARS = 10
+
+_NOT_WORD = re.compile(r"[^\w']+", re.UNICODE)
+_NOT_ASCII = re.compile(r"[\x80-\xff]")
+
+
+def normalize(part):
+    """ Return one part of a place (UTF-8 or unicode) as UTF-8, lower case, with punctuation
+    and extra spaces removed
+    """
+    if not isinstance(part, unicode):
+        if not _NOT_ASCII.search(part):
+            # Most places, so kept quick
+            return " ".join(_NOT_WORD.split(part.lower())).strip()
+        part = part.decode('utf-8', 'replace')
+    part = unicodedata.normalize('NFC', part).lower()
+    return u" ".join(_NOT_WORD.split(part)).strip().encode('utf-8')
+
+
+def split(place):
+    """ Return the normalized parts of a place, most specific first, leaving out blank parts """
+    parts = [normalize(part) for part in place.split(',')]
+    parts = [part for part in parts if part]
+    if parts:
+        parts[-1] = COUNTRIES.get(parts[-1], parts[-1])
+    return parts
+
+
+def within(place, query):
+    """ Check whether a place is in the place named by query, e.g. "Taney, Missouri" """
+    wanted = split(query)
+    if not wanted:
+        return False
+    parts = split(place)
+    for start in range(len(parts) - len(wanted) + 1):
+        if parts[start:start + len(wanted)] == wanted:
+            return True
+    return False
+
+
+class PlaceNode(object):
+    """ One part of a place, with the places within it and the events that happened exactly there """
+
+    __slots__ = ('name', 'parent', 'children', 'postings', 'starts', 'longest', 'wide')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        # (position of the individual, event tag, year or None, place as written, day span or None):
+        # those with a closed span no wider than WIDE_YEARS first, by earliest day, then the rest
+        self.postings = []
+        # Earliest days of the postings with a closed span, for searching
+        self.starts = None
+        # Days in the longest closed span
+        self.longest = 0
+        # Postings with an open span, such as "BEF 1900", or a wide one
+        self.wide = ()
+
+    def path(self):
+        """ Return the parts of the place this node stands for, most specific first """
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return parts
+
+    def walk(self):
+        """ Yield this node and every node below it """
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            yield node
+            pending.extend(node.children.values())
+
+
+class PlaceIndex:
+    """ Every place an individual, or a family they are a spouse in, had an event
+
+    Lookups return the positions of the individuals in the list the index was
+    built from, or their postings: (position, event tag, year, place, day span).
+    """
+
+    def __init__(self, individuals, gedcom):
+        self.__root = PlaceNode(None, None)
+        # Part name -> every node with that name, at any depth
+        self.__named = {}
+        positions = {}
+        for position, individual in enumerate(individuals):
+            positions[individual] = position
+            self.__add_events(individual, [position])
+
+        # Family events, such as marriages, count for both spouses
+        for element in gedcom.element_list():
+            if element.is_family():
+                spouses = [positions[spouse] for spouse in gedcom.get_family_members(element, "PARENTS")
+                           if spouse in positions]
+                self.__add_events(element, spouses)
+
+        for node in self.__root.walk():
+            self.__order(node)
+
+    def postings(self, query):
+        """ Return the postings of every event in the place named by query, and the places within it """
+        found = []
+        for node in self.__find(split(query)):
+            for child in node.walk():
+                found.extend(child.postings)
+        return found
+
+    def events(self, query, first, last):
+        """ Return the postings of the events in the place named by query, and the places
+        within it, whose dates overlap the years first to last (inclusive)
+        """
+        start = dates.year_start(first)
+        end = dates.year_end(last)
+        found = []
+        for node in self.__find(split(query)):
+            for child in node.walk():
+                if child.starts:
+                    low = bisect.bisect_left(child.starts, start - child.longest)
+                    high = bisect.bisect_right(child.starts, end)
+                    found.extend([posting for posting in child.postings[low:high] if posting[4][1] >= start])
+                found.extend([posting for posting in child.wide if dates.overlaps(posting[4], first, last)])
+        return found
+
+    def place(self, query):
+        """ Return the set of positions of people with an event in the place named by query """
+        return set([posting[0] for posting in self.postings(query)])
+
+    def __find(self, wanted):
+        """ Return the nodes whose path ends with the wanted parts (most specific first) """
+        if not wanted:
+            return []
+        # Start from the least specific part, and walk down towards the most
+        nodes = self.__named.get(wanted[-1], [])
+        for part in reversed(wanted[:-1]):
+            nodes = [node.children[part] for node in nodes if part in node.children]
+        # A node inside another found node is already covered by its walk
+        found = set(nodes)
+        return [node for node in nodes if not self.__below_any(node, found)]
+
+    def __below_any(self, node, nodes):
+        parent = node.parent
+        while parent is not None:
+            if parent in nodes:
+                return True
+            parent = parent.parent
+        return False
+
+    def __add_events(self, element, positions):
+        """ File the places of the events under element for each of the positions """
+        for event in element.children():
+            place = None
+            when = ''
+            for detail in event.children():
+                if detail.tag() == "PLAC":
+                    place = detail.value()
+                elif detail.tag() == "DATE":
+                    when = detail.value()
+            if not place or not positions:
+                continue
+            node = self.__node(split(place))
+            span = dates.parse(when)
+            year = dates.year(span)
+            for position in positions:
+                node.postings.append((position, event.tag(), year, place, span))
+
+    def __order(self, node):
+        """ Put the postings of a node with a closed span in order of their earliest day """
+        closed = []
+        other = []
+        wide = WIDE_YEARS * 366
+        for posting in node.postings:
+            span = posting[4]
+            if span is None:
+                continue
+            if span[0] != dates.MIN_DAY and span[1] != dates.MAX_DAY and span[1] - span[0] <= wide:
+                closed.append(posting)
+            else:
+                other.append(posting)
+        closed.sort(key=lambda posting: posting[4][0])
+        undated = [posting for posting in node.postings if posting[4] is None]
+        node.postings = closed + other + undated
+        if closed:
+            node.starts = array('i', [posting[4][0] for posting in closed])
+            node.longest = max([posting[4][1] - posting[4][0] for posting in closed])
+        if other:
+            node.wide = tuple(other)
+
+    def __node(self, parts):
+        """ Return the node for a place, creating it and its parents if necessary """
+        node = self.__root
+        for part in reversed(parts):
+            child = node.children.get(part)
+            if child is None:
+                child = PlaceNode(part, node)
+                node.children[part] = child
+                self.__named.setdefault(part, []).append(child)
+            node = child
+        return node
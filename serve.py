@@ -0,0 +1,186 @@
+#
+# Pre-forking production server
+#
+# The Flask development server handles one request at a time in one process, so
+# a single slow fingerprint blocks everybody.  Here the parent process parses
+# every GED file in the upload folder *before* forking a pool of workers, so the
+# parsed trees are shared between the workers copy-on-write instead of being
+# parsed (and held in memory) once per worker.
+#
+# The parent then just supervises: it restarts workers that die, and when the
+# upload folder changes (or it receives SIGHUP) it reparses, forks a fresh set
+# of workers, and asks the old ones to finish their current request and exit.
+#
+
+import os
+import gc
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import traceback
+from werkzeug.serving import make_server
+from trees import ged_files, file_stamp
+
+# How often, in seconds, the parent checks the upload folder for changes
+POLL_INTERVAL = 2.0
+
+# How long, in seconds, a worker waits for a connection before checking whether
+# it has been asked to stop
+WORKER_TIMEOUT = 1.0
+
+
+def upload_stamp(directory):
+    """ Return a value that changes whenever a GED file in the folder changes """
+    stamps = []
+    for filepath in ged_files(directory):
+        try:
+            stamps.append((filepath, file_stamp(filepath)))
+        except OSError:
+            pass
+    return stamps
+
+
+def serve(app, cache, directory, host, port, workers, watcher=None):
+    """ Preload the trees in directory into cache, then serve app from a pool of workers
+
+    The manifest of an UploadWatcher on the directory, if given, is brought up
+    to date each time the trees are loaded, for the workers to inherit.
+    """
+
+    server = make_server(host, port, app)
+    # Non-blocking accept, so the workers that lose the race for a connection
+    # go straight back to waiting instead of blocking in accept()
+    server.socket.setblocking(0)
+    server.timeout = WORKER_TIMEOUT
+
+    state = {'reload': False, 'stop': False}
+
+    def on_reload(signum, frame):
+        state['reload'] = True
+
+    def on_stop(signum, frame):
+        state['stop'] = True
+
+    signal.signal(signal.SIGHUP, on_reload)
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+
+    stamp = _preload(cache, directory, watcher)
+    pids = set(_spawn(server, workers))
+    print("Serving on http://{}:{}/ with {} workers".format(host, port, workers))
+
+    while not state['stop']:
+        time.sleep(POLL_INTERVAL)
+
+        # Replace any worker that died unexpectedly
+        for pid in _reap(pids):
+            pids.discard(pid)
+            if not state['stop']:
+                pids.update(_spawn(server, 1))
+
+        new_stamp = upload_stamp(directory)
+        if state['reload'] or new_stamp != stamp:
+            state['reload'] = False
+            stamp = _preload(cache, directory, watcher)
+            old_pids = pids
+            pids = set(_spawn(server, workers))
+            # The old workers finish the request they are on, then exit
+            _signal_all(old_pids, signal.SIGTERM)
+            _wait_all(old_pids)
+
+    _signal_all(pids, signal.SIGTERM)
+    _wait_all(pids)
+    server.server_close()
+
+
+def _preload(cache, directory, watcher):
+    """ Parse all the trees, and get them ready to be shared by forked workers """
+    stamp = upload_stamp(directory)
+    started = time.time()
+    trees = cache.preload(directory)
+    print("Preloaded {} trees in {:.1f}s".format(len(trees), time.time() - started))
+    if watcher is not None:
+        watcher.scan()
+
+    # Collect now, so the workers don't each start off by running a collection
+    # that writes to (and so unshares) every page of the preloaded trees.
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        # Python 3.7+: move everything to a permanent generation that the
+        # collector never visits again
+        gc.freeze()
+    return stamp
+
+
+def _spawn(server, count):
+    """ Fork count workers serving requests from server, returning their pids """
+    pids = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            _worker(server)
+        pids.append(pid)
+    return pids
+
+
+def _worker(server):
+    """ Body of a worker process: handle requests until asked to stop """
+    state = {'stop': False}
+
+    def on_stop(signum, frame):
+        state['stop'] = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    status = 0
+    try:
+        while not state['stop']:
+            try:
+                server.handle_request()
+            except (select.error, socket.error) as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def _reap(pids):
+    """ Return the pids of workers that have exited, without blocking """
+    dead = []
+    for pid in pids:
+        try:
+            done, status = os.waitpid(pid, os.WNOHANG)
+        except OSError:
+            done = pid
+        if done:
+            dead.append(pid)
+    return dead
+
+
+def _signal_all(pids, signum):
+    for pid in pids:
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+
+def _wait_all(pids):
+    for pid in pids:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+            break
@@ -0,0 +1,162 @@
+#
+# Writing part of a tree as a GED file of its own
+#
+# To send someone the family around one person, select() picks the people
+# (ancestors so many generations up, descendants so many down, and the
+# spouses in between) and the families joining them.  closure() then adds
+# every other record those refer to (sources, notes, multimedia objects,
+# repositories, submitters), and the records those refer to, and so on.  Only
+# records reachable that way are looked at, so the time taken grows with the
+# size of what is written, not the size of the file.
+#
+# write() (or blocks()) streams the records out as a standalone GED file: a HEAD record
+# (the original one, if there is one, saying the file is now UTF-8), the
+# records, and TRLR.  Lines pointing to records that aren't in the subset,
+# such as the FAMC of the earliest ancestors, are left out with everything
+# under them, so the file has no dangling pointers.  Values that were joined
+# from CONT and CONC lines when the file was read are split up again.
+#
+
+from gedcom import value_lines
+
+# Lines gathered before each write
+BLOCK = 1000
+
+# Records linking people, which are only in a subset if select() chose them
+FAMILY_RECORDS = ("INDI", "FAM")
+
+
+def select(gedcom, targets, ancestors=1, descendants=1):
+    """ Return the people and families around some people, as a list of records
+
+    That is each target, their spouses, their ancestors up to the given
+    generations (1 for parents), their descendants down to the given
+    generations (1 for children) and the spouses of those descendants, and the
+    families with at least two of those people in them.
+    """
+    people = []
+    chosen = set()
+
+    def add(person):
+        if person.pointer() not in chosen:
+            chosen.add(person.pointer())
+            people.append(person)
+
+    for target in targets:
+        add(target)
+        generation = [target]
+        for up in range(ancestors):
+            above = []
+            for person in generation:
+                for parent in gedcom.get_parents(person):
+                    if parent.pointer() not in chosen:
+                        above.append(parent)
+                    add(parent)
+            generation = above
+        for family in gedcom.families(target):
+            for spouse in gedcom.get_family_members(family, "PARENTS"):
+                add(spouse)
+            if descendants > 0:
+                for (element, generation, in_law) in gedcom.get_descendants(family, descendants):
+                    add(element)
+
+    # The families the people are in, once each, in the order they come to them
+    families = []
+    seen = set()
+    for person in people:
+        for family in gedcom.families(person, "FAMC") + gedcom.families(person, "FAMS"):
+            if family.pointer() in seen:
+                continue
+            seen.add(family.pointer())
+            members = [member for member in family.children()
+                       if member.tag() in ("HUSB", "WIFE", "CHIL") and member.value() in chosen]
+            if len(members) >= 2:
+                families.append(family)
+    return people + families
+
+
+def closure(gedcom, records):
+    """ Return the records plus every other record they refer to, directly or not
+
+    People and families are only followed to if they are already in records.
+    """
+    found = list(records)
+    included = set([record.pointer() for record in found])
+    records = gedcom.element_dict()
+    # Records whose lines haven't been looked through yet
+    pending = list(found)
+    while pending:
+        elements = [pending.pop()]
+        while elements:
+            element = elements.pop()
+            value = element.value()
+            if value[:1] == '@' and value not in included:
+                record = records.get(value)
+                if record is not None and record.tag() not in FAMILY_RECORDS:
+                    included.add(value)
+                    found.append(record)
+                    pending.append(record)
+            elements.extend(element.children())
+    return found
+
+
+def extract(gedcom, targets, ancestors=1, descendants=1):
+    """ Return the records of a standalone subset around some people (see select()) """
+    head = _head(gedcom)
+    if head is None:
+        return closure(gedcom, select(gedcom, targets, ancestors, descendants))
+    # The submitter the HEAD record names goes along too
+    return closure(gedcom, [head] + select(gedcom, targets, ancestors, descendants))[1:]
+
+
+def write(gedcom, records, out):
+    """ Write records to an open file as a standalone GED file, returning how many were written """
+    for block in blocks(gedcom, records):
+        out.write(block)
+    return len(records)
+
+
+def blocks(gedcom, records):
+    """ Yield the text of a standalone GED file of records, a block of lines at a time """
+    included = set([record.pointer() for record in records])
+    head = _head(gedcom)
+    lines = []
+    if head is None:
+        lines.extend(["0 HEAD", "1 GEDC", "2 VERS 5.5", "2 FORM LINEAGE-LINKED", "1 CHAR UTF-8"])
+    else:
+        _lines(head, included, lines)
+    for record in records:
+        _lines(record, included, lines)
+        if len(lines) >= BLOCK:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    lines.append("0 TRLR")
+    yield "\n".join(lines) + "\n"
+
+
+def _head(gedcom):
+    """ Return the HEAD record of a file, or None """
+    for element in gedcom.element_list()[:1]:
+        if element.tag() == "HEAD":
+            return element
+    return None
+
+
+def _lines(record, included, lines):
+    """ Add the lines of a record to a list, leaving out pointers to records that aren't included """
+    elements = [record]
+    while elements:
+        element = elements.pop()
+        value = element.value()
+        if element is not record and value[:1] == '@' and value[-1:] == '@' and value not in included:
+            continue
+        if element.tag() == "CHAR" and element.level() == 1 and record.tag() == "HEAD":
+            # Values were all read in as UTF-8
+            value = "UTF-8"
+        line = str(element.level())
+        if element.pointer():
+            line += " " + element.pointer()
+        line += " " + element.tag()
+        value_lines(line, element.level() + 1, value, lines)
+        elements.extend(reversed(element.children()))
+
@@ -0,0 +1,251 @@
+#
+# Synthetic GEDCOM generator
+#
+# Writes a made-up but realistic family tree, for benchmarking and trying
+# things out without anybody's real data.  The same size and seed always give
+# exactly the same file.
+#
+# The tree starts from a generation of founders born in the 1700s.  People
+# marry, mostly someone from outside the tree but sometimes another descendant
+# (so the tree has pedigree collapse, as real ones do), and have children,
+# generation after generation, until there are enough people.  Everyone gets
+# names (with the spelling variations census takers were fond of), a birth,
+# usually a death, residences and census entries, with dates written in the
+# assortment of styles real GED files use.
+#
+# usage: synthetic.py individuals output.ged [--seed SEED]
+#
+
+import sys
+import random
+import argparse
+from array import array
+
+SURNAMES = [
+    ['Wise', 'Wyse', 'Weis', 'Wiese'], ['Crouch', 'Crouche'], ['Smith', 'Smyth'],
+    ['Thornberry', 'Thornbury'], ['Seth'], ['Baker'], ['Miller', 'Muller', 'Mueller'],
+    ['Johnson', 'Johnsen'], ['Clark', 'Clarke'], ['Reed', 'Reid', 'Read'],
+    ['Meyer', 'Meier', 'Myers'], ['Carter'], ['Howard'], ['Gray', 'Grey'],
+    ['Schmidt', 'Schmitt'], ['Peterson', 'Petersen'], ['Walker'], ['Young'],
+    ['Allen', 'Allan'], ['Wright'], ['Scott'], ['Green', 'Greene'], ['Adams'],
+    ['Nelson'], ['Hill'], ['Campbell'], ['Mitchell'], ['Roberts'], ['Phillips'],
+    ['Evans'], ['Turner'], ['Torres'], ['Parker'], ['Collins'], ['Edwards'],
+    ['Stewart'], ['Morris'], ['Murphy'], ['Cook', 'Cooke'], ['Rogers']
+]
+MALE = ['Carl', 'William', 'Robert', 'John', 'James', 'George', 'Charles', 'Henry',
+        'Wilhelm', 'Jabez', 'Thomas', 'Edwin', 'Samuel', 'Joseph', 'Frank', 'Walter']
+FEMALE = ['Mary', 'Lizzie', 'Edna', 'Matilda', 'Anna', 'Emma', 'Elizabeth', 'Sarah',
+          'Margaret', 'Martha', 'Clara', 'Ida', 'Bertha', 'Minnie', 'Alice', 'Grace']
+MIDDLE = ['', '', '', 'O', 'A', 'May', 'Lee', 'Ann', 'E', 'J']
+
+STATES = ['Missouri', 'Kansas', 'California', 'Iowa', 'Illinois', 'Ohio',
+          'Kentucky', 'Tennessee', 'Indiana', 'Nebraska']
+COUNTIES = ['Taney', 'Montgomery', 'Amador', 'Jackson', 'Clay', 'Greene',
+            'Franklin', 'Washington', 'Marion', 'Lincoln']
+TOWNS = ['Cedar Creek', 'Oliver', 'Independence', 'Springfield', 'Fairview',
+         'Salem', 'Union', 'Oak Grove', 'Riverside', 'Long Beach']
+
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+# The latest year anything happens; people born before it may still be alive
+PRESENT = 2020
+
+# Chance that someone marries another descendant instead of an outsider
+COLLAPSE = 0.05
+
+
+def generate(individuals, out, seed=1):
+    """ Write a tree of about the given number of individuals as GEDCOM to out """
+    rng = random.Random(seed)
+
+    # The people, as parallel arrays indexed by person number
+    sex = array('b')         # 0 male, 1 female
+    birth = array('h')
+    death = array('h')       # 0 if still alive
+    surname = array('h')     # index into SURNAMES
+    famc = array('i')        # family they are a child of, or -1
+    fams = array('i')        # family they are a spouse in, or -1
+
+    # The families: husband, wife, marriage year, first child and child count
+    husb = array('i')
+    wife = array('i')
+    married = array('h')
+    first_child = array('i')
+    child_count = array('h')
+
+    def add_person(person_sex, born, family, name):
+        sex.append(person_sex)
+        birth.append(born)
+        lifespan = int(rng.gauss(62, 18))
+        died = born + max(0, min(lifespan, 105))
+        death.append(died if died <= PRESENT else 0)
+        surname.append(name)
+        famc.append(family)
+        fams.append(-1)
+        return len(sex) - 1
+
+    # Founders, born over forty years in the 1700s
+    founders = max(2, individuals // 50)
+    waiting = []
+    for _ in range(founders):
+        waiting.append(add_person(rng.randint(0, 1), rng.randint(1700, 1740), -1, rng.randrange(len(SURNAMES))))
+
+    # Unmarried descendants, by sex, who might marry each other
+    single = ([], [])
+    next_up = 0
+    while len(sex) < individuals:
+        if next_up == len(waiting):
+            # Everyone has had their chance: somebody new moves into the area
+            waiting.append(add_person(rng.randint(0, 1), rng.randint(1700, 1900), -1, rng.randrange(len(SURNAMES))))
+        person = waiting[next_up]
+        next_up += 1
+        if fams[person] >= 0 or death[person] and death[person] - birth[person] < 18:
+            continue
+        if birth[person] + 18 > PRESENT:
+            continue
+
+        family = len(husb)
+        year = birth[person] + rng.randint(18, 35)
+        spouse = -1
+        candidates = single[1 - sex[person]]
+        if candidates and rng.random() < COLLAPSE:
+            # Marry another descendant, quite likely a cousin
+            spouse = candidates.pop(rng.randrange(len(candidates)))
+            unsuitable = (fams[spouse] >= 0 or
+                          abs(birth[spouse] - birth[person]) > 10 or
+                          famc[spouse] == famc[person] or
+                          death[spouse] and death[spouse] < year)
+            if unsuitable:
+                spouse = -1
+        if spouse < 0:
+            spouse = add_person(1 - sex[person], birth[person] + rng.randint(-5, 5), -1, rng.randrange(len(SURNAMES)))
+        if sex[person] == 0:
+            husb.append(person)
+            wife.append(spouse)
+        else:
+            husb.append(spouse)
+            wife.append(person)
+        fams[person] = family
+        fams[spouse] = family
+        married.append(min(year, PRESENT))
+
+        # Children, every couple of years after the marriage
+        first_child.append(len(sex))
+        count = 0
+        mother = wife[family]
+        child_year = year + rng.randint(1, 3)
+        for _ in range(rng.choice([0, 1, 2, 2, 3, 3, 4, 4, 5, 6, 7, 8])):
+            if child_year > PRESENT or child_year > birth[mother] + 45 or len(sex) >= individuals:
+                break
+            child = add_person(rng.randint(0, 1), child_year, family, surname[husb[family]])
+            count += 1
+            waiting.append(child)
+            single[sex[child]].append(child)
+            child_year += rng.randint(1, 4)
+        child_count.append(count)
+
+    write = out.write
+    write("0 HEAD\n1 SOUR synthetic.py\n1 GEDC\n2 VERS 5.5.1\n2 FORM LINEAGE-LINKED\n1 CHAR UTF-8\n")
+
+    for person in range(len(sex)):
+        lines = ["0 @I{}@ INDI".format(person + 1)]
+        spellings = SURNAMES[surname[person]]
+        last = spellings[rng.randrange(len(spellings))]
+        first = rng.choice(FEMALE if sex[person] else MALE)
+        middle = rng.choice(MIDDLE)
+        given = "{} {}".format(first, middle) if middle else first
+        lines.append("1 NAME {} /{}/".format(given, last))
+        if rng.random() < 0.5:
+            lines.append("2 GIVN {}".format(given))
+            lines.append("2 SURN {}".format(last))
+        lines.append("1 SEX {}".format("F" if sex[person] else "M"))
+
+        born = birth[person]
+        lines.append("1 BIRT")
+        lines.append("2 DATE {}".format(_date(rng, born)))
+        home = _place(rng)
+        lines.append("2 PLAC {}".format(home))
+
+        final = death[person] or PRESENT
+        for year in range(born - born % 10 + 10, min(final, 1950) + 1, 10):
+            if year >= 1790 and rng.random() < 0.6:
+                if rng.random() < 0.3:
+                    home = _place(rng)
+                tag = "CENS" if rng.random() < 0.5 else "RESI"
+                lines.append("1 {}".format(tag))
+                lines.append("2 DATE {}".format(year if rng.random() < 0.8 else "1 APR {}".format(year)))
+                lines.append("2 PLAC {}".format(home))
+
+        if death[person]:
+            lines.append("1 DEAT")
+            lines.append("2 DATE {}".format(_date(rng, death[person])))
+            lines.append("2 PLAC {}".format(home))
+        if famc[person] >= 0:
+            lines.append("1 FAMC @F{}@".format(famc[person] + 1))
+        if fams[person] >= 0:
+            lines.append("1 FAMS @F{}@".format(fams[person] + 1))
+        lines.append("")
+        write("\n".join(lines))
+
+    for family in range(len(husb)):
+        lines = ["0 @F{}@ FAM".format(family + 1),
+                 "1 HUSB @I{}@".format(husb[family] + 1),
+                 "1 WIFE @I{}@".format(wife[family] + 1)]
+        for child in range(first_child[family], first_child[family] + child_count[family]):
+            lines.append("1 CHIL @I{}@".format(child + 1))
+        lines.append("1 MARR")
+        lines.append("2 DATE {}".format(_date(rng, married[family])))
+        lines.append("2 PLAC {}".format(_place(rng)))
+        lines.append("")
+        write("\n".join(lines))
+
+    write("0 TRLR\n")
+    return len(sex)
+
+
+def _date(rng, year):
+    """ A date in the given year, written in one of the many ways GED files do """
+    style = rng.random()
+    if style < 0.4:
+        return "{} {} {}".format(rng.randint(1, 28), MONTHS[rng.randrange(12)], year)
+    if style < 0.7:
+        return str(year)
+    if style < 0.8:
+        return "ABT {}".format(year)
+    if style < 0.85:
+        return "{} {}".format(MONTHS[rng.randrange(12)], year)
+    if style < 0.9:
+        return "BEF {}".format(year + 1)
+    if style < 0.95:
+        return "BET {} AND {}".format(year - 1, year + 1)
+    return "CAL {}".format(year)
+
+
+def _place(rng):
+    """ A place somewhere in the made-up part of the USA, sometimes less precisely """
+    state = rng.randrange(len(STATES))
+    county = COUNTIES[(state + rng.randrange(4)) % len(COUNTIES)]
+    town = TOWNS[(state * 3 + rng.randrange(5)) % len(TOWNS)]
+    style = rng.random()
+    if style < 0.7:
+        return "{}, {}, {}, USA".format(town, county, STATES[state])
+    if style < 0.9:
+        return "{}, {}".format(county, STATES[state])
+    return "{}, USA".format(STATES[state])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write a synthetic GEDcom file")
+    parser.add_argument("individuals", type=int, help="How many people to put in the tree")
+    parser.add_argument("output", help="File to write, or - for standard output")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed; the same seed always gives the same tree")
+
+    args = parser.parse_args()
+
+    if args.output == '-':
+        generate(args.individuals, sys.stdout, args.seed)
+    else:
+        with open(args.output, 'w') as out:
+            count = generate(args.individuals, out, args.seed)
+        print("Wrote {} individuals to {}".format(count, args.output))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Tests of name completion
+#
+# run from the top of the repository: python -m unittest discover tests
+#
+
+import os
+import json
+import tempfile
+import unittest
+import completion
+import main
+from trees import Tree
+
+# Names as a GED file has them: UTF-8
+NAMES = ["Hans /Müller/", "Greta /Müller/", "Émile /Roy/", "Carl /Muller/"]
+
+
+def write_ged(names):
+    """ Write a GED file of people with the given NAME values, returning its path """
+    lines = ["0 HEAD", "1 CHAR UTF-8"]
+    for (n, name) in enumerate(names):
+        lines.extend(["0 @I{}@ INDI".format(n), "1 NAME {}".format(name)])
+    lines.append("0 TRLR")
+    (handle, path) = tempfile.mkstemp(suffix=".ged")
+    with os.fdopen(handle, 'w') as out:
+        out.write("\n".join(lines) + "\n")
+    return path
+
+
+class CompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = write_ged(NAMES)
+        self.tree = Tree(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_non_ascii_prefix(self):
+        # Typed in as unicode, in any case
+        for prefix in (u"Mü", u"mÜ", u"MÜLL"):
+            found = self.tree.completions().surname(prefix)
+            self.assertEqual([(name, len(positions)) for (name, positions) in found], [("Müller", 2)])
+        found = self.tree.completions().given(u"é")
+        self.assertEqual([name for (name, positions) in found], ["Émile"])
+
+    def test_ascii_prefix(self):
+        found = self.tree.completions().surname(u"m")
+        self.assertEqual([name for (name, positions) in found], ["Müller", "Muller"])
+
+    def test_autocomplete_page(self):
+        main.tree_cache.get(self.path)
+        client = main.app.test_client()
+        query = u"/autocomplete?field=surname&prefix=Mü&gedFile={}".format(self.path)
+        response = client.get(query.encode('utf-8'))
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.data)
+        self.assertEqual([entry['name'] for entry in body['completions']], [u"Müller"])
+
+
+if __name__ == '__main__':
+    unittest.main()
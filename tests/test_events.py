@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Tests of finding the events in a place during some years
+#
+# run from the top of the repository: python -m unittest discover tests
+#
+
+import os
+import json
+import tempfile
+import unittest
+import main
+
+GED = """0 HEAD
+1 CHAR UTF-8
+0 @I1@ INDI
+1 NAME Hans /Müller/
+1 BIRT
+2 DATE 1880
+2 PLAC Québec, Canada
+0 @I2@ INDI
+1 BIRT
+2 DATE 1881
+2 PLAC Québec, Canada
+0 @I3@ INDI
+1 NAME Émile /Roy/
+1 RESI
+2 DATE 1900
+2 PLAC Montréal, Québec, Canada
+0 @I4@ INDI
+1 NAME Carl /Wise/
+1 RESI
+2 DATE 1900
+2 PLAC Taney, Missouri, USA
+0 TRLR
+"""
+
+
+class EventsPageTest(unittest.TestCase):
+
+    def setUp(self):
+        (handle, self.path) = tempfile.mkstemp(suffix=".ged")
+        with os.fdopen(handle, 'w') as out:
+            out.write(GED)
+        main.tree_cache.get(self.path)
+        self.client = main.app.test_client()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def get(self, place, years, extra=u""):
+        query = u"/events?gedFile={}&place={}&years={}{}".format(self.path, place, years, extra)
+        return self.client.get(query.encode('utf-8'))
+
+    def test_non_ascii_place(self):
+        response = self.get(u"Québec", u"1870-1910")
+        self.assertEqual(response.status_code, 200)
+        page = response.data
+        self.assertTrue(page.rstrip().endswith("</html>"))
+        self.assertTrue("Québec from 1870 to 1910" in page)
+        for name in ("Hans Müller", "Émile Roy", "?"):
+            self.assertTrue("<td>{}".format(name) in page, name)
+        self.assertFalse("Carl Wise" in page)
+
+    def test_non_ascii_place_json(self):
+        response = self.get(u"QUÉBEC", u"1900", u"&format=json")
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual([row['name'] for row in rows], [u"Émile Roy"])
+
+    def test_bad_input(self):
+        self.assertEqual(self.get(u"", u"1900").status_code, 400)
+        for years in (u"0", u"1900-99999", u"é", u"1910-1890"):
+            self.assertEqual(self.get(u"Québec", years).status_code, 400, years)
+
+
+if __name__ == '__main__':
+    unittest.main()
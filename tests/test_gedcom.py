@@ -0,0 +1,84 @@
+#
+# Tests of reading and writing GED files
+#
+# run from the top of the repository: python -m unittest discover tests
+#
+
+import os
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+from gedcom import Gedcom, MAX_VALUE
+
+# A NOTE of three lines, the last too long for one line of a GED file
+NOTE = "First line\nSecond line, continued\n" + "word " * (MAX_VALUE // 2)
+
+GED = """0 HEAD
+1 CHAR UTF-8
+0 @I1@ INDI
+1 NAME Carl /Wise/
+1 NOTE First line
+2 CONT Second line,
+2 CONC  continued
+2 CONT {}
+0 TRLR
+""".format("word " * (MAX_VALUE // 2))
+
+
+def write_file(text):
+    """ Write text to a new GED file, returning its path """
+    (handle, path) = tempfile.mkstemp(suffix=".ged")
+    with os.fdopen(handle, 'w') as out:
+        out.write(text)
+    return path
+
+
+def read(text):
+    """ Parse GED text """
+    path = write_file(text)
+    try:
+        return Gedcom(path)
+    finally:
+        os.remove(path)
+
+
+def note(gedcom):
+    """ The value of the NOTE of the first person """
+    person = gedcom.element_dict()['@I1@']
+    return [child.value() for child in person.children() if child.tag() == "NOTE"][0]
+
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gedcom = read(GED)
+
+    def test_read_joins_continuations(self):
+        self.assertEqual(note(self.gedcom), NOTE)
+
+    def test_print_gedcom_round_trip(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.gedcom.print_gedcom()
+            written = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.check_lines(written)
+        self.assertEqual(note(read(written)), NOTE)
+
+    def test_get_individual_round_trip(self):
+        written = self.gedcom.element_dict()['@I1@'].get_individual()
+        self.check_lines(written)
+        self.assertEqual(note(read("0 HEAD\n" + written + "\n0 TRLR\n")), NOTE)
+
+    def check_lines(self, text):
+        for line in text.splitlines():
+            (level, tag) = line.split(" ")[:2]
+            self.assertTrue(level.isdigit(), line)
+            self.assertTrue(len(line) <= 255, line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#
+# Tests of the whole-tree relationship arrays
+#
+# run from the top of the repository: python -m unittest discover tests
+#
+
+import os
+import random
+import tempfile
+import unittest
+import graph
+from trees import Tree
+
+
+def write_ged(people, families):
+    """ Write a GED file of people numbered 0 to people - 1, and families of
+    (husband, wife, [children]), returning its path
+    """
+    lines = ["0 HEAD", "1 CHAR UTF-8"]
+    for n in range(people):
+        lines.extend(["0 @I{}@ INDI".format(n), "1 NAME P{} /Test/".format(n)])
+    for (number, (husband, wife, children)) in enumerate(families):
+        lines.extend(["0 @F{}@ FAM".format(number), "1 HUSB @I{}@".format(husband), "1 WIFE @I{}@".format(wife)])
+        lines.extend(["1 CHIL @I{}@".format(child) for child in children])
+    lines.append("0 TRLR")
+    (handle, path) = tempfile.mkstemp(suffix=".ged")
+    with os.fdopen(handle, 'w') as out:
+        out.write("\n".join(lines) + "\n")
+    return path
+
+
+def read_graph(people, families):
+    """ Return the Graph of a tree of people and families (see write_ged()) """
+    path = write_ged(people, families)
+    try:
+        return graph.Graph(Tree(path))
+    finally:
+        os.remove(path)
+
+
+def reachable(relations, n):
+    """ How many different people can be reached from person n, the slow way """
+    seen = set()
+    pending = list(relations.of(n))
+    while pending:
+        other = pending.pop()
+        if other not in seen:
+            seen.add(other)
+            pending.extend(relations.of(other))
+    return len(seen)
+
+
+class CountTest(unittest.TestCase):
+
+    def test_cousins_counted_once(self):
+        # 0 and 1 have 2 and 3; 2 marries 4 and 3 marries 5; their children 6 and 7,
+        # first cousins, have 8
+        relations = read_graph(9, [(0, 1, [2, 3]), (2, 4, [6]), (3, 5, [7]), (6, 7, [8])])
+        # 6, 7, 2, 4, 3, 5, 0 and 1, though 0 and 1 are on two lines
+        self.assertEqual(relations.ancestor_counts()[relations.index('@I8@')], 8)
+        # 2, 3, 6, 7 and 8
+        self.assertEqual(relations.descendant_counts()[relations.index('@I0@')], 5)
+
+    def test_everyone_related(self):
+        # Generations whose parents are paired at random from the generation before, so
+        # everyone soon descends from nearly everyone: big enough that the people reached
+        # are kept as bits, not sets
+        (generations, width) = (30, 40)
+        rng = random.Random(1)
+        families = []
+        for generation in range(1, generations):
+            parents = range((generation - 1) * width, generation * width)
+            rng.shuffle(parents)
+            for k in range(width // 2):
+                children = [generation * width + 2 * k, generation * width + 2 * k + 1]
+                families.append((parents[2 * k], parents[2 * k + 1], children))
+        relations = read_graph(generations * width, families)
+        ancestors = relations.ancestor_counts()
+        descendants = relations.descendant_counts()
+        for n in range(relations.size()):
+            self.assertEqual(ancestors[n], reachable(relations.parents(), n))
+            self.assertEqual(descendants[n], reachable(relations.children(), n))
+        self.assertTrue(max(ancestors) > 900)
+
+
+if __name__ == '__main__':
+    unittest.main()
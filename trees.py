@@ -0,0 +1,429 @@
+#
+# Cache of parsed Gedcom trees
+#
+# Parsing a GED file is by far the most expensive thing the web pages do, so
+# every parsed file is kept here, keyed by its absolute path, and reparsed only
+# when the file on disk changes (different modification time or size).
+#
+# Parsing happens on a small pool of background threads, never on the thread
+# asking for the tree, and only once per version of a file: if several requests
+# want the same file while it is being parsed, they all wait on the one parse.
+#
+# The cache can be given a memory budget.  Before a file is parsed, the size
+# of its tree is estimated from the size of the file, going by what the trees
+# already cached take per byte of their files, and a file whose tree wouldn't
+# fit even on its own is refused without being parsed.  Once parsed, the size
+# of the tree is estimated again from the tree itself, and the least recently
+# used trees are dropped to make room for it.
+#
+
+import os
+import glob
+import threading
+from multiprocessing.pool import ThreadPool
+import metrics
+import memory
+from gedcom import Gedcom
+from phonetic import PhoneticIndex
+from household import HouseholdIndex
+from places import PlaceIndex
+from census import LifespanIndex
+from completion import CompletionIndex
+
+# How many files may be parsed at the same time
+PARSE_THREADS = 2
+
+# When estimating the size of a tree for the memory budget, look at one element in this many
+ESTIMATE_SAMPLE = 50
+
+# Bytes of parsed tree per byte of GED file, until there are cached trees to go by
+# (about 15 to 17 for files of thousands of people or more)
+BYTES_PER_FILE_BYTE = 20
+
+
+def file_stamp(filepath):
+    """ Return a (mtime, size) tuple identifying the current version of a file """
+    stat = os.stat(filepath)
+    return (stat.st_mtime, stat.st_size)
+
+
+def ged_files(directory):
+    """ Return the paths of all the GED files in a directory """
+    return sorted(glob.glob(os.path.join(directory, "*.ged")))
+
+
+class Tree:
+    """ A parsed Gedcom file and its indexes, remembering which version of the file it came from """
+
+    def __init__(self, filepath, stamp=None):
+        """ Parse the given file and index it.  The stamp is looked up if not supplied. """
+        if stamp is None:
+            stamp = file_stamp(filepath)
+        self.__filepath = filepath
+        self.__stamp = stamp
+        with metrics.timed('parse_seconds'):
+            self.__gedcom = Gedcom(filepath)
+            self.__individuals = [e for e in self.__gedcom.element_list() if e.is_individual()]
+            self.__phonetic = PhoneticIndex(self.__individuals)
+            self.__households = HouseholdIndex(self.__gedcom)
+            self.__places = PlaceIndex(self.__individuals, self.__gedcom)
+            self.__lifespans = LifespanIndex(self.__individuals)
+            self.__completions = CompletionIndex(self.__individuals)
+        # Every line of the file is one element
+        metrics.count('parse_lines_total', len(self.__gedcom.element_list()))
+        # Criteria that can be answered from an index: key -> lookup returning positions
+        self.__lookups = {
+            'surnamephon': self.__phonetic.surname,
+            'namephon': self.__phonetic.given,
+            'place': self.__places.place
+        }
+
+    def filepath(self):
+        """ Return the absolute path of the parsed file """
+        return self.__filepath
+
+    def stamp(self):
+        """ Return the (mtime, size) of the file when it was parsed """
+        return self.__stamp
+
+    def gedcom(self):
+        """ Return the parsed Gedcom data """
+        return self.__gedcom
+
+    def individuals(self):
+        """ Return all of the individuals, in file order """
+        return self.__individuals
+
+    def phonetic(self):
+        """ Return the PhoneticIndex of everyone's names """
+        return self.__phonetic
+
+    def households(self):
+        """ Return the HouseholdIndex of every family's birth years """
+        return self.__households
+
+    def places(self):
+        """ Return the PlaceIndex of everyone's events """
+        return self.__places
+
+    def lifespans(self):
+        """ Return the LifespanIndex of everyone's birth and final years """
+        return self.__lifespans
+
+    def completions(self):
+        """ Return the CompletionIndex of everyone's name words """
+        return self.__completions
+
+    def events(self, place, first, last):
+        """ Return the people with an event in a place (or a place within it) during the
+        years first to last, in file order, as a list of (individual, events), where
+        events is a list of (event tag, day span, place as written) in date order
+        """
+        found = {}
+        for (position, tag, year, written, span) in self.__places.events(place, first, last):
+            found.setdefault(position, []).append((tag, span, written))
+        return [(self.__individuals[position], sorted(found[position], key=lambda event: event[1]))
+                for position in sorted(found)]
+
+    def select(self, criteria):
+        """ Return the individuals matching criteria, in file order
+
+        The criteria are as for Element.criteria_match().  Criteria that have an
+        index are looked up there, and only the people found are checked
+        against the rest of the criteria.
+        """
+        with metrics.timed('select_seconds'):
+            selected = self.__select(criteria)
+        metrics.count('matches_total', len(selected))
+        return selected
+
+    def __select(self, criteria):
+        items = criteria.split(':')
+        for item in items:
+            if item.count('=') != 1:
+                return []
+
+        positions = None
+        rest = []
+        for item in items:
+            key, value = item.split('=')
+            lookup = self.__lookups.get(key)
+            if lookup is None:
+                rest.append(item)
+            elif positions is None:
+                positions = lookup(value)
+            else:
+                positions = positions & lookup(value)
+
+        if positions is None:
+            candidates = self.__individuals
+        else:
+            candidates = [self.__individuals[position] for position in sorted(positions)]
+        if not rest:
+            return list(candidates)
+        metrics.count('elements_scanned_total', len(candidates))
+        rest = ':'.join(rest)
+        return [individual for individual in candidates if individual.criteria_match(rest)]
+
+
+class TreeLoading(Exception):
+    """ Raised when a tree is still being parsed after the caller stopped waiting """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def __str__(self):
+        return "Still parsing {}".format(self.filepath)
+
+
+class TreeTooLarge(Exception):
+    """ Raised when a tree would not fit in the cache's memory budget """
+
+    def __init__(self, filepath, size, budget):
+        self.filepath = filepath
+        self.size = size
+        self.budget = budget
+
+    def __str__(self):
+        return "{} needs about {} but the memory budget is {}".format(
+            self.filepath, memory.megabytes(self.size), memory.megabytes(self.budget))
+
+
+class ParseJob:
+    """ A parse running in the background, which any number of threads can wait on """
+
+    def __init__(self, filepath, stamp):
+        self.filepath = filepath
+        self.stamp = stamp
+        self.__done = threading.Event()
+        self.__tree = None
+        self.__error = None
+
+    def run(self, store=None):
+        """ Parse the file, remembering the tree or the error
+
+        The new tree is passed to store, if given, before anybody waiting is
+        woken, so they find it cached when they next ask.
+        """
+        try:
+            tree = Tree(self.filepath, self.stamp)
+            if store is not None:
+                store(tree)
+            self.__tree = tree
+        except Exception as e:
+            self.__error = e
+        self.__done.set()
+
+    def finish(self, tree):
+        """ Complete the job with a tree that was parsed elsewhere """
+        self.__tree = tree
+        self.__done.set()
+
+    def fail(self, error):
+        """ Complete the job with an error, without parsing """
+        self.__error = error
+        self.__done.set()
+
+    def error(self):
+        """ Return the error the parse failed with, or None """
+        return self.__error
+
+    def result(self, timeout=None):
+        """ Wait for the parse and return the tree, raising TreeLoading on timeout """
+        self.__done.wait(timeout)
+        if not self.__done.is_set():
+            raise TreeLoading(self.filepath)
+        if self.__error is not None:
+            raise self.__error
+        return self.__tree
+
+
+class TreeCache:
+    """ Parsed trees, keyed by absolute file path
+
+    A tree is reparsed on access when its file has changed since it was parsed.
+    With a budget (in bytes), trees are dropped, least recently used first, to
+    keep the estimated size of all the trees within it.
+    """
+
+    def __init__(self, threads=PARSE_THREADS, budget=None):
+        self.__trees = {}
+        # With a budget: filepath -> estimated bytes, and filepaths least recently used first
+        self.__budget = budget
+        self.__sizes = {}
+        self.__used = []
+        # Files too big for the budget: filepath -> (stamp, TreeTooLarge), so they aren't parsed again
+        self.__refused = {}
+        # Files that couldn't be parsed: filepath -> (stamp, error), so they aren't parsed again
+        # (by the upload watcher, say) until they change
+        self.__failed = {}
+        # In-progress parses: (filepath, stamp) -> ParseJob
+        self.__loading = {}
+        self.__lock = threading.Lock()
+        self.__threads = threads
+        self.__pool = None
+        self.__pool_pid = None
+
+    def get(self, filepath, timeout=None):
+        """ Return the Tree for a file, parsing it if it isn't cached or is stale
+
+        Waits at most timeout seconds (forever if None) for the parse, then
+        raises TreeLoading; the parse carries on in the background regardless.
+        Any error from parsing the file is raised here.
+        """
+        filepath = os.path.abspath(filepath)
+        stamp = file_stamp(filepath)
+        tree = self.__trees.get(filepath)
+        if tree is not None and tree.stamp() == stamp:
+            metrics.count('tree_cache_hits_total')
+            if self.__budget is not None:
+                self.__touch(filepath)
+            return tree
+        metrics.count('tree_cache_misses_total')
+        return self.load(filepath, stamp).result(timeout)
+
+    def load(self, filepath, stamp=None):
+        """ Start parsing a file in the background, unless it's already being parsed
+
+        Returns the ParseJob for the file, which is already finished if the
+        file was parsed in the meantime, or already failed with TreeTooLarge,
+        without parsing the file, if its tree wouldn't fit in the memory budget.
+        """
+        filepath = os.path.abspath(filepath)
+        if stamp is None:
+            stamp = file_stamp(filepath)
+        key = (filepath, stamp)
+        with self.__lock:
+            job = self.__loading.get(key)
+            if job is None:
+                job = ParseJob(filepath, stamp)
+                tree = self.__trees.get(filepath)
+                refused = self.__check_budget(filepath, stamp)
+                failed = self.__failed.get(filepath)
+                if tree is not None and tree.stamp() == stamp:
+                    job.finish(tree)
+                elif refused is not None:
+                    job.fail(refused)
+                elif failed is not None and failed[0] == stamp:
+                    job.fail(failed[1])
+                else:
+                    pool = self.__get_pool()
+                    self.__loading[key] = job
+                    pool.apply_async(self.__run, (job,))
+        return job
+
+    def __run(self, job):
+        """ Run a parse and cache the result.  Runs on a pool thread. """
+        try:
+            job.run(self.__store)
+        finally:
+            with self.__lock:
+                self.__loading.pop((job.filepath, job.stamp), None)
+                if job.error() is not None and not isinstance(job.error(), TreeTooLarge):
+                    # Too big is remembered in __refused, and tried again if the budget changes
+                    self.__failed[job.filepath] = (job.stamp, job.error())
+
+    def __store(self, tree):
+        """ Cache a newly parsed tree, making room for it in the budget if there is one """
+        filepath = tree.filepath()
+        if self.__budget is None:
+            with self.__lock:
+                self.__trees[filepath] = tree
+            return
+
+        # The file's size can be misleading (long notes, say), so the tree itself has the last word
+        size = memory.total(memory.account(tree, ESTIMATE_SAMPLE))
+        with self.__lock:
+            if size > self.__budget:
+                error = TreeTooLarge(filepath, size, self.__budget)
+                self.__refused[filepath] = (tree.stamp(), error)
+                raise error
+            self.__forget(filepath)
+            while self.__used and sum(self.__sizes.values()) + size > self.__budget:
+                evicted = self.__used[0]
+                print("Dropping {} from the cache to make room for {}".format(evicted, filepath))
+                self.__forget(evicted)
+            self.__trees[filepath] = tree
+            self.__sizes[filepath] = size
+            self.__used.append(filepath)
+
+    def __check_budget(self, filepath, stamp):
+        """ Return a TreeTooLarge if the tree of a file wouldn't fit in the budget, or None.  Call with the lock held. """
+        if self.__budget is None:
+            return None
+        refused = self.__refused.get(filepath)
+        if refused is not None and refused[0] == stamp:
+            return refused[1]
+        # What the cached trees take per byte of their files, once there are any
+        file_bytes = sum([self.__trees[cached].stamp()[1] for cached in self.__sizes])
+        if file_bytes:
+            per_byte = float(sum(self.__sizes.values())) / file_bytes
+        else:
+            per_byte = BYTES_PER_FILE_BYTE
+        size = int(stamp[1] * per_byte)
+        if size <= self.__budget:
+            return None
+        error = TreeTooLarge(filepath, size, self.__budget)
+        self.__refused[filepath] = (stamp, error)
+        return error
+
+    def __forget(self, filepath):
+        """ Drop a tree from the cache.  Call with the lock held. """
+        self.__trees.pop(filepath, None)
+        self.__sizes.pop(filepath, None)
+        if filepath in self.__used:
+            self.__used.remove(filepath)
+
+    def __touch(self, filepath):
+        """ Make a tree the most recently used """
+        with self.__lock:
+            if filepath in self.__used:
+                self.__used.remove(filepath)
+                self.__used.append(filepath)
+
+    def __get_pool(self):
+        """ Return the parsing thread pool, starting it if necessary
+
+        Threads don't survive a fork, so a forked worker process starts its own
+        pool (and forgets parses that were in progress in its parent).
+        """
+        if self.__pool is None or self.__pool_pid != os.getpid():
+            self.__pool = ThreadPool(self.__threads)
+            self.__pool_pid = os.getpid()
+            self.__loading = {}
+        return self.__pool
+
+    def preload(self, directory):
+        """ Parse every GED file in a directory, and forget files that are gone
+
+        Returns the list of trees that are now loaded from that directory.  A
+        file that can't be parsed is reported and skipped.
+        """
+        filepaths = [os.path.abspath(filepath) for filepath in ged_files(directory)]
+        directory = os.path.abspath(directory)
+        with self.__lock:
+            for filepath in self.__trees.keys():
+                if os.path.dirname(filepath) == directory and filepath not in filepaths:
+                    self.__forget(filepath)
+        trees = []
+        for filepath in filepaths:
+            try:
+                trees.append(self.get(filepath))
+            except (IOError, OSError, SyntaxError, TreeTooLarge) as e:
+                print("Skipping {}: {}".format(filepath, e))
+        return trees
+
+    def trees(self):
+        """ Return all of the cached trees """
+        with self.__lock:
+            return self.__trees.values()
+
+    def budget(self):
+        """ Return the memory budget in bytes, or None if there isn't one """
+        return self.__budget
+
+    def set_budget(self, budget):
+        """ Set the memory budget in bytes (None for no limit); it applies to trees parsed from now on """
+        with self.__lock:
+            self.__budget = budget
+            self.__refused = {}
@@ -0,0 +1,168 @@
+#
+# Upload folder watcher
+#
+# Keeps a manifest of the GED files in the upload folder (size, how many
+# people, whether they've been parsed yet) and starts parsing every new or
+# changed file as soon as it appears, so nobody has to wait for a cold parse
+# and the home page doesn't have to look at the disk to list the files.
+#
+# On Linux the folder is watched with inotify; anywhere else, or if inotify
+# can't be used, it is checked every few seconds instead.
+#
+
+import os
+import time
+import errno
+import select
+import threading
+import ctypes
+import ctypes.util
+from trees import ged_files, file_stamp, TreeLoading
+
+# How often, in seconds, the folder is checked without inotify, and how often
+# parses in progress are checked on with it
+POLL_INTERVAL = 2.0
+
+# inotify constants, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Only once a file has been written and closed (or moved in), so that a file
+# that is still being copied isn't parsed half way through
+WATCH_EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+# Manifest statuses
+PARSING = 'parsing'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class UploadWatcher:
+    """ The manifest of GED files in a folder, parsing them into a TreeCache as they arrive """
+
+    def __init__(self, directory, cache):
+        self.__directory = os.path.abspath(directory)
+        self.__cache = cache
+        # filepath -> manifest entry (a dict, see manifest())
+        self.__entries = {}
+        # filepath -> ParseJob, for the files still being parsed
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def manifest(self):
+        """ Return the GED files, sorted by name, each a dict with:
+            filepath     - absolute path of the file
+            name         - file name without the .ged
+            size         - in bytes
+            status       - PARSING, READY or FAILED
+            individuals  - how many people are in it, once parsed
+            error        - why it couldn't be parsed, if it failed
+        """
+        with self.__lock:
+            self.__check_jobs()
+            entries = [dict(entry) for entry in self.__entries.values()]
+        return sorted(entries, key=lambda entry: entry['name'].lower())
+
+    def scan(self):
+        """ Bring the manifest up to date with the folder, starting parses of new and changed files """
+        found = {}
+        for filepath in ged_files(self.__directory):
+            try:
+                found[os.path.abspath(filepath)] = file_stamp(filepath)
+            except OSError:
+                # Deleted while we looked
+                pass
+
+        with self.__lock:
+            for filepath in self.__entries.keys():
+                if filepath not in found:
+                    del self.__entries[filepath]
+                    self.__jobs.pop(filepath, None)
+
+            for (filepath, stamp) in found.items():
+                entry = self.__entries.get(filepath)
+                if entry is not None and entry['stamp'] == stamp:
+                    continue
+                self.__entries[filepath] = {
+                    'filepath': filepath,
+                    'name': os.path.splitext(os.path.basename(filepath))[0],
+                    'size': stamp[1],
+                    'stamp': stamp,
+                    'status': PARSING,
+                    'individuals': None,
+                    'error': None
+                }
+                self.__jobs[filepath] = self.__cache.load(filepath, stamp)
+
+            self.__check_jobs()
+
+    def start(self):
+        """ Scan now, then keep watching the folder on a background thread """
+        if self.__thread is not None:
+            return
+        self.scan()
+        self.__thread = threading.Thread(target=self.__watch, name="upload watcher")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __check_jobs(self):
+        """ Record the results of the parses that have finished.  Call with the lock held. """
+        for (filepath, job) in self.__jobs.items():
+            entry = self.__entries[filepath]
+            try:
+                tree = job.result(0)
+            except TreeLoading:
+                continue
+            except Exception as e:
+                entry['status'] = FAILED
+                entry['error'] = str(e)
+            else:
+                entry['status'] = READY
+                entry['individuals'] = len(tree.individuals())
+            del self.__jobs[filepath]
+
+    def __watch(self):
+        """ Body of the watcher thread """
+        fd = _inotify(self.__directory)
+        while True:
+            changed = True
+            if fd is None:
+                time.sleep(POLL_INTERVAL)
+            else:
+                try:
+                    changed = bool(select.select([fd], [], [], POLL_INTERVAL)[0])
+                    if changed:
+                        # The events themselves don't matter, just that there were some
+                        os.read(fd, 64 * 1024)
+                except (select.error, OSError) as e:
+                    if e.args[0] not in (errno.EINTR, errno.EAGAIN):
+                        raise
+            try:
+                if changed:
+                    self.scan()
+                else:
+                    with self.__lock:
+                        self.__check_jobs()
+            except Exception as e:
+                print("Upload watcher: {}".format(e))
+
+
+def _inotify(directory):
+    """ Return an inotify file descriptor watching directory, or None if inotify isn't available """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, directory.encode('utf-8') if not isinstance(directory, bytes) else directory,
+                              WATCH_EVENTS) < 0:
+        os.close(fd)
+        return None
+    return fd